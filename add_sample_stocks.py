@@ -197,19 +197,11 @@ def add_sample_stocks():
     american_count = 0  # מונה מניות אמריקאיות
     israeli_count = 0  # מונה מניות ישראליות
     
-    for stock in sample_stocks:  # עבור על כל מניה ברשימה
+    # הוסף את כל המניות למסד הנתונים בטרנזקציה אחת
+    results = portfolio_model.add_securities_many(sample_stocks)
+    
+    for stock, result in zip(sample_stocks, results):  # עבור על כל מניה ברשימה
         try:
-            # הוסף את המניה למסד הנתונים
-            result = portfolio_model.add_security(
-                stock['name'],  # שם החברה
-                stock['symbol'],  # סמל המניה
-                stock['amount'],  # כמות
-                stock['price'],  # מחיר
-                stock['industry'],  # ענף
-                stock['variance'],  # סיכון
-                stock['security_type']  # סוג נייר ערך
-            )
-            
             if result:  # אם ההוספה הצליחה
                 # זיהוי מניות ישראליות לפי סמל
                 israeli_symbols = ['CHKP', 'TEVA', 'NICE', 'CYBR', 'FVRR', 'WIX', 'MNDY']
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+advicestore.py - מאגר ייעוצי AI שנשמר על הדיסק
+
+כל ייעוץ נשמר לפי (טביעת התיק, פרופיל סיכון, שם המודל, גרסת ה-prompt):
+תיק שלא השתנה מקבל מיד את הייעוץ שכבר חושב, גם אחרי הפעלה מחדש של השרת
+ובכל ה-workers (הקובץ משותף). המאגר מוגבל במספר ייעוצים ובבתים, והייעוץ
+שלא נקרא הכי הרבה זמן נמחק ראשון (LRU).
+"""
+
+import hashlib  # מפתח קצר לכל צירוף
+import os  # לעבודה עם משתני סביבה
+import sqlite3  # המאגר על הדיסק
+import threading  # נעילה לחיבור המשותף
+import time  # זמני יצירה ושימוש
+
+# הגדרות המאגר - ניתן לשנות דרך משתני סביבה
+ADVICE_STORE_PATH = os.environ.get('ADVICE_STORE_PATH', 'advice_store.db')
+ADVICE_STORE_MAX_ENTRIES = int(os.environ.get('ADVICE_STORE_MAX_ENTRIES', 200))  # ייעוצים לכל היותר
+ADVICE_STORE_MAX_BYTES = int(os.environ.get('ADVICE_STORE_MAX_BYTES', 5 * 1024 * 1024))  # בתים לכל היותר
+ADVICE_STORE_MAX_AGE = float(os.environ.get('ADVICE_STORE_MAX_AGE', 7 * 86400))  # שניות עד שייעוץ נחשב ישן
+
+
+def advice_key(fingerprint, risk_profile, model_name, prompt_version):
+    """המפתח של ייעוץ - כל שינוי באחד הרכיבים הוא ייעוץ אחר"""
+    raw = f"{fingerprint}|{risk_profile}|{model_name}|{prompt_version}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class AdviceStore:
+    """ייעוצים לפי מפתח, על הדיסק, עם פינוי LRU לפי מספר ובתים"""
+
+    def __init__(self, path=ADVICE_STORE_PATH, max_entries=ADVICE_STORE_MAX_ENTRIES,
+                 max_bytes=ADVICE_STORE_MAX_BYTES, max_age=ADVICE_STORE_MAX_AGE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()  # חיבור אחד לכל התהליכונים - קריאות קצרות
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # כמה workers קוראים במקביל
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS advice_entries (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                risk_profile TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                advice TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_advice_last_used ON advice_entries (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        """הייעוץ השמור, או None אם אין או שהוא ישן מ-max_age"""
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT advice FROM advice_entries WHERE key = ? AND created_at > ?",
+                    (key, now - self.max_age)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE advice_entries SET last_used = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+        except Exception as e:
+            print(f"❌ שגיאה בקריאה ממאגר הייעוצים: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, advice, fingerprint, risk_profile, model_name, prompt_version):
+        """שמירת ייעוץ ופינוי הישנים ביותר עד שהמאגר בגבולות"""
+        now = time.time()
+        size = len(advice.encode('utf-8'))
+        try:
+            with self._lock:
+                self._conn.execute("""
+                    INSERT OR REPLACE INTO advice_entries
+                        (key, fingerprint, risk_profile, model_name, prompt_version, advice, size,
+                         created_at, last_used)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (key, fingerprint, risk_profile, model_name, str(prompt_version), advice, size, now, now))
+                self._evict()
+                self._conn.commit()
+        except Exception as e:
+            self._conn.rollback()
+            print(f"❌ שגיאה בשמירה במאגר הייעוצים: {e}")
+
+    def _evict(self):
+        """מחיקת ייעוצים ישנים, ואז הפחות שימושיים עד שהמאגר בגבולות - בתוך הנעילה"""
+        cursor = self._conn.execute("DELETE FROM advice_entries WHERE created_at <= ?",
+                                    (time.time() - self.max_age,))
+        self.evictions += cursor.rowcount
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM advice_entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # מהפחות שימושי - עד שגם המספר וגם הבתים בגבולות (הייעוץ האחרון נשאר תמיד)
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM advice_entries ORDER BY last_used, key"):
+            if count <= 1 or (count <= self.max_entries and total <= self.max_bytes):
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM advice_entries WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def delete(self, key):
+        """מחיקת ייעוץ אחד - לרענון ייעוץ בלי לאבד את השאר"""
+        with self._lock:
+            self._conn.execute("DELETE FROM advice_entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def get_stats(self):
+        """מידע לתצוגה - אחוז פגיעות, מספר ייעוצים ובתים"""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM advice_entries"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'path': self.path,
+            'entries': count,
+            'bytes': total,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+        }
@@ -13,6 +13,9 @@ import logging
 import os
 import sys
 import io
+import hashlib
+import itertools
+import threading
 # ייבוא ספרייה ליצירת גרפים
 import matplotlib
 matplotlib.use('Agg')  # הגדרת backend לשרת (ללא GUI)
@@ -20,12 +23,18 @@ import matplotlib.pyplot as plt
 
 # ייבוא מודלים מקומיים - מסד נתונים ובינה מלאכותית
 try:
-    from dbmodel import PortfolioModel, Broker  # מסד נתונים ומחירי מניות
+    from dbmodel import PortfolioModel, Broker, INDUSTRY_RISK_LEVELS, DEFAULT_RISK_LEVEL  # מסד נתונים ומחירי מניות
     print("ייבוא dbmodel הצליח")
 except Exception as e:
     print(f" שגיאה בייבוא dbmodel: {str(e)}")
     sys.exit(1)  # יציאה מהתוכנית בשל שגיאה קריטית
 
+from pricerefresher import PriceRefresher, PRICE_REFRESHER_ENABLED  # עדכון מחירים מקבילי וברקע
+from fxrates import FX_BASE_CURRENCY, fx_rates  # שערי מטבע - המחירים מומרים לשקלים בזמן קריאה
+from marketcalendar import EXCHANGES  # שעות מסחר
+from cachebackend import create_cache, CACHE_VERSION_CHECK_INTERVAL  # cache משותף לכל ה-workers
+from advicestore import AdviceStore, advice_key  # ייעוצי AI שמורים על הדיסק
+
 try:
     from ollamamodel import AI_Agent  # מודל הבינה המלאכותית לייעוץ השקעות
     print(" ייבוא Ollama הצליח")
@@ -69,47 +78,118 @@ def nl2br_filter(text):
 # רישום הפילטר במנוע התבניות
 app.jinja_env.filters['nl2br'] = nl2br_filter
 
-# מערכת Cache פשוטה לשיפור ביצועים
+# cache משותף לכל ה-workers - memory / sqlite / redis לפי CACHE_BACKEND
+shared_cache = create_cache()
+portfolio_generations = itertools.count(1)  # מספור אותות השינוי
+
+# מערכת Cache לנתוני התיק - תקף כל עוד גרסת הנתונים במסד לא השתנתה
 portfolio_cache = {
     'data': None,  # נתוני התיק
+    'version': None,  # גרסת הנתונים וגרסת שערי המטבע שמהן נטען ה-cache
     'last_update': None,  # זמן עדכון אחרון
-    'cache_duration': 30  # תוקף ה-cache בשניות
+    'generation': 0,  # מתחלף בכל אות שינוי - מכתיבה בתהליך הזה או ב-worker אחר
+    'checked_generation': None,  # הדור שבו העותק נבדק מול גרסת המסד
+    'checked_at': None,  # מתי העותק נבדק לאחרונה מול גרסת המסד
+    'cache_duration': 30  # תוקף ה-cache בשניות - רק כשאין גרסה (שגיאת מסד)
 }
 
+def invalidate_portfolio_cache():
+    """אות שינוי - העותק המקומי ייבדק מול גרסת המסד בקריאה הבאה"""
+    portfolio_cache['generation'] = next(portfolio_generations)
+
+def portfolio_fingerprint(version=None):
+    """טביעת התיק - גרסת הנתונים במסד (עולה בכל כתיבה) ושערי המטבע, בלי לטעון שורות
+    
+    המפתח של התיק ב-cache המשותף ושל הייעוץ במאגר. הטביעה לפי השערים עצמם -
+    כל worker מושך את טבלת השערים בנפרד. None אם אין גרסה (שגיאת מסד).
+    """
+    if version is None:
+        version = portfolio_model.get_data_version()
+    if version is None:
+        return None
+    fx_key = hashlib.md5(repr(sorted(fx_rates.get_rates().items())).encode()).hexdigest()[:12]
+    return f"v{version}:fx{fx_key}"
+
 def get_cached_portfolio():
-    """מחזיר נתוני תיק מה-cache או טוען מחדש מהמסד"""
+    """מחזיר נתוני תיק מה-cache או טוען מחדש מהמסד
+    
+    כל כתיבה (הוספה, מחיקה, עדכון מחיר) מעלה את גרסת הנתונים ושולחת אות
+    שינוי לכל התהליכים. כל עוד לא הגיע אות, העותק המקומי מוחזר בלי לגשת
+    למסד - אבל לכל היותר CACHE_VERSION_CHECK_INTERVAL שניות מהבדיקה האחרונה,
+    כך שאות שאבד מעכב שינוי רק עד הבדיקה הבאה. הגרסה נבדקת בשאילתה קטנה אחת,
+    והתיק של גרסה חדשה נלקח מה-cache המשותף - רק ה-worker הראשון טוען אותו
+    מהמסד. שינוי בשערי המטבע מבטל אותו גם כן - המחירים מומרים לשקלים בטעינה.
+    """
     import time
     
     current_time = time.time()  # זמן נוכחי
+    generation = portfolio_cache['generation']  # נקרא לפני הבדיקה - אות באמצע יגרום לבדיקה הבאה
+    fx_version = fx_rates.get_version()
+    
+    # אין אות שינוי מאז הבדיקה האחרונה והיא טרייה - בלי שאילתה למסד (רק אם ההאזנה לאותות פעילה)
+    if (portfolio_cache['data'] is not None and portfolio_cache['version'] is not None
+            and portfolio_cache['checked_generation'] == generation
+            and portfolio_cache['version'][1] == fx_version
+            and current_time - portfolio_cache['checked_at'] < CACHE_VERSION_CHECK_INTERVAL
+            and portfolio_model.change_signal.connected):
+        return portfolio_cache['data']
+    
+    version = portfolio_model.get_data_version()  # נקרא לפני הטעינה - כתיבה באמצע תגרום לטעינה הבאה
+    if version is not None:
+        version = (version, fx_version)
     
     # בדיקה אם הcache תקף או שצריך לרענן
-    if (portfolio_cache['data'] is None or 
-        portfolio_cache['last_update'] is None or 
-        current_time - portfolio_cache['last_update'] > portfolio_cache['cache_duration']):
-        
-        try:
-            # טעינת נתונים טריים מהמסד
-            portfolio_cache['data'] = portfolio_model.get_all_securities()
-            portfolio_cache['last_update'] = current_time
-            print(f"נתוני תיק נטענו מחדש - {len(portfolio_cache['data'])} ניירות ערך")
-        except Exception as e:
-            print(f"שגיאה בטעינת נתוני תיק: {str(e)}")
-            # שימוש ב-cache ישן אם יש שגיאה
-            if portfolio_cache['data'] is not None:
-                print("משתמש בנתונים מהקיים")
-            else:
-                portfolio_cache['data'] = []
+    if portfolio_cache['data'] is not None and portfolio_cache['last_update'] is not None:
+        if version is not None and version == portfolio_cache['version']:
+            portfolio_cache['checked_generation'] = generation
+            portfolio_cache['checked_at'] = current_time
+            return portfolio_cache['data']
+        if version is None and current_time - portfolio_cache['last_update'] <= portfolio_cache['cache_duration']:
+            return portfolio_cache['data']
+    
+    try:
+        # התיק של הגרסה הזו מה-cache המשותף, ואם אין - טעינת נתונים טריים מהמסד
+        data = None
+        if version is not None:
+            shared_key = f"portfolio:{portfolio_fingerprint(version[0])}"
+            data = shared_cache.get(shared_key)
+        if data is None:
+            data = portfolio_model.get_all_securities()
+            if version is not None and data:
+                shared_cache.set(shared_key, data)
+            print(f"נתוני תיק נטענו מחדש - {len(data)} ניירות ערך (גרסה {version})")
+        portfolio_cache['data'] = data
+        portfolio_cache['version'] = version
+        portfolio_cache['last_update'] = current_time
+        portfolio_cache['checked_generation'] = generation
+        portfolio_cache['checked_at'] = current_time
+    except Exception as e:
+        print(f"שגיאה בטעינת נתוני תיק: {str(e)}")
+        # שימוש ב-cache ישן אם יש שגיאה
+        if portfolio_cache['data'] is not None:
+            print("משתמש בנתונים מהקיים")
+        else:
+            portfolio_cache['data'] = []
     
     return portfolio_cache['data']
 
 def clear_portfolio_cache():
     """מנקה את הcache לאחר עדכון נתונים"""
     portfolio_cache['data'] = None
+    portfolio_cache['version'] = None
     portfolio_cache['last_update'] = None
+    portfolio_cache['checked_generation'] = None
+    portfolio_cache['checked_at'] = None
     print("קיים תיק נוקה")
 
+def portfolio_etag():
+    """ETag לתגובות שנגזרות מכל התיק - לפי גרסת הנתונים ושערי המטבע; None אם אין גרסה"""
+    version = portfolio_model.get_data_version()
+    return f"portfolio-v{version}-fx{fx_rates.get_version()}" if version is not None else None
+
 # קבועים גלובליים
-CONVERSION_RATE = 3.5  # שער המרה מדולר לשקל
+GRAPH_TOP_HOLDINGS = 20  # החזקות בגרף העוגה - השאר מקובצות ל"אחרים"
+RISK_TOP_HOLDINGS = 50  # החזקות בטבלת דף הסיכונים
 
 # מחלקת User למערכת ההזדהות
 class User(UserMixin):
@@ -159,6 +239,12 @@ def admin_required(f):
 # יצירת מופעי המודלים הראשיים
 try:
     portfolio_model = PortfolioModel()  # מסד הנתונים
+    portfolio_model.change_signal.subscribe(invalidate_portfolio_cache)  # כתיבות מכל ה-workers
+    Broker.add_price_listener(portfolio_model.record_price)  # כל מחיר מה-API נשמר בהיסטוריה
+    price_refresher = PriceRefresher(portfolio_model)  # עדכון מחירים מקבילי לכל התיק
+    # עדכון ברקע - לא בתהליך האב של ה-reloader של Flask (שם השרת לא רץ)
+    if PRICE_REFRESHER_ENABLED and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        price_refresher.start()
     print("PortfolioModel נוצר בהצלחה")
 except Exception as e:
     print(f"שגיאה ביצירת PortfolioModel: {str(e)}")
@@ -457,32 +543,27 @@ def index():
     """דף הבית - מציג סיכום התיק או מפנה להתחברות"""
     if current_user.is_authenticated:  # אם המשתמש מחובר
         try:
-            # טעינה מהירה של נתוני התיק מה-cache
-            portfolio_data = portfolio_model.get_all_securities()
+            # סך הכל ו-5 ההחזקות הגדולות מחושבים במסד - בלי לטעון את כל התיק
+            summary = portfolio_model.get_portfolio_summary(top_n=5)
+            
+            # התחלת טעינת ייעוץ AI ברקע לשיפור ביצועים - התיק נטען רק אם אין ייעוץ
+            start_background_ai_advice()
             
-            # התחלת טעינת ייעוץ AI ברקע לשיפור ביצועים
-            start_background_ai_advice(portfolio_data)
+            total_assets = summary['total_value']
+            asset_count = summary['count']
             
             # אם יש הרבה ניירות ערך, הצג רק סיכום
-            if len(portfolio_data) > 10:
-                total_assets = sum(security['price'] * security['amount'] for security in portfolio_data)
-                asset_count = len(portfolio_data)
-                
+            if asset_count > 10:
                 # הצג רק 5 המניות היקרות ביותר לדמו
-                top_securities = sorted(portfolio_data, key=lambda x: x['price'] * x['amount'], reverse=True)[:5]
-                
                 return render_template('index.html', 
-                                     portfolio=top_securities, 
+                                     portfolio=summary['top_holdings'], 
                                      total_value=total_assets,
                                      asset_count=asset_count,
                                      show_summary=True)
             else:
                 # אם יש מעט ניירות ערך, הצג הכל
-                total_assets = sum(security['price'] * security['amount'] for security in portfolio_data)
-                asset_count = len(portfolio_data)
-                
                 return render_template('index.html', 
-                                     portfolio=portfolio_data, 
+                                     portfolio=portfolio_model.get_all_securities(), 
                                      total_value=total_assets,
                                      asset_count=asset_count,
                                      show_summary=False)
@@ -501,31 +582,30 @@ def portfolio():
         # פגינציה - חלוקה לעמודים
         page = request.args.get('page', 1, type=int)  # מספר עמוד נוכחי
         per_page = 20  # מספר ניירות ערך בכל עמוד
-        
-        portfolio_data = portfolio_model.get_all_securities()
-        
-        # התחלת טעינת ייעוץ AI ברקע
-        start_background_ai_advice(portfolio_data)
+        sort = request.args.get('sort', 'name')  # שדה מיון
+        if sort not in ('name', 'value', 'industry'):
+            sort = 'name'
+        order = 'desc' if request.args.get('order') == 'desc' else 'asc'  # כיוון מיון
+        # סמן מהעמוד הקודם - דפדוף "הבא" בלי OFFSET
+        page_cursor = portfolio_model.decode_cursor(request.args.get('cursor'))
+        
+        # רק העמוד המבוקש נטען מהמסד - לא כל התיק
+        page_data = portfolio_model.get_securities_page(
+            page=page, per_page=per_page, sort=sort,
+            descending=(order == 'desc'), after=page_cursor
+        )
+        
+        # התחלת טעינת ייעוץ AI ברקע - התיק נטען רק אם אין ייעוץ
+        start_background_ai_advice()
         
         # חישוב נתונים כלליים
-        total_securities = len(portfolio_data)
-        total_value = sum(security['price'] * security['amount'] for security in portfolio_data)
-        
-        # חלוקה לעמודים
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        paginated_data = portfolio_data[start_idx:end_idx]
-        
-        # הוספת חישובי סיכון לכל נייר ערך
-        risk_levels = {
-            'טכנולוגיה': 6, 'תחבורה': 5, 'אנרגיה': 4,
-            'בריאות': 4, 'תעשייה': 3, 'פיננסים': 3,
-            'נדלן': 2, 'צריכה פרטית': 1
-        }
+        total_securities = page_data['total']
+        total_value = page_data['total_value']
+        paginated_data = page_data['items']
         
+        # הוספת חישובי סיכון לכל נייר ערך בעמוד
         for security in paginated_data:
-            security['value'] = security['price'] * security['amount']
-            security['risk_level'] = risk_levels.get(security.get('industry', ''), 3)
+            security['risk_level'] = INDUSTRY_RISK_LEVELS.get(security.get('industry', ''), DEFAULT_RISK_LEVEL)
             
             if total_value > 0:
                 security['percentage'] = (security['value'] / total_value) * 100
@@ -533,7 +613,7 @@ def portfolio():
                 security['percentage'] = 0
         
         # מידע על פגינציה
-        total_pages = (total_securities + per_page - 1) // per_page
+        total_pages = page_data['total_pages']
         has_prev = page > 1
         has_next = page < total_pages
         
@@ -544,7 +624,10 @@ def portfolio():
                              total_pages=total_pages,
                              has_prev=has_prev,
                              has_next=has_next,
-                             total_securities=total_securities)
+                             total_securities=total_securities,
+                             sort=sort,
+                             order=order,
+                             next_cursor=portfolio_model.encode_cursor(page_data['next_cursor']))
     except Exception as e:
         flash(f'שגיאה בטעינת תיק ההשקעות: {str(e)}', 'danger')
         return redirect(url_for('index'))
@@ -559,6 +642,7 @@ def add_security():
         symbol = None
         stock_name = form.name.data
         default_price = 350.0
+        price_currency = FX_BASE_CURRENCY  # מחיר ברירת המחדל בשקלים
         
         # אם נבחרה מניה מהרשימה
         if form.stock_dropdown.data and form.stock_dropdown.data != '':
@@ -566,13 +650,16 @@ def add_security():
             symbol_to_name = dict([(choice[0], choice[1]) for choice in AddSecurityForm.sp500_stocks if choice[0]])
             stock_name = symbol_to_name.get(symbol, symbol)
             
-            # נסה לקבל מחיר אמיתי מה-API
+            # נסה לקבל מחיר אמיתי מה-API - כשהעדכון ברקע פעיל רק מה-cache, בלי להמתין ל-API
             try:
-                # שימוש בפונקציה הסטטית update_price במקום get_stock_price
-                real_price = Broker.update_price(symbol)
+                if price_refresher.is_running():
+                    real_price = Broker.quote_cache.get(symbol)
+                else:
+                    real_price = Broker.update_price(symbol)
                 if real_price is not None:
-                    default_price = real_price  # הפונקציה כבר מחזירה במטבע מקומי
-                    print(f"קיבלתי מחיר אמיתי עבור {symbol}: ₪{real_price:.2f}")
+                    default_price = real_price  # במטבע המסחר של הסמל - יומר לשקלים בתצוגה
+                    price_currency = Broker.currency(symbol)
+                    print(f"קיבלתי מחיר אמיתי עבור {symbol}: {real_price:.2f} {price_currency}")
                 else:
                     default_price = 350.0  # מחיר ברירת מחדל
                     print(f"לא הצלחתי לקבל מחיר אמיתי עבור {symbol}, משתמש במחיר ברירת מחדל")
@@ -582,11 +669,14 @@ def add_security():
         
         try:
             result = portfolio_model.add_security(
-                stock_name, symbol if symbol else stock_name, form.amount.data, default_price, 
-                form.industry.data, form.variance.data, form.security_type.data
+                stock_name, symbol, form.amount.data, default_price,  # בלי בחירה מהרשימה - בלי סמל
+                form.industry.data, form.variance.data, form.security_type.data, currency=price_currency
             )
             if result:
-                flash(f'נוסף בהצלחה: {stock_name} ({symbol if symbol else "ללא סמל"}) - מחיר: ₪{default_price:.2f}', 'success')
+                if price_refresher.is_running():
+                    price_refresher.wake()  # נייר ערך חדש בלי זמן עדכון - יתומחר ראשון
+                display_price = fx_rates.convert(default_price, price_currency) or default_price
+                flash(f'נוסף בהצלחה: {stock_name} ({symbol if symbol else "ללא סמל"}) - מחיר: ₪{display_price:.2f}', 'success')
                 return redirect(url_for('portfolio'))
             else:
                 flash('שגיאה בהוספת נייר הערך', 'danger')
@@ -606,16 +696,38 @@ def delete_security(security_name):
         flash(f'שגיאה במחיקת נייר הערך: {str(e)}', 'danger')
     return redirect(url_for('portfolio'))
 
+@app.route('/portfolio/delete-id/<int:security_id>', methods=['POST'])
+@login_required
+@admin_required
+def delete_security_by_id(security_id):
+    """מחיקת נייר ערך לפי מזהה - לא תלוי בשם התצוגה"""
+    try:
+        if portfolio_model.remove_security_by_id(security_id):
+            flash('נייר הערך נמחק בהצלחה!', 'success')
+        else:
+            flash('נייר הערך לא נמצא', 'warning')
+    except Exception as e:
+        flash(f'שגיאה במחיקת נייר הערך: {str(e)}', 'danger')
+    return redirect(url_for('portfolio'))
+
 @app.route('/update-price/<symbol>')
 @login_required
 @admin_required
 def update_single_price(symbol):
+    if price_refresher.is_running():  # העדכון ברקע ייקח את הסמל ראשון - בלי להמתין ל-API כאן
+        portfolio_model.mark_prices_stale(symbol)
+        price_refresher.wake()
+        flash(f'מחיר {symbol} יתעדכן ברקע בשניות הקרובות', 'info')
+        return redirect(url_for('portfolio'))
+    
     try:
         new_price = Broker.update_price(symbol)
         
         if new_price is not None:
-            portfolio_model.update_security_price(symbol, new_price)
-            flash(f'מחיר {symbol} עודכן בהצלחה ל-{new_price:.2f} ₪', 'success')
+            currency = Broker.currency(symbol)
+            portfolio_model.update_security_price_by_symbol(symbol, new_price, currency=currency)
+            display_price = fx_rates.convert(new_price, currency) or new_price
+            flash(f'מחיר {symbol} עודכן בהצלחה ל-{display_price:.2f} ₪', 'success')
         else:
             flash(f'לא ניתן לקבל מחיר עדכני עבור {symbol}', 'warning')
     except Exception as e:
@@ -627,53 +739,70 @@ def update_single_price(symbol):
 @login_required
 @admin_required
 def update_all_prices():
+    """עדכון מחירי כל התיק במקביל - format=json מחזיר את הדוח המלא לכל סמל"""
+    if price_refresher.is_running():  # העדכון ברקע יעבור על כל התיק, הגדולים קודם
+        portfolio_model.mark_prices_stale()
+        price_refresher.wake()
+        if request.args.get('format') == 'json':
+            return jsonify({'success': True, 'scheduled': True, 'last_report': price_refresher.last_report})
+        flash('המחירים יתעדכנו ברקע - ההחזקות הגדולות קודם', 'info')
+        return redirect(url_for('portfolio'))
+    
     try:
-        securities = portfolio_model.get_all_securities()
-        if not securities:
-            flash('אין ניירות ערך בתיק לעדכון', 'warning')
-            return redirect(url_for('portfolio'))
-        
-        updated_count = 0
-        total_count = len(securities)
+        report = price_refresher.refresh_all()
+        if request.args.get('format') == 'json':
+            return jsonify(report)
         
-        for security in securities:
-            try:
-                symbol = security['name']
-                new_price = Broker.update_price(symbol)
-                
-                if new_price is not None:
-                    portfolio_model.update_security_price(symbol, new_price)
-                    updated_count += 1
-            except Exception as e:
-                print(f"שגיאה בעדכון {symbol}: {str(e)}")
-        
-        if updated_count > 0:
-            flash(f'עודכנו {updated_count} מתוך {total_count} ניירות ערך בהצלחה', 'success')
-        else:
+        if report['total'] == 0:
+            flash('אין ניירות ערך בתיק לעדכון', 'warning')
+        elif report['updated'] > 0:
+            flash(f"עודכנו {report['updated']} מתוך {report['total']} ניירות ערך בהצלחה "
+                  f"({report['duration']:.1f} שניות)", 'success')
+            failed_names = [result['name'] for result in report['results']
+                            if result['status'] not in ('updated', 'no_symbol', 'market_closed')]
+            if failed_names:
+                flash(f"לא עודכנו: {', '.join(failed_names[:10])}", 'warning')
+        elif not report['market_closed']:
             flash('לא ניתן היה לעדכן אף מחיר', 'warning')
+        if report['market_closed']:
+            flash(f"הבורסה סגורה - {report['market_closed']} ניירות ערך כבר עם מחיר הסגירה "
+                  f"({report['calls_avoided']} בקשות נחסכו)", 'info')
+        if report['skipped']:
+            skipped_names = [result['name'] for result in report['results'] if result['status'] == 'no_symbol']
+            flash(f"בלי סמל מסחר - לא נשלחה בקשת מחיר: {', '.join(skipped_names[:10])}", 'info')
     except Exception as e:
+        if request.args.get('format') == 'json':
+            return jsonify({'success': False, 'message': str(e)}), 500
         flash(f'שגיאה בעדכון המחירים: {str(e)}', 'danger')
     
     return redirect(url_for('portfolio'))
 
+@app.route('/price-history/<symbol>')
+@login_required
+def price_history(symbol):
+    """היסטוריית מחירים של סמל כ-JSON - resolution: raw / 1m / 1d, start/end בשניות epoch"""
+    resolution = request.args.get('resolution', '1d')
+    if resolution not in ('raw', '1m', '1d'):
+        return jsonify({'success': False, 'message': f'רזולוציה לא נתמכת: {resolution}'}), 400
+    
+    history = portfolio_model.get_price_history(
+        symbol,
+        start=request.args.get('start', type=int),
+        end=request.args.get('end', type=int),
+        resolution=resolution
+    )
+    return jsonify({'success': True, 'symbol': symbol, 'resolution': resolution, 'data': history})
+
 @app.route('/graph')
 @login_required
 def graph():
     try:
-        portfolio_data = get_cached_portfolio()
-        
-        total_value = 0
-        for security in portfolio_data:
-            security['value'] = security['price'] * security['amount']
-            total_value += security['value']
-        
-        for security in portfolio_data:
-            if total_value > 0:
-                security['percentage'] = (security['value'] / total_value) * 100
-            else:
-                security['percentage'] = 0
+        # ההחזקות הגדולות עם שווי ואחוז - מחושבים במסד
+        summary = portfolio_model.get_portfolio_summary(top_n=GRAPH_TOP_HOLDINGS)
         
-        return render_template('graph.html', portfolio=portfolio_data, total_value=total_value)
+        return render_template('graph.html', portfolio=summary['top_holdings'],
+                               total_value=summary['total_value'],
+                               asset_count=summary['count'])
     except Exception as e:
         flash(f'שגיאה בטעינת גרפים: {str(e)}', 'danger')
         return redirect(url_for('index'))
@@ -681,8 +810,15 @@ def graph():
 @app.route('/pie-chart.png')
 @login_required
 def generate_pie_chart():
+    etag = portfolio_etag()
+    if etag and etag in request.if_none_match:  # הדפדפן כבר מחזיק את הגרף העדכני
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    
     try:
-        portfolio_data = get_cached_portfolio()
+        summary = portfolio_model.get_portfolio_summary(top_n=GRAPH_TOP_HOLDINGS)
+        portfolio_data = summary['top_holdings']
+        # שאר התיק מעבר להחזקות הגדולות - פרוסה אחת "אחרים"
+        others_value = summary['total_value'] - sum(float(item['value']) for item in portfolio_data)
         
         # הגדרת פונט שתומך בעברית
         plt.rcParams['font.family'] = ['Arial Unicode MS', 'Tahoma', 'Arial Hebrew', 'Arial']
@@ -721,7 +857,12 @@ def generate_pie_chart():
                 else:
                     labels.append(label_text)
             
-            sizes = [item['price'] * item['amount'] for item in portfolio_data]
+            sizes = [float(item['value']) for item in portfolio_data]
+            
+            if others_value > 0.005:  # יש ניירות ערך מעבר להחזקות הגדולות
+                others_label = 'אחרים'
+                labels.append(get_display(others_label) if use_bidi else others_label)
+                sizes.append(others_value)
             
             # צבעים יפים ומגוונים לגרף עוגה - כל חברה בצבע שונה
             beautiful_colors = [
@@ -785,7 +926,11 @@ def generate_pie_chart():
         img.seek(0)
         plt.close()
         
-        return Response(img.getvalue(), mimetype='image/png')
+        response = Response(img.getvalue(), mimetype='image/png')
+        if etag:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'  # תמיד לאמת מול השרת
+        return response
     except Exception as e:
         fig, ax = plt.subplots(figsize=(8, 6))
         ax.text(0.5, 0.5, f'שגיאה: {str(e)}', ha='center', va='center',
@@ -796,53 +941,40 @@ def generate_pie_chart():
         plt.close()
         return Response(img.getvalue(), mimetype='image/png')
 
-# Cache עבור ייעוץ AI
-advice_cache = {
-    'advice': None,
-    'timestamp': 0,
-    'portfolio_hash': None
-}
+# מאגר ייעוצי AI - לפי טביעת התיק, פרופיל סיכון, מודל וגרסת prompt; נשמר על הדיסק
+advice_store = AdviceStore()
 
-def get_portfolio_hash(portfolio_data):
-    """יוצר hash של נתוני התיק לבדיקת שינויים"""
-    if not portfolio_data:
-        return "empty"
-    
-    # יצירת מחרוזת ייחודית מנתוני התיק
-    portfolio_str = ""
-    for security in sorted(portfolio_data, key=lambda x: x['name']):
-        portfolio_str += f"{security['name']}_{security['amount']}_{security['price']}_"
-    
-    import hashlib
-    return hashlib.md5(portfolio_str.encode()).hexdigest()
-
-def get_cached_advice(portfolio_data):
-    """מחזיר ייעוץ מ-cache אם זמין ורלוונטי"""
-    import time
-    
-    current_time = time.time()
-    cache_duration = 1800  # 30 דקות
-    
-    # בדיקה אם יש cache תקף
-    if advice_cache['advice'] and advice_cache['timestamp']:
-        time_diff = current_time - advice_cache['timestamp']
-        current_hash = get_portfolio_hash(portfolio_data)
-        
-        # אם התיק לא השתנה והזמן לא פג
-        if (time_diff < cache_duration and 
-            advice_cache['portfolio_hash'] == current_hash):
-            print("מחזיר ייעוץ מ-cache")
-            return advice_cache['advice']
-    
-    return None
-
-def update_advice_cache(advice, portfolio_data):
-    """מעדכן את cache הייעוץ"""
-    import time
-    
-    advice_cache['advice'] = advice
-    advice_cache['timestamp'] = time.time()
-    advice_cache['portfolio_hash'] = get_portfolio_hash(portfolio_data)
+def get_advice_key(fingerprint):
+    """המפתח של ייעוץ לתיק - מחזיר (מפתח, (טביעת התיק, פרופיל סיכון, מודל, גרסת prompt))"""
+    agent = globals().get('ai_agent')
+    if agent is not None and getattr(agent, 'ollama_available', False):
+        model_name = getattr(agent, 'model_name', None) or getattr(agent, 'model', 'unknown')
+    else:
+        model_name = 'static'  # ייעוץ בלי AI - לא מוגש במקום ייעוץ של מודל כשהוא חוזר
+    parts = (
+        fingerprint,
+        getattr(agent, 'DEFAULT_RISK_PROFILE', 'בינוני'),
+        model_name,
+        getattr(agent, 'PROMPT_VERSION', 0),
+    )
+    return advice_key(*parts), parts
+
+def get_cached_advice(fingerprint):
+    """מחזיר ייעוץ שמור לתיק הזה אם יש - גם מלפני הפעלה מחדש"""
+    if fingerprint is None:  # אין גרסה - אין דרך לדעת לאיזה תיק הייעוץ שייך
+        return None
+    key, _ = get_advice_key(fingerprint)
+    advice = advice_store.get(key)
+    if advice:
+        print("מחזיר ייעוץ מ-cache")
+    return advice
+
+def update_advice_cache(advice, fingerprint):
+    """שומר את הייעוץ במאגר לפי טביעת התיק שממנו חושב"""
+    if fingerprint is None:
+        return
+    key, parts = get_advice_key(fingerprint)
+    advice_store.put(key, advice, *parts)
     print("ייעוץ נשמר ב-cache")
 
 def get_ai_advice_async(portfolio_data):
@@ -867,29 +999,51 @@ def get_ai_advice_async(portfolio_data):
     return None
 
 
-def start_background_ai_advice(portfolio_data):
-    """מתחיל טעינת ייעוץ AI ברקע - לא חוסם"""
+advice_tasks = set()  # טביעות שייעוץ עבורן כבר בחישוב ברקע
+advice_tasks_lock = threading.Lock()
+
+def start_background_ai_advice(fingerprint=None):
+    """מתחיל טעינת ייעוץ AI ברקע - לא חוסם
+    
+    הבדיקה לפי טביעת התיק בלבד (גרסת המסד והשערים) - שאילתה קטנה אחת בכל
+    צפייה בדף. שורות התיק נטענות רק בתוך המשימה, כשאין ייעוץ במאגר, וטעינה
+    אחת לכל טביעה גם כשכמה דפים נפתחים יחד.
+    """
     try:
+        if fingerprint is None:
+            fingerprint = portfolio_fingerprint()
+        if fingerprint is None:
+            return
+        
         # בדוק אם כבר יש ייעוץ תקף ב-cache
-        cached_advice = get_cached_advice(portfolio_data)
+        cached_advice = get_cached_advice(fingerprint)
         if cached_advice:
             print("יש כבר ייעוץ תקף ב-cache - לא צריך טעינה ברקע")
             return
         
-        print("אין ייעוץ ב-cache, מתחיל טעינת AI ברקע...")
+        with advice_tasks_lock:
+            if fingerprint in advice_tasks:
+                return
+            advice_tasks.add(fingerprint)
         
-        import threading
+        print("אין ייעוץ ב-cache, מתחיל טעינת AI ברקע...")
         
         def background_task():
             try:
+                # השורות נטענות רק כאן; הייעוץ נשמר לפי הטביעה שנקראה לפני הטעינה -
+                # כתיבה באמצע משאירה אותו תחת הגרסה הישנה, לא מסמנת ייעוץ ישן כעדכני
+                portfolio_data = get_cached_portfolio()
                 ai_advice = get_ai_advice_async(portfolio_data)
                 if ai_advice and len(ai_advice.strip()) > 100:
-                    update_advice_cache(ai_advice, portfolio_data)
+                    update_advice_cache(ai_advice, fingerprint)
                     print("ייעוץ AI נטען בהצלחה ונשמר ב-cache ברקע")
                 else:
                     print("לא התקבל ייעוץ טוב מ-AI ברקע")
             except Exception as e:
                 print(f"שגיאה בטעינת ייעוץ AI ברקע: {e}")
+            finally:
+                with advice_tasks_lock:
+                    advice_tasks.discard(fingerprint)
         
         # הרץ ברקע ללא המתנה
         thread = threading.Thread(target=background_task)
@@ -914,11 +1068,11 @@ def advice():
         
         print(f"משתמש מחובר: {current_user.username}")
         
-        # טען נתוני תיק
-        portfolio_data = get_cached_portfolio()
+        # טביעת התיק - נקראת לפני הטעינה, כתיבה באמצע לא תסמן ייעוץ ישן כעדכני
+        fingerprint = portfolio_fingerprint()
         
         # בדוק אם יש ייעוץ ב-cache (שנטען ברקע)
-        cached_advice = get_cached_advice(portfolio_data)
+        cached_advice = get_cached_advice(fingerprint)
         if cached_advice:
             print("מצאתי ייעוץ ב-cache - מציג על הדף")
             return render_template('advice.html', 
@@ -928,7 +1082,10 @@ def advice():
         
         # אם אין ייעוץ ב-cache, התחל טעינה ברקע
         print("אין ייעוץ ב-cache, מתחיל טעינה ברקע...")
-        start_background_ai_advice(portfolio_data)
+        start_background_ai_advice(fingerprint)
+        
+        # טען נתוני תיק
+        portfolio_data = get_cached_portfolio()
         
         # נסה לקבל ייעוץ AI ישירות עם timeout ארוך יותר
         print("מנסה לקבל ייעוץ AI ישירות...")
@@ -936,7 +1093,7 @@ def advice():
             ai_advice = get_ai_advice_async(portfolio_data)
             if ai_advice and len(ai_advice.strip()) > 100:
                 print("הצלחתי לקבל ייעוץ AI ישירות - מציג על הדף!")
-                update_advice_cache(ai_advice, portfolio_data)
+                update_advice_cache(ai_advice, fingerprint)
                 return render_template('advice.html', 
                                      advice=ai_advice, 
                                      from_cache=False, 
@@ -950,7 +1107,7 @@ def advice():
         import time
         for i in range(8):  # חכה עד 8 שניות
             time.sleep(1)
-            cached_advice = get_cached_advice(portfolio_data)
+            cached_advice = get_cached_advice(fingerprint)
             if cached_advice:
                 print(f"ייעוץ AI נטען ברקע אחרי {i+1} שניות!")
                 return render_template('advice.html', 
@@ -960,20 +1117,11 @@ def advice():
         
         print("ייעוץ AI לא הסתיים בזמן, מחזיר ניתוח מהיר")
         
-        # ניתוח מהיר של התיק תוך המתנה ל-AI
-        total_value = sum(security['price'] * security['amount'] for security in portfolio_data)
-        stock_count = len(portfolio_data)
-        
-        # חישוב התפלגות ענפים
-        industries = {}
-        for security in portfolio_data:
-            industry = security.get('industry', 'לא מוגדר')
-            if industry not in industries:
-                industries[industry] = 0
-            industries[industry] += security['price'] * security['amount']
-        
-        # מציאת 3 המניות הגדולות
-        top_holdings = sorted(portfolio_data, key=lambda x: x['price'] * x['amount'], reverse=True)[:3]
+        # ניתוח מהיר של התיק תוך המתנה ל-AI - סיכומים, ענפים ו-3 הגדולות מהמסד
+        summary = portfolio_model.get_portfolio_summary(top_n=3)
+        total_value = summary['total_value']
+        stock_count = summary['count']
+        top_holdings = summary['top_holdings']
         
         static_advice = f"""ניתוח מהיר לתיק שלך (הבינה המלאכותית מכינה ניתוח מפורט...):
 
@@ -984,17 +1132,14 @@ def advice():
 ההחזקות הגדולות שלך:"""
 
         for i, holding in enumerate(top_holdings, 1):
-            value = holding['price'] * holding['amount']
-            percentage = (value / total_value) * 100 if total_value > 0 else 0
-            static_advice += f"\n{i}. {holding['name']}: {value:,.0f} ש״ח ({percentage:.1f}%)"
+            static_advice += f"\n{i}. {holding['name']}: {holding['value']:,.0f} ש״ח ({holding['percentage']:.1f}%)"
         
         static_advice += f"""
 
 התפלגות לפי ענפים:"""
         
-        for industry, value in sorted(industries.items(), key=lambda x: x[1], reverse=True):
-            percentage = (value / total_value) * 100 if total_value > 0 else 0
-            static_advice += f"\n• {industry}: {value:,.0f} ש״ח ({percentage:.1f}%)"
+        for industry in summary['industries']:  # כבר ממוין לפי שווי
+            static_advice += f"\n• {industry['industry']}: {industry['value']:,.0f} ש״ח ({industry['percentage']:.1f}%)"
         
         static_advice += """
 
@@ -1024,10 +1169,9 @@ def advice():
 def refresh_advice():
     """מרענן את הייעוץ ומאלץ קבלת ייעוץ חדש מ-AI"""
     try:
-        # נקה את ה-cache
-        advice_cache['advice'] = None
-        advice_cache['timestamp'] = 0
-        advice_cache['portfolio_hash'] = None
+        # מחיקת הייעוץ של התיק הנוכחי בלבד - ייעוצים לתיקים אחרים נשארים במאגר
+        key, _ = get_advice_key(portfolio_fingerprint())
+        advice_store.delete(key)
         
         print("cache נוקה, מפנה לדף ייעוץ")
         return redirect(url_for('advice'))
@@ -1041,10 +1185,10 @@ def refresh_advice():
 def get_fresh_advice():
     """API endpoint לקבלת ייעוץ חדש מ-AI"""
     try:
-        portfolio_data = get_cached_portfolio()
+        fingerprint = portfolio_fingerprint()  # לפני הטעינה - כמו בדף הייעוץ
         
         # בדוק אם יש ייעוץ חדש ב-cache (מהטעינה ברקע)
-        cached_advice = get_cached_advice(portfolio_data)
+        cached_advice = get_cached_advice(fingerprint)
         if cached_advice:
             print("✅ מחזיר ייעוץ מ-cache")
             return jsonify({
@@ -1056,10 +1200,10 @@ def get_fresh_advice():
         # אם אין ייעוץ ב-cache, נסה לקבל מ-AI ישירות
         print("🔄 מנסה לקבל ייעוץ חדש מ-AI...")
         try:
-            ai_advice = get_ai_advice_async(portfolio_data)
+            ai_advice = get_ai_advice_async(get_cached_portfolio())
             if ai_advice and len(ai_advice.strip()) > 100:
                 print(f"✅ ייעוץ AI הושלם ונשמר ב-cache")
-                update_advice_cache(ai_advice, portfolio_data)
+                update_advice_cache(ai_advice, fingerprint)
                 return jsonify({
                     'success': True,
                     'advice': ai_advice,
@@ -1086,53 +1230,13 @@ def get_fresh_advice():
 def risk():
     """דף ניהול סיכונים"""
     try:
-        portfolio_data = get_cached_portfolio()
+        # פילוח לפי רמות סיכון וההחזקות הגדולות עם רמת הסיכון שלהן - מהמסד
+        summary = portfolio_model.get_portfolio_summary(top_n=RISK_TOP_HOLDINGS)
         
-        # חישוב רמות סיכון
-        risk_levels = {
-            'טכנולוגיה': 6, 'תחבורה': 5, 'אנרגיה': 4,
-            'בריאות': 4, 'תעשייה': 3, 'פיננסים': 3,
-            'נדלן': 2, 'צריכה פרטית': 1
-        }
-        
-        total_value = 0
-        high_risk_value = 0
-        medium_risk_value = 0
-        low_risk_value = 0
+        risk_summary = dict(summary['risk'])
+        risk_summary['total_value'] = summary['total_value']
         
-        for security in portfolio_data:
-            security_value = security['price'] * security['amount']
-            total_value += security_value
-            
-            industry = security.get('industry', 'לא מוגדר')
-            risk_level = risk_levels.get(industry, 3)
-            
-            if risk_level >= 5:
-                high_risk_value += security_value
-            elif risk_level >= 3:
-                medium_risk_value += security_value
-            else:
-                low_risk_value += security_value
-            
-            security['risk_level'] = risk_level
-            security['value'] = security_value
-        
-        # חישוב אחוזי סיכון
-        if total_value > 0:
-            high_risk_percentage = (high_risk_value / total_value) * 100
-            medium_risk_percentage = (medium_risk_value / total_value) * 100
-            low_risk_percentage = (low_risk_value / total_value) * 100
-        else:
-            high_risk_percentage = medium_risk_percentage = low_risk_percentage = 0
-        
-        risk_summary = {
-            'high_risk': {'value': high_risk_value, 'percentage': high_risk_percentage},
-            'medium_risk': {'value': medium_risk_value, 'percentage': medium_risk_percentage},
-            'low_risk': {'value': low_risk_value, 'percentage': low_risk_percentage},
-            'total_value': total_value
-        }
-        
-        return render_template('risk.html', portfolio=portfolio_data, risk_summary=risk_summary)
+        return render_template('risk.html', portfolio=summary['top_holdings'], risk_summary=risk_summary)
     except Exception as e:
         flash(f'שגיאה בטעינת דף הסיכונים: {str(e)}', 'danger')
         return redirect(url_for('portfolio'))
@@ -1188,6 +1292,14 @@ def api_keys_status():
         if current_index < 0 or current_index >= len(keys_list):
             current_index = 0
         
+        # שימוש ובריאות לכל מפתח מתוך מאגר המפתחות
+        try:
+            key_usage = {usage['index']: usage for usage in Broker.key_pool.get_stats()}
+        except Exception as usage_error:
+            print(f"Error reading key pool stats: {usage_error}")
+            key_usage = {}
+        health_labels = {'healthy': '✓ פעיל', 'cooldown': '⏸ בהפסקה אחרי הגבלה', 'exhausted': '⛔ המכסה היומית נוצלה'}
+        
         # בניית מידע על כל מפתח
         for i, key in enumerate(keys_list):
             try:
@@ -1202,13 +1314,15 @@ def api_keys_status():
                 else:
                     key_display = key_str[:8] + "..." if len(key_str) > 8 else key_str
                 
+                usage = key_usage.get(i)
                 api_keys_info.append({
                     'index': i,
                     'key': key_display,
                     'full_key': key_str,
                     'is_current': is_current,
-                    'status': '✓ פעיל' if is_current else '⏸ זמין',
-                    'type': 'מפתח הדגמה' if key_str == "DEMO" else 'מפתח פרימיום'
+                    'status': health_labels.get(usage['health'], '⏸ זמין') if usage else ('✓ פעיל' if is_current else '⏸ זמין'),
+                    'type': 'מפתח הדגמה' if key_str == "DEMO" else 'מפתח פרימיום',
+                    'usage': usage
                 })
             except Exception as key_process_error:
                 print(f"Error processing key at index {i}: {key_process_error}")
@@ -1295,8 +1409,8 @@ def debug_database():
 def test_api():
     """בדיקת API"""
     try:
-        # בדיקת חיבור ל-Alpha Vantage
-        test_result = Broker.update_price('AAPL')
+        # בדיקת חיבור ל-Alpha Vantage - תמיד בקשה אמיתית, לא מה-cache
+        test_result = Broker.update_price('AAPL', bypass_cache=True)
         
         if test_result:
             api_test = {
@@ -1347,14 +1461,8 @@ def setup_database():
         
         if len(existing_securities) < 6:
             # ניקוי טבלה אם צריך
-            try:
-                conn = portfolio_model.get_connection()
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM securities")
-                conn.commit()
-                conn.close()
-            except Exception as e:
-                print(f"שגיאה בניקוי טבלה: {e}")
+            if portfolio_model.clear_securities() is None:
+                print("שגיאה בניקוי טבלה")
             
             # הוספת נתוני דוגמה
             sample_securities = [
@@ -1367,15 +1475,16 @@ def setup_database():
                 ("אמזון", "AMZN", 2, 1500.0, "צריכה פרטית", 0.28, "מניה")
             ]
             
-            for security_data in sample_securities:
-                try:
-                    portfolio_model.add_security(*security_data)
-                    sec_name = security_data[0]
+            # הוספה מרוכזת בטרנזקציה אחת
+            outcomes = portfolio_model.add_securities_many(sample_securities)
+            for security_data, added in zip(sample_securities, outcomes):
+                sec_name = security_data[0]
+                if added:
                     sec_amount = security_data[2]
                     sec_price = security_data[3]
                     print(f"נוסף: {sec_name} - {sec_amount} יחידות ב-{sec_price} ₪")
-                except Exception as e:
-                    print(f"שגיאה בהוספת {security_data[0]}: {e}")
+                else:
+                    print(f"שגיאה בהוספת {sec_name}")
         else:
             existing_count = len(existing_securities)
             print(f"כבר יש {existing_count} ניירות ערך במסד הנתונים")
@@ -1530,7 +1639,25 @@ def db_status():
             'database_type': ('PostgreSQL' if portfolio_model.database_url 
                              else 'SQLite'),
             'tables_count': len(tables),
-            'tables': [table[0] for table in tables]
+            'tables': [table[0] for table in tables],
+            'pool': portfolio_model.get_pool_stats(),  # סטטיסטיקות מאגר החיבורים
+            'quote_cache': Broker.quote_cache.get_stats(),  # פגיעות / החטאות ב-cache המחירים
+            'quote_single_flight': Broker.in_flight.get_stats(),  # בקשות מחיר כפולות שאוחדו
+            'quote_breakers': {name: breaker.get_stats()  # מפסק לכל ספק מחירים
+                               for name, breaker in Broker.breakers.items()},
+            'fx_rates': fx_rates.get_stats(),  # שערי המטבע להמרה בזמן קריאה
+            'shared_cache': shared_cache.get_stats(),  # ה-cache המשותף לכל ה-workers
+            'advice_store': advice_store.get_stats(),  # ייעוצי AI שמורים - פגיעות ובתים
+            'change_signal': portfolio_model.change_signal.get_stats(),  # אותות שינוי בין תהליכים
+            'markets': {code: calendar.get_stats() for code, calendar in EXCHANGES.items()},  # פתוחה / סגורה
+            'market_closed_calls_avoided': {  # בקשות מחיר שלא נשלחו כי הבורסה סגורה
+                'quote_cache': Broker.closed_market_hits,
+                'price_refresher': price_refresher.calls_avoided
+            },
+            'price_refresher': {  # עדכון המחירים ברקע
+                'running': price_refresher.is_running(),
+                'last_report': price_refresher.last_report
+            }
         })
         
     except Exception as e:
@@ -1555,7 +1682,7 @@ def update_lqd_name():
             if 'LQD' in name or 'LQD' in symbol:
                 # עדכון לשם ברור יותר
                 new_name = "קרן אגרות חוב קונצרניות"
-                portfolio_model.update_security_name(security['name'], new_name)
+                portfolio_model.update_security_name_by_id(security['id'], new_name)
                 flash(f'עודכן: {security["name"]} → {new_name}', 'success')
         
         return redirect(url_for('portfolio'))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark_db.py - מדידת ביצועי עדכון מחירים במסד הנתונים
+
+הסקריפט יוצר מסדי SQLite זמניים בגדלים שונים ומודד זמן עדכון מחיר בודד:
+לפי שם בלי אינדקס (ההתנהגות הישנה), לפי שם עם אינדקס, ולפי מזהה וסמל.
+כך רואים איך זמן העדכון גדל (או לא) ככל שהטבלה גדלה.
+
+הפעלה:
+    python benchmark_db.py
+    python benchmark_db.py --sizes 1000 10000 50000 --updates 300
+"""
+
+import argparse  # לקריאת פרמטרים משורת הפקודה
+import os  # לעבודה עם קבצים
+import random  # לבחירת שורות אקראיות לעדכון
+import sys  # לעבודה עם נתיב המערכת
+import tempfile  # לתיקייה זמנית למסדי הבדיקה
+import time  # למדידת זמנים
+
+# הוסף את התיקייה הנוכחית ל-path כדי שנוכל לייבא מודולים מקומיים
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# הבנצ'מרק תמיד רץ על SQLite זמני - לא נוגעים במסד אמיתי
+os.environ.pop('DATABASE_URL', None)
+
+from dbmodel import PortfolioModel  # ייבא את מודל מסד הנתונים
+
+
+def fill_table(model, size):
+    """מילוי הטבלה ב-size שורות בפקודה אחת - רק להכנת הבדיקה"""
+    conn = model.get_connection()
+    cursor = conn.cursor()
+    rows = [
+        (f"Security {i}", f"SYM{i}", 10, 100.0, "טכנולוגיה", "0.2", "מניה")
+        for i in range(size)
+    ]
+    cursor.executemany("""
+        INSERT INTO securities (name, symbol, amount, price, industry, variance, security_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def set_indexes(model, enabled):
+    """הפעלה או הסרה של האינדקסים - כדי להשוות להתנהגות הישנה"""
+    conn = model.get_connection()
+    cursor = conn.cursor()
+    if enabled:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_securities_symbol ON securities (symbol)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_securities_name ON securities (name)")
+    else:
+        cursor.execute("DROP INDEX IF EXISTS idx_securities_symbol")
+        cursor.execute("DROP INDEX IF EXISTS idx_securities_name")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def time_updates(update, keys):
+    """מריץ עדכון לכל מפתח ומחזיר זמן ממוצע לעדכון במילישניות"""
+    start = time.perf_counter()
+    for key in keys:
+        update(key, random.uniform(50, 150))
+    return (time.perf_counter() - start) * 1000 / len(keys)
+
+
+def run_benchmark(sizes, updates):
+    """הרצת הבדיקה לכל גודל טבלה והדפסת טבלת תוצאות"""
+    print(f"{'שורות':>10} | {'שם בלי אינדקס':>14} | {'שם עם אינדקס':>13} | {'לפי סמל':>9} | {'לפי מזהה':>9}   (ms לעדכון)")
+    print("-" * 80)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            model = PortfolioModel(db_path=os.path.join(tmp_dir, f"bench_{size}.db"))
+            fill_table(model, size)
+            
+            sample = random.sample(range(size), min(updates, size))
+            names = [f"Security {i}" for i in sample]
+            symbols = [f"SYM{i}" for i in sample]
+            ids = [i + 1 for i in sample]
+            
+            set_indexes(model, False)
+            by_name_scan = time_updates(model.update_security_price, names)
+            set_indexes(model, True)
+            by_name = time_updates(model.update_security_price, names)
+            by_symbol = time_updates(model.update_security_price_by_symbol, symbols)
+            by_id = time_updates(model.update_security_price_by_id, ids)
+            
+            print(f"{size:>10} | {by_name_scan:>14.3f} | {by_name:>13.3f} | {by_symbol:>9.3f} | {by_id:>9.3f}")
+            model.pool.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="מדידת זמן עדכון מחיר לפי גודל הטבלה")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help="גדלי טבלה לבדיקה")
+    parser.add_argument('--updates', type=int, default=200,
+                        help="מספר עדכונים למדידה בכל גודל")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.updates)
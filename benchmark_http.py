@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark_http.py - זמן לבקשה עם חיבור חדש בכל פעם מול session משותף
+
+הסקריפט מרים שרת HTTP מקומי שמחזיר תשובת GLOBAL_QUOTE קבועה, ושולח אליו
+אותן בקשות בשתי דרכים: requests.get (חיבור TCP חדש לכל בקשה - כמו שהיה
+ב-Broker) ו-httpsession.get (חיבור keep-alive מהמאגר המשותף).
+מול alphavantage.co ההפרש גדול יותר - כל חיבור חדש שם כולל גם DNS ו-TLS.
+
+הפעלה:
+    python benchmark_http.py
+    python benchmark_http.py --requests 500 --threads 4
+"""
+
+import argparse  # לקריאת פרמטרים משורת הפקודה
+import json  # לתשובת השרת המקומי
+import os  # לעבודה עם נתיבים
+import sys  # לעבודה עם נתיב המערכת
+import threading  # לשרת ולתהליכוני הבקשות
+import time  # למדידת זמנים
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # שרת בדיקה מקומי
+
+import requests  # חיבור חדש לכל בקשה - המצב הקודם
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import httpsession  # ה-session המשותף
+
+QUOTE_BODY = json.dumps({'Global Quote': {'01. symbol': 'AAPL', '05. price': '190.1200'}}).encode()
+
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    """תשובת GLOBAL_QUOTE קבועה, עם keep-alive"""
+    protocol_version = 'HTTP/1.1'  # משאיר את החיבור פתוח בין בקשות
+    disable_nagle_algorithm = True  # כותרות וגוף נשלחים מיד - בלי עיכוב ACK של 40ms על keep-alive
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(QUOTE_BODY)))
+        self.end_headers()
+        self.wfile.write(QUOTE_BODY)
+
+    def log_message(self, format, *args):
+        pass  # בלי הדפסה לכל בקשה
+
+
+def percentile(values, fraction):
+    """אחוזון מתוך רשימת זמנים"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(get, url, total, threads):
+    """שליחת total בקשות ב-threads תהליכונים - מחזיר רשימת זמנים בשניות"""
+    latencies = []
+    lock = threading.Lock()
+    per_thread = total // threads
+
+    def worker():
+        local = []
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            response = get(url, params={'function': 'GLOBAL_QUOTE', 'symbol': 'AAPL'}, timeout=10)
+            response.json()
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies
+
+
+def main():
+    """הרצת שתי השיטות מול אותו שרת והדפסת השוואה"""
+    parser = argparse.ArgumentParser(description="זמן לבקשה: requests.get מול session משותף")
+    parser.add_argument('--requests', type=int, default=300, help="בקשות לכל שיטה")
+    parser.add_argument('--threads', type=int, default=1, help="תהליכוני בקשות במקביל")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), QuoteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/query"
+
+    print(f"בקשות: {args.requests}, תהליכונים: {args.threads}")
+    print("-" * 70)
+    for label, get in (("requests.get (חיבור חדש)", requests.get),
+                       ("httpsession.get (keep-alive)", httpsession.get)):
+        get(url, timeout=10)  # חימום
+        latencies = measure(get, url, args.requests, args.threads)
+        print(f"{label:<30} ממוצע {sum(latencies) / len(latencies) * 1000:6.2f}ms | "
+              f"p50 {percentile(latencies, 0.50) * 1000:6.2f}ms | "
+              f"p95 {percentile(latencies, 0.95) * 1000:6.2f}ms")
+
+    httpsession.close_session()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
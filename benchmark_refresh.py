@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark_refresh.py - תפוקת עדכון מחירים לכל התיק בלי רשת
+
+הסקריפט יוצר מסד SQLite זמני עם N ניירות ערך, מקליט להם מחירים לקובץ
+replay ומחליף את ספק המחירים של Broker ב-ReplayProvider - עם השהיה
+מדומה לכל בקשה ושיעור שגיאות מבוקר. כך אפשר למדוד את PriceRefresher.refresh_all
+בגדלי קבוצה ומקביליות שונים, בלי לגעת ב-API ובלי לבזבז מכסה.
+
+הפעלה:
+    python benchmark_refresh.py
+    python benchmark_refresh.py --securities 2000 --latency-ms 80 --error-rate 0.05
+"""
+
+import argparse  # לקריאת פרמטרים משורת הפקודה
+import os  # לעבודה עם קבצים
+import random  # למחירים המוקלטים
+import sys  # לעבודה עם נתיב המערכת
+import tempfile  # לתיקייה זמנית למסד ולקובץ ההקלטה
+
+# הוסף את התיקייה הנוכחית ל-path כדי שנוכל לייבא מודולים מקומיים
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# הבנצ'מרק תמיד רץ על SQLite זמני - לא נוגעים במסד אמיתי
+os.environ.pop('DATABASE_URL', None)
+os.environ['MARKET_HOURS_ENABLED'] = '0'  # כל סבב פונה לספק גם כשהבורסה סגורה
+
+from dbmodel import Broker, PortfolioModel, ReplayProvider  # מסד הנתונים וספק ההקלטות
+from pricerefresher import PriceRefresher  # העדכון שנמדד
+
+
+def record_quotes(path, symbols, samples=20, seed=0):
+    """קובץ replay עם samples מחירים לכל סמל"""
+    rng = random.Random(seed)
+    quotes = {}
+    for symbol in symbols:
+        price = rng.uniform(5, 500)
+        quotes[symbol] = [round(price * (1 + rng.uniform(-0.02, 0.02)), 4) for _ in range(samples)]
+    ReplayProvider.save(path, quotes)
+
+
+def run(model, replay_path, args, batch_size, workers):
+    """סבב עדכון אחד של כל התיק - מחזיר את הדוח"""
+    provider = ReplayProvider(replay_path, latency_ms=args.latency_ms, error_rate=args.error_rate,
+                              batch_size=batch_size)
+    Broker.set_provider(provider)  # גם מנקה את ה-cache - כל סבב פונה לספק
+    report = PriceRefresher(model, max_workers=workers).refresh_all()
+    report['requests'] = provider.requests
+    return report
+
+
+def main():
+    """מדידת refresh_all בכמה צירופים של גודל קבוצה ומקביליות"""
+    parser = argparse.ArgumentParser(description="תפוקת עדכון מחירים מול ספק מוקלט")
+    parser.add_argument('--securities', type=int, default=500, help="ניירות ערך בתיק")
+    parser.add_argument('--latency-ms', type=float, default=50, help="השהיה מדומה לכל בקשה")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="חלק הבקשות שנכשלות (0-1)")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100], help="סמלים בבקשה מרוכזת")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8], help="בקשות בודדות במקביל")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model = PortfolioModel(db_path=os.path.join(tmp_dir, 'benchmark.db'))
+        symbols = [f"SYM{i}" for i in range(args.securities)]
+        model.add_securities_many([
+            (f"Security {i}", symbol, 10, 100.0, "טכנולוגיה", "0.2", "מניה")
+            for i, symbol in enumerate(symbols)
+        ])
+        replay_path = os.path.join(tmp_dir, 'quotes_replay.json')
+        record_quotes(replay_path, symbols)
+
+        print(f"ניירות ערך: {args.securities}, השהיה: {args.latency_ms:g}ms, שגיאות: {args.error_rate:.0%}")
+        print("-" * 70)
+        for batch_size in args.batch_sizes:
+            for workers in args.workers:
+                report = run(model, replay_path, args, batch_size, workers)
+                duration = max(report['duration'], 0.001)
+                print(f"קבוצה {batch_size:>4} | מקביליות {workers:>3} | "
+                      f"{report['updated']:>5}/{report['total']} עודכנו | "
+                      f"{report['requests']:>5} בקשות | {duration:7.2f} שניות | "
+                      f"{report['total'] / duration:8.1f} ניירות ערך/שנייה")
+        model.pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark_sqlite.py - מדידת תפוקת קריאה/כתיבה מעורבת מול שרת הפיתוח של Flask
+
+הסקריפט מריץ את האפליקציה על מסד SQLite זמני פעמיים - בלי ועם פרופיל הביצועים
+(SQLITE_PERFORMANCE_PROFILE). בכל ריצה תהליכוני קריאה מבקשים עמודים מ-/portfolio
+דרך HTTP, ובמקביל תהליכוני כתיבה מעדכנים מחירים כמו עדכון המחירים ברקע.
+בסוף מודפסות בקשות לשנייה, זמני תגובה ושגיאות לכל פרופיל.
+
+הפעלה:
+    python benchmark_sqlite.py
+    python benchmark_sqlite.py --readers 8 --writers 2 --duration 15 --rows 20000
+"""
+
+import argparse  # לקריאת פרמטרים משורת הפקודה
+import json  # להעברת תוצאות מתהליך הבדיקה
+import os  # לעבודה עם קבצים ומשתני סביבה
+import random  # לבחירת עמודים ומחירים אקראיים
+import subprocess  # להרצת כל פרופיל בתהליך נפרד
+import sys  # לעבודה עם נתיב המערכת
+import tempfile  # לתיקייה זמנית למסד הבדיקה
+import threading  # לתהליכוני קריאה וכתיבה
+import time  # למדידת זמנים
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))  # תיקיית הפרויקט
+
+
+def percentile(values, fraction):
+    """אחוזון מתוך רשימת זמנים"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_profile(readers, writers, duration, rows):
+    """ריצה אחת בתוך תהליך נפרד - הפרופיל נקבע לפי משתני הסביבה שהתהליך קיבל"""
+    import requests  # לבקשות HTTP לשרת
+    from werkzeug.serving import make_server  # שרת הפיתוח של Flask
+
+    sys.path.append(PROJECT_DIR)
+    from app import app, portfolio_model  # האפליקציה יוצרת investments.db בתיקייה הנוכחית
+
+    # הכנת נתונים ומשתמשים
+    portfolio_model.create_default_users()
+    portfolio_model.add_securities_many(
+        (f"Security {i}", f"SYM{i}", random.randint(1, 100), random.uniform(10, 500),
+         random.choice(['טכנולוגיה', 'פיננסים', 'בריאות', 'נדלן']), 0.2, 'מניה')
+        for i in range(rows)
+    )
+    total_pages = max(1, rows // 20)
+
+    # הפעלת השרת בתהליכון ברקע על פורט פנוי
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stop_at = time.monotonic() + duration
+    results = {'read_latencies': [], 'read_errors': 0, 'writes': 0, 'write_errors': 0}
+    lock = threading.Lock()
+
+    def reader():
+        session = requests.Session()
+        session.post(f"{base_url}/simple-login-post", data={'username': 'user', 'password': 'user'})
+        latencies = []
+        errors = 0
+        while time.monotonic() < stop_at:
+            page = random.randint(1, total_pages)
+            start = time.perf_counter()
+            try:
+                response = session.get(f"{base_url}/portfolio", params={'page': page}, allow_redirects=False)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        with lock:
+            results['read_latencies'].extend(latencies)
+            results['read_errors'] += errors
+
+    def writer():
+        writes = 0
+        errors = 0
+        while time.monotonic() < stop_at:
+            updates = [(f"SYM{random.randrange(rows)}", random.uniform(10, 500)) for _ in range(50)]
+            outcomes = portfolio_model.update_prices_many(updates)
+            if all(outcomes):
+                writes += 1
+            else:
+                errors += 1
+        with lock:
+            results['writes'] += writes
+            results['write_errors'] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    latencies = results['read_latencies']
+    return {
+        'reads_per_sec': len(latencies) / duration,
+        'read_p50_ms': percentile(latencies, 0.50) * 1000,
+        'read_p95_ms': percentile(latencies, 0.95) * 1000,
+        'read_errors': results['read_errors'],
+        'write_batches_per_sec': results['writes'] / duration,
+        'write_errors': results['write_errors'],
+        'pool': portfolio_model.get_pool_stats(),
+    }
+
+
+def main():
+    """הרצת שני הפרופילים בתהליכים נפרדים והדפסת השוואה"""
+    parser = argparse.ArgumentParser(description="תפוקת קריאה/כתיבה מעורבת מול שרת Flask")
+    parser.add_argument('--readers', type=int, default=8, help="תהליכוני קריאה (HTTP)")
+    parser.add_argument('--writers', type=int, default=2, help="תהליכוני כתיבה (עדכון מחירים)")
+    parser.add_argument('--duration', type=float, default=10, help="שניות לכל פרופיל")
+    parser.add_argument('--rows', type=int, default=5000, help="ניירות ערך במסד הבדיקה")
+    parser.add_argument('--child', choices=['off', 'on'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:  # אנחנו התהליך שמריץ פרופיל אחד
+        result = run_profile(args.readers, args.writers, args.duration, args.rows)
+        print("RESULT " + json.dumps(result))
+        return
+
+    print(f"קוראים: {args.readers}, כותבים: {args.writers}, שורות: {args.rows}, משך: {args.duration} שניות")
+    print("-" * 80)
+    for profile in ('off', 'on'):
+        env = dict(os.environ)
+        env.pop('DATABASE_URL', None)  # תמיד SQLite זמני
+        env['SQLITE_PERFORMANCE_PROFILE'] = '1' if profile == 'on' else '0'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', profile,
+                 '--readers', str(args.readers), '--writers', str(args.writers),
+                 '--duration', str(args.duration), '--rows', str(args.rows)],
+                cwd=tmp_dir, env=env, capture_output=True, text=True
+            )
+        result_lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+        if not result_lines:
+            print(f"❌ פרופיל {profile} נכשל:\n{completed.stderr[-2000:]}")
+            continue
+        result = json.loads(result_lines[-1][len("RESULT "):])
+        print(f"פרופיל ביצועים {profile:>3}: "
+              f"{result['reads_per_sec']:8.1f} קריאות/ש' "
+              f"(p50 {result['read_p50_ms']:.1f}ms, p95 {result['read_p95_ms']:.1f}ms, שגיאות {result['read_errors']}) | "
+              f"{result['write_batches_per_sec']:6.1f} קבוצות כתיבה/ש' (שגיאות {result['write_errors']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+"""
+cachebackend.py - cache משותף לכל ה-workers והודעות ביטול בין תהליכים
+
+תחת gunicorn כל worker הוא תהליך נפרד, ו-cache שהוא dictionary במודול
+נשאר פרטי לכל אחד. כאן מוגדרים:
+- מאגרי cache עם אותו ממשק (get / set / delete / clear):
+  memory - בתוך התהליך, sqlite - קובץ משותף על הדיסק, redis - שרת תואם Redis
+- אותות שינוי (publish / subscribe) - כל כתיבה לניירות ערך מודיעה לכל התהליכים:
+  PostgreSQL LISTEN/NOTIFY כשיש DATABASE_URL, וקובץ אות מקומי ל-SQLite
+"""
+
+import os  # לעבודה עם משתני סביבה וקבצים
+import pickle  # ערכים ב-cache המשותף
+import select  # המתנה להודעות מ-PostgreSQL
+import sqlite3  # מאגר על הדיסק
+import threading  # נעילות ותהליכוני האזנה
+import time  # לתוקף הערכים
+from collections import OrderedDict  # סדר LRU במאגר שבזיכרון
+
+# Redis (אופציונלי) - רק אם CACHE_BACKEND=redis
+try:
+    import redis  # לקוח לשרת תואם Redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# PostgreSQL (אופציונלי) - להודעות LISTEN/NOTIFY
+try:
+    import psycopg2  # ספרייה לחיבור PostgreSQL
+    POSTGRESQL_AVAILABLE = True
+except ImportError:
+    POSTGRESQL_AVAILABLE = False
+
+# הגדרות ה-cache - ניתן לשנות דרך משתני סביבה
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory').lower()  # memory / sqlite / redis
+CACHE_PATH = os.environ.get('CACHE_PATH', 'shared_cache.db')  # קובץ המאגר המשותף (sqlite)
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 256))  # למאגר שבזיכרון
+CACHE_DEFAULT_TTL = float(os.environ.get('CACHE_DEFAULT_TTL', 3600))  # שניות - ערכים נקראים לפי גרסה
+CACHE_SIGNAL_CHANNEL = 'portfolio_changed'  # ערוץ NOTIFY
+CACHE_SIGNAL_POLL = float(os.environ.get('CACHE_SIGNAL_POLL', 0.5))  # שניות בין בדיקות של קובץ האות
+CACHE_SIGNAL_FILE_MAX = 64 * 1024  # בתים בקובץ האות לפני שהוא מתאפס
+# שניות שבהן עותק מקומי מוגש בלי בדיקת גרסה במסד כשלא הגיע אות - רשת ביטחון לאות שאבד
+CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get('CACHE_VERSION_CHECK_INTERVAL', 5))
+CACHE_SIGNAL_RETRY = 5  # שניות לפני התחברות מחדש להאזנה שנפלה
+CACHE_SIGNAL_LISTEN_TIMEOUT = 60  # שניות המתנה להודעה לפני בדיקה חוזרת של החיבור
+
+
+class MemoryCache:
+    """cache בתוך התהליך - LRU עם תוקף לכל ערך"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # מפתח -> (ערך, זמן תפוגה)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """הערך, או None אם אין או שפג תוקפו"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=CACHE_DEFAULT_TTL):
+        """שמירת ערך ל-ttl שניות"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """מחיקת ערך"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """מחיקת כל הערכים"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """מידע לתצוגה"""
+        return {'backend': self.name, 'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class SQLiteCache:
+    """cache בקובץ SQLite משותף - כל ה-workers על אותו שרת קוראים את אותם ערכים
+
+    חיבור אחד לכל תהליכון, WAL כדי שקריאות לא ימתינו לכתיבה.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._local = threading.local()  # חיבור לכל תהליכון
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _connection(self):
+        """החיבור של התהליכון הנוכחי - נפתח בפעם הראשונה"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # cache - אובדן הכתיבה האחרונה בקריסה לא מזיק
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """הערך, או None אם אין, פג תוקפו או שהקריאה נכשלה"""
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ שגיאה בקריאה מה-cache המשותף: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=CACHE_DEFAULT_TTL):
+        """שמירת ערך ל-ttl שניות - ערכים שפג תוקפם נמחקים באותה טרנזקציה"""
+        conn = self._connection()
+        try:
+            now = time.time()
+            conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+            conn.execute("INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), now + ttl))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self.errors += 1
+            print(f"❌ שגיאה בכתיבה ל-cache המשותף: {e}")
+
+    def delete(self, key):
+        """מחיקת ערך"""
+        conn = self._connection()
+        conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        conn.commit()
+
+    def clear(self):
+        """מחיקת כל הערכים"""
+        conn = self._connection()
+        conn.execute("DELETE FROM cache_entries")
+        conn.commit()
+
+    def get_stats(self):
+        """מידע לתצוגה"""
+        try:
+            entries = self._connection().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        except Exception:
+            entries = None
+        return {'backend': self.name, 'path': self.path, 'entries': entries,
+                'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+
+
+class RedisCache:
+    """cache בשרת תואם Redis - משותף גם בין שרתים"""
+
+    name = 'redis'
+
+    def __init__(self, url=CACHE_REDIS_URL, prefix='portfolio:'):
+        self.url = url
+        self.prefix = prefix  # כל המפתחות של האפליקציה - clear מוחק רק אותם
+        self.client = redis.Redis.from_url(url)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key):
+        """הערך, או None אם אין או שהשרת לא זמין"""
+        try:
+            data = self.client.get(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ שגיאה בקריאה מ-Redis: {e}")
+            return None
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(data)
+
+    def set(self, key, value, ttl=CACHE_DEFAULT_TTL):
+        """שמירת ערך ל-ttl שניות (התפוגה אצל השרת)"""
+        try:
+            self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                            px=max(1, int(ttl * 1000)))
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ שגיאה בכתיבה ל-Redis: {e}")
+
+    def delete(self, key):
+        """מחיקת ערך"""
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        """מחיקת כל המפתחות עם ה-prefix"""
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def get_stats(self):
+        """מידע לתצוגה"""
+        return {'backend': self.name, 'url': self.url, 'hits': self.hits,
+                'misses': self.misses, 'errors': self.errors}
+
+
+def create_cache(backend=CACHE_BACKEND):
+    """מאגר ה-cache לפי שם - memory אם המאגר המבוקש לא זמין"""
+    try:
+        if backend == 'sqlite':
+            return SQLiteCache()
+        if backend == 'redis':
+            if not REDIS_AVAILABLE:
+                print("❌ CACHE_BACKEND=redis אבל הספרייה redis לא מותקנת - משתמש ב-cache בזיכרון")
+                return MemoryCache()
+            return RedisCache()
+    except Exception as e:
+        print(f"❌ שגיאה בפתיחת ה-cache {backend}: {e} - משתמש ב-cache בזיכרון")
+        return MemoryCache()
+    if backend != 'memory':
+        print(f"❌ CACHE_BACKEND לא מוכר: {backend} - משתמש ב-cache בזיכרון")
+    return MemoryCache()
+
+
+class ChangeSignal:
+    """אות שינוי בין תהליכים - publish אחרי כל כתיבה, subscribe לקבלת הודעה
+
+    publish מודיע קודם למנויים בתהליך עצמו (כך שהוא רואה מיד את הכתיבה שלו),
+    ואז לשאר התהליכים. תהליכון ההאזנה נפתח רק עם המנוי הראשון.
+    """
+
+    name = 'local'
+
+    def __init__(self):
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.published = 0
+        self.received = 0
+        self.connected = False  # האם ההאזנה פעילה - בלעדיה לא סומכים על האות
+
+    def subscribe(self, callback):
+        """callback() נקרא בכל שינוי, בכל תהליך"""
+        with self._lock:
+            self._callbacks.append(callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name=f'cache-signal-{self.name}',
+                                                daemon=True)
+                self._thread.start()
+
+    def _notify(self):
+        """הפעלת המנויים - שגיאה באחד לא עוצרת את השאר"""
+        for callback in list(self._callbacks):
+            try:
+                callback()
+            except Exception as e:
+                print(f"❌ שגיאה בטיפול באות שינוי: {e}")
+
+    def publish(self):
+        """הודעה על שינוי - למנויים כאן ולשאר התהליכים"""
+        self.published += 1
+        self._notify()
+        try:
+            self._broadcast()
+        except Exception as e:
+            print(f"❌ שגיאה בשליחת אות שינוי: {e}")
+
+    def _broadcast(self):
+        """שליחה לשאר התהליכים - אין כאלה באות המקומי"""
+
+    def _listen(self):
+        """האזנה להודעות משאר התהליכים - אין כאלה באות המקומי"""
+        self.connected = True
+
+    def get_stats(self):
+        """מידע לתצוגה"""
+        return {'signal': self.name, 'connected': self.connected,
+                'published': self.published, 'received': self.received}
+
+
+class FileSignal(ChangeSignal):
+    """אות דרך קובץ מקומי - publish מוסיף לו בית, וכל תהליך בודק את הגודל שלו כל CACHE_SIGNAL_POLL
+
+    הגודל הוא מונה: הוספה ב-O_APPEND אטומית בין תהליכים, ושתי כתיבות באותו
+    tick של השעון לא מתמזגות כמו בזמן השינוי של הקובץ. מעל CACHE_SIGNAL_FILE_MAX
+    הקובץ מתאפס - גם זה שינוי בגודל שהמאזינים רואים.
+    """
+
+    name = 'file'
+
+    def __init__(self, path, poll_interval=CACHE_SIGNAL_POLL):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+
+    def _sequence(self):
+        """מונה האותות - גודל הקובץ בבתים; 0 אם עוד לא נוצר"""
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _broadcast(self):
+        if self._sequence() >= CACHE_SIGNAL_FILE_MAX:
+            os.truncate(self.path, 0)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, b'.')
+        finally:
+            os.close(fd)
+
+    def _listen(self):
+        seen = self._sequence()
+        self.connected = True
+        while True:
+            time.sleep(self.poll_interval)
+            sequence = self._sequence()
+            if sequence != seen:  # כולל השינויים של התהליך עצמו - ביטול כפול לא מזיק
+                seen = sequence
+                self.received += 1
+                self._notify()
+
+
+class PostgresSignal(ChangeSignal):
+    """אות דרך PostgreSQL LISTEN/NOTIFY - ההודעה מגיעה לכל התהליכים שמחוברים לאותו מסד"""
+
+    name = 'postgresql'
+
+    def __init__(self, connect, channel=CACHE_SIGNAL_CHANNEL):
+        """connect היא פונקציה שפותחת חיבור חדש למסד"""
+        super().__init__()
+        self.connect = connect
+        self.channel = channel
+        self._publish_conn = None
+        self._publish_lock = threading.Lock()
+
+    def _broadcast(self):
+        with self._publish_lock:
+            if self._publish_conn is None or self._publish_conn.closed:
+                self._publish_conn = self.connect()
+                self._publish_conn.autocommit = True
+            try:
+                with self._publish_conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, str(os.getpid())))
+            except Exception:
+                self._publish_conn.close()  # החיבור ייפתח מחדש בפעם הבאה
+                raise
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = self.connect()
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                self.connected = True
+                self._notify()  # ייתכן שפספסנו הודעות עד שההאזנה התחילה
+                while True:
+                    if select.select([conn], [], [], CACHE_SIGNAL_LISTEN_TIMEOUT) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        senders = {notify.payload for notify in conn.notifies}
+                        conn.notifies.clear()
+                        if senders != {str(os.getpid())}:  # התהליך עצמו כבר קיבל הודעה ב-publish
+                            self.received += 1
+                            self._notify()
+            except Exception as e:
+                self.connected = False
+                print(f"❌ שגיאה בהאזנה לשינויים ב-PostgreSQL: {e} - ניסיון חוזר בעוד {CACHE_SIGNAL_RETRY} שניות")
+                if conn is not None:
+                    conn.close()
+                time.sleep(CACHE_SIGNAL_RETRY)
+
+
+def create_signal(connect=None, path=None):
+    """האות המתאים - PostgreSQL אם יש connect, קובץ אם יש path, אחרת מקומי בלבד"""
+    if connect is not None and POSTGRESQL_AVAILABLE:
+        return PostgresSignal(connect)
+    if path is not None:
+        return FileSignal(path)
+    return ChangeSignal()
@@ -4,27 +4,350 @@ dbmodel.py - מודל מסד הנתונים למערכת ניהול תיק הש
 כאן מוגדרות כל הפונקציות לעבודה עם מסד הנתונים
 """
 
+import base64  # לקידוד סמן דפדוף ב-URL
+import json  # לקידוד סמן דפדוף ב-URL
 import os  # לעבודה עם משתני סביבה
 import sqlite3  # לעבודה עם SQLite
-import requests  # לבקשות HTTP למחירי מניות
+import threading  # לנעילות במאגר החיבורים
+import time  # למדידת זמני המתנה ובדיקות תקינות
+from collections import OrderedDict, deque  # סדר LRU ב-cache המחירים, תור חיבורים פנויים
+from concurrent.futures import ThreadPoolExecutor  # מחירים בודדים במקביל כגיבוי לבקשה המרוכזת
+from functools import partial  # קריאה ל-update_price עם פרמטר קבוע
+from decimal import Decimal  # ערכי DECIMAL מ-PostgreSQL
+from urllib.parse import urlparse  # לפירוק URL של מסד הנתונים
+from cachebackend import create_signal  # הודעה לשאר התהליכים על כל כתיבה
+from fxrates import FX_BASE_CURRENCY, fx_rates  # שערי מטבע להמרה בזמן קריאה
+from marketcalendar import is_market_open, quote_currency, scale_quote, seconds_until_open  # בורסה לכל סמל
+from quoteproviders import (  # ספקי מחירים ומכסת מפתחות
+    QUOTE_PROVIDER, YFINANCE_AVAILABLE, AlphaVantageProvider, ApiKeyPool, DeadlineExceeded, QuoteProvider,
+    QuoteProviderError, ReplayProvider, TokenBucket, YFinanceProvider, create_provider, deadline_passed
+)
 
 # קבועים
-USD_TO_ILS_RATE = 3.5  # שער המרה מדולר לשקל קבוע
+SECURITY_COLUMNS = ('name', 'symbol', 'amount', 'price', 'industry', 'variance', 'security_type')  # עמודות להוספה
+
+# גרסאות הסכמה - כל שינוי מבני חדש מתווסף כאן ומקבל מתודה _migration_<version> ב-PortfolioModel
+SCHEMA_MIGRATIONS = [
+    (1, "טבלאות משתמשים וניירות ערך"),
+    (2, "אינדקסים לפי סמל ושם"),
+    (3, "היסטוריית מחירים ונרות"),
+    (4, "מונה גרסת נתונים"),
+    (5, "עמודת variance_num מספרית"),
+    (6, "זמן עדכון מחיר אחרון"),
+    (7, "מטבע המחיר"),
+    (8, "ניקוי סמלים שהועתקו מהשם"),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]  # הגרסה שהקוד מצפה לה
+SCHEMA_MIGRATION_LOCK_ID = 804212  # מזהה advisory lock ב-PostgreSQL - migration אחד בכל פעם
+
+# רמת סיכון לכל ענף (1 נמוך עד 6 גבוה) - ענף שלא מופיע מקבל DEFAULT_RISK_LEVEL
+INDUSTRY_RISK_LEVELS = {
+    'טכנולוגיה': 6, 'תחבורה': 5, 'אנרגיה': 4,
+    'בריאות': 4, 'תעשייה': 3, 'פיננסים': 3,
+    'נדלן': 2, 'צריכה פרטית': 1
+}
+DEFAULT_RISK_LEVEL = 3
+HIGH_RISK_LEVEL = 5  # מרמה זו ומעלה - סיכון גבוה
+MEDIUM_RISK_LEVEL = 3  # מרמה זו ומעלה - סיכון בינוני
+
+# אפשרויות מיון לדף התיק - ביטוי SQL לכל אפשרות (COALESCE כדי ש-NULL לא ישבור דפדוף לפי סמן)
+PAGE_SORT_OPTIONS = {
+    'name': "name",  # לפי שם
+    'value': "COALESCE({price}, 0) * COALESCE(amount, 0)",  # לפי שווי ההחזקה ({price} - המחיר בשקלים)
+    'industry': "COALESCE(industry, '')",  # לפי ענף
+}
+
+# הגדרות מאגר החיבורים - ניתן לשנות דרך משתני סביבה
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))  # חיבורים שנפתחים מראש
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))  # מקסימום חיבורים פתוחים
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))  # שניות המתנה לחיבור פנוי
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30))  # שניות לפני בדיקת תקינות
+
+# פרופיל ביצועים ל-SQLite (אופציונלי) - WAL, pragmas וחיבור כתיבה יחיד
+SQLITE_PERFORMANCE_PROFILE = os.environ.get('SQLITE_PERFORMANCE_PROFILE', '').lower() in ('1', 'true', 'yes', 'on')
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # בתים למיפוי זיכרון
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))  # גודל cache לכל חיבור
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))  # המתנה לנעילה לפני שגיאה
+
+# היסטוריית מחירים - רזולוציות הצבירה (בשניות) ותקופות שמירה (בשניות, None - לתמיד)
+PRICE_BAR_RESOLUTIONS = {'1m': 60, '1d': 86400}
+PRICE_RETENTION = {
+    'raw': int(os.environ.get('PRICE_RAW_RETENTION_DAYS', 7)) * 86400,  # מחירים גולמיים
+    '1m': int(os.environ.get('PRICE_MINUTE_RETENTION_DAYS', 90)) * 86400,  # נרות דקה
+    '1d': None,  # נרות יומיים נשמרים תמיד
+}
+PRICE_RETENTION_CHECK_INTERVAL = 3600  # שניות בין הפעלות ניקוי אוטומטיות
+
+# cache מחירים לפני ה-API - ניתן לשנות דרך משתני סביבה
+QUOTE_CACHE_TTL = float(os.environ.get('QUOTE_CACHE_TTL', 60))  # שניות שמחיר נחשב טרי
+QUOTE_CACHE_MAX_SIZE = int(os.environ.get('QUOTE_CACHE_MAX_SIZE', 1024))  # מקסימום סמלים ב-cache
+
+# מפסק (circuit breaker) לספק המחירים - ניתן לשנות דרך משתני סביבה
+QUOTE_BREAKER_FAILURES = int(os.environ.get('QUOTE_BREAKER_FAILURES', 5))  # שגיאות רצופות עד שהמפסק נפתח
+QUOTE_BREAKER_RESET = float(os.environ.get('QUOTE_BREAKER_RESET', 30))  # שניות עד בקשת ניסיון אחרי פתיחה
 
 # בדיקת PostgreSQL - האם הספרייה מותקנת
 try:
     import psycopg2  # ספרייה לחיבור PostgreSQL
+    import psycopg2.extras  # execute_values לכתיבה מרוכזת
     POSTGRESQL_AVAILABLE = True  # PostgreSQL זמין
 except ImportError:
     POSTGRESQL_AVAILABLE = False  # PostgreSQL לא זמין
 
+# בדיקת NumPy - אופציונלי, רק לשליפה כמערך לניתוחים
+try:
+    import numpy as np  # מערכים מובנים לחישובים על כל התיק
+    NUMPY_AVAILABLE = True  # NumPy זמין
+except ImportError:
+    NUMPY_AVAILABLE = False  # NumPy לא זמין
+
+
+class PoolTimeoutError(Exception):
+    """נזרקת כשאין חיבור פנוי במאגר בתוך זמן ההמתנה"""
+
+
+class PooledConnection:
+    """עטיפה לחיבור מהמאגר - close() מחזיר את החיבור למאגר במקום לסגור אותו"""
+    
+    def __init__(self, pool, conn):
+        self._pool = pool  # המאגר שממנו נלקח החיבור
+        self._conn = conn  # החיבור האמיתי
+    
+    def __getattr__(self, name):
+        """העברת כל שאר הפעולות (cursor, commit, rollback) לחיבור האמיתי"""
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("החיבור כבר הוחזר למאגר")
+        return getattr(self._conn, name)
+    
+    def close(self):
+        """החזרת החיבור למאגר - קריאה נוספת לא עושה כלום"""
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+    
+    def __del__(self):
+        # אם מישהו שכח לסגור - לא מאבדים את המקום במאגר
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """מאגר חיבורים בטוח לתהליכונים - חוסך פתיחת חיבור חדש בכל שאילתה"""
+    
+    def __init__(self, connect, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL):
+        self._connect = connect  # פונקציה שיוצרת חיבור חדש
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        
+        self._idle = deque()  # חיבורים פנויים: (חיבור, זמן שימוש אחרון)
+        self._size = 0  # סה"כ חיבורים פתוחים (פנויים + בשימוש)
+        self._cond = threading.Condition()  # נעילה + המתנה לחיבור פנוי
+        self._stats = {
+            'created': 0,  # חיבורים שנפתחו
+            'reused': 0,  # פעמים שחיבור קיים שומש מחדש
+            'discarded': 0,  # חיבורים שנזרקו כי היו תקולים
+            'health_checks': 0,  # בדיקות תקינות שבוצעו
+            'waits': 0,  # פעמים שהמתנו לחיבור פנוי
+            'timeouts': 0,  # פעמים שנגמר זמן ההמתנה
+        }
+        
+        # פתיחת חיבורים מראש - אם נכשל ממשיכים, החיבור ייפתח בבקשה הראשונה
+        for _ in range(self.min_size):
+            try:
+                conn = self._connect()
+            except Exception as e:
+                print(f"⚠️ לא הצלחתי לפתוח חיבור מראש למאגר: {e}")
+                break
+            with self._cond:
+                self._size += 1
+                self._stats['created'] += 1
+                self._idle.append((conn, time.monotonic()))
+    
+    def acquire(self):
+        """קבלת חיבור מהמאגר - ממתין עד timeout אם כל החיבורים תפוסים"""
+        deadline = time.monotonic() + self.timeout
+        conn = None
+        last_used = None
+        
+        with self._cond:
+            while True:
+                if self._idle:  # יש חיבור פנוי - לוקחים את האחרון (הכי "חם")
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:  # מותר לפתוח חיבור חדש
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(f"אין חיבור פנוי במאגר אחרי {self.timeout} שניות")
+                self._stats['waits'] += 1
+                self._cond.wait(remaining)
+        
+        # פתיחה ובדיקת תקינות מתבצעות מחוץ לנעילה כדי לא לחסום תהליכונים אחרים
+        if conn is not None and time.monotonic() - last_used > self.health_check_interval:
+            if not self._is_healthy(conn):
+                self._discard(conn, reserve=True)
+                conn = None
+        
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1  # משחררים את המקום ששמרנו
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['created'] += 1
+        else:
+            with self._cond:
+                self._stats['reused'] += 1
+        
+        return PooledConnection(self, conn)
+    
+    def release(self, conn):
+        """החזרת חיבור למאגר - טרנזקציה פתוחה מבוטלת לפני שחיבור אחר ישתמש בו"""
+        if getattr(conn, 'closed', 0):  # חיבור PostgreSQL שנסגר בצד השרת
+            self._discard(conn)
+            return
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def _is_healthy(self, conn):
+        """בדיקת תקינות - שאילתה קטנה על חיבור שלא היה בשימוש זמן מה"""
+        with self._cond:
+            self._stats['health_checks'] += 1
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            print(f"⚠️ חיבור במאגר נכשל בבדיקת תקינות: {e}")
+            return False
+    
+    def _discard(self, conn, reserve=False):
+        """סגירת חיבור תקול - reserve שומר את המקום שלו לחיבור חדש שייפתח מיד"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['discarded'] += 1
+            if not reserve:
+                self._size -= 1
+                self._cond.notify()
+    
+    def close_all(self):
+        """סגירת כל החיבורים הפנויים - לשימוש בסיום התוכנית"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+    
+    def get_stats(self):
+        """סטטיסטיקות המאגר - גודל, חיבורים בשימוש ומונים"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'timeout': self.timeout,
+            })
+        return stats
+
+
+class SecurityRow:
+    """נייר ערך אחד מהמסד - אובייקט קומפקטי עם שדות מספריים כ-float
+    
+    price הוא בשקלים לפי שער המטבע הנוכחי; native_price ו-currency הם המחיר כפי שנשמר.
+    
+    __slots__ חוסך את ה-dictionary של כל שורה, והמספרים מומרים פעם אחת בשליפה
+    (ב-PostgreSQL מגיעים כ-Decimal). תומך גם בגישה כמו dictionary - security['price'],
+    security.get('industry') - כדי שהתבניות והקוד הקיים ימשיכו לעבוד.
+    """
+    
+    __slots__ = ('id', 'name', 'symbol', 'amount', 'price', 'industry', 'variance', 'security_type',
+                 'currency', 'native_price', 'price_updated_at')
+    
+    def __init__(self, id, name, symbol, amount, price, industry, variance, security_type,
+                 currency=FX_BASE_CURRENCY, native_price=None, price_updated_at=None):
+        self.id = id
+        self.name = name
+        self.symbol = symbol
+        self.amount = float(amount) if amount is not None else 0.0
+        self.price = float(price) if price is not None else 0.0
+        self.industry = industry
+        self.variance = float(variance) if variance is not None else None  # מ-variance_num
+        self.security_type = security_type
+        self.currency = currency or FX_BASE_CURRENCY  # המטבע שבו המחיר נשמר במסד
+        self.native_price = float(native_price) if native_price is not None else self.price  # לפני המרה
+        self.price_updated_at = price_updated_at  # שניות epoch, None אם לא עודכן מה-API
+    
+    @property
+    def value(self):
+        """שווי ההחזקה - מחיר כפול כמות"""
+        return self.price * self.amount
+    
+    def __getitem__(self, key):
+        if key == 'value' or key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+    
+    def get(self, key, default=None):
+        """כמו dict.get"""
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+    
+    def keys(self):
+        """שמות השדות - מאפשר dict(row)"""
+        return self.__slots__
+    
+    def to_dict(self):
+        """המרה ל-dictionary - למשל לפני jsonify"""
+        return {key: getattr(self, key) for key in self.__slots__}
+    
+    def __repr__(self):
+        return f"SecurityRow(id={self.id!r}, name={self.name!r}, price={self.price!r}, amount={self.amount!r})"
+
 
 class PortfolioModel:
     """מודל מסד הנתונים לניהול תיק השקעות - תומך PostgreSQL ו-SQLite"""
     
-    def __init__(self):
-        """אתחול מסד נתונים - PostgreSQL לשרת או SQLite למקומי"""
-        self.db_path = "investments.db"  # נתיב קובץ SQLite מקומי
+    def __init__(self, db_path="investments.db", pool_min_size=DB_POOL_MIN_SIZE,
+                 pool_max_size=DB_POOL_MAX_SIZE, pool_timeout=DB_POOL_TIMEOUT,
+                 sqlite_profile=None):
+        """אתחול מסד נתונים - PostgreSQL לשרת או SQLite למקומי
+        
+        sqlite_profile מפעיל את פרופיל הביצועים של SQLite (None - לפי SQLITE_PERFORMANCE_PROFILE).
+        """
+        self.db_path = db_path  # נתיב קובץ SQLite מקומי
         
         # קבלת URL מסד נתונים מהסביבה (לשרת)
         database_url = os.environ.get('DATABASE_URL')
@@ -32,47 +355,174 @@ class PortfolioModel:
         if database_url:  # אם יש URL - עובדים עם PostgreSQL בשרת
             self.use_postgresql = True
             self.database_url = database_url
+            # פירוק ה-URL פעם אחת בלבד - לא בכל חיבור
+            result = urlparse(database_url)
+            self._pg_params = {
+                'database': result.path[1:],  # שם מסד הנתונים (ללא /)
+                'user': result.username,  # שם משתמש
+                'password': result.password,  # סיסמה
+                'host': result.hostname,  # כתובת שרת
+                'port': result.port  # פורט
+            }
         else:  # אחרת עובדים עם SQLite במחשב המקומי
             self.use_postgresql = False
+            self.database_url = None
+        
+        self._symbol_ids = {}  # cache של סמל -> מזהה בטבלת symbols
+        
+        # אות שינוי אחרי כל כתיבה לניירות ערך - NOTIFY ב-PostgreSQL, קובץ ליד מסד SQLite
+        self.change_signal = create_signal(
+            connect=partial(psycopg2.connect, **self._pg_params) if self.use_postgresql else None,
+            path=None if self.use_postgresql else f"{db_path}.changed"
+        )
+        self._last_retention_run = time.time()  # ניקוי ההיסטוריה הבא - בעוד שעה
+        
+        if sqlite_profile is None:
+            sqlite_profile = SQLITE_PERFORMANCE_PROFILE
+        self.sqlite_profile = sqlite_profile and not self.use_postgresql
+        
+        # מאגר חיבורים - כל המתודות מקבלות ממנו חיבור ומחזירות אותו ב-close()
+        self.pool = ConnectionPool(
+            self._create_connection,
+            min_size=pool_min_size,
+            max_size=pool_max_size,
+            timeout=pool_timeout
+        )
+        
+        # בפרופיל הביצועים - חיבור כתיבה יחיד; כותבים ממתינים בתור שלו
+        # במקום להתחרות על נעילת הקובץ, וקוראים ב-WAL לא נחסמים בכלל
+        self.write_pool = None
+        if self.sqlite_profile:
+            self.write_pool = ConnectionPool(
+                self._create_connection,
+                min_size=1,
+                max_size=1,
+                timeout=max(pool_timeout, SQLITE_BUSY_TIMEOUT_MS / 1000)
+            )
         
         self.init_db()  # אתחול טבלאות במסד הנתונים
     
+    def _create_connection(self):
+        """פתיחת חיבור חדש למסד הנתונים - נקרא רק על ידי מאגר החיבורים"""
+        if self.use_postgresql:  # התחבר ל-PostgreSQL עם הפרמטרים מה-URL
+            return psycopg2.connect(**self._pg_params)
+        
+        # check_same_thread=False - החיבור עובר בין תהליכונים דרך המאגר
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # החזר תוצאות כ-dictionary
+        if self.sqlite_profile:
+            self._apply_sqlite_profile(conn)
+        return conn
+    
+    @staticmethod
+    def _apply_sqlite_profile(conn):
+        """הגדרות ביצועים לחיבור SQLite - WAL כדי שכתיבה לא תחסום קריאה"""
+        conn.execute("PRAGMA journal_mode=WAL")  # קוראים רואים snapshot בזמן כתיבה
+        conn.execute("PRAGMA synchronous=NORMAL")  # ב-WAL בטוח ומהיר בהרבה מ-FULL
+        conn.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")  # קריאה דרך מיפוי זיכרון
+        conn.execute(f"PRAGMA cache_size=-{int(SQLITE_CACHE_SIZE_KB)}")  # ערך שלילי = KiB
+        conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")  # המתנה לנעילה במקום שגיאה
+        conn.execute("PRAGMA temp_store=MEMORY")  # טבלאות זמניות למיון בזיכרון
+    
+    def get_write_connection(self):
+        """חיבור לכתיבה - בפרופיל הביצועים של SQLite זה חיבור הכתיבה היחיד, אחרת חיבור רגיל"""
+        if self.write_pool is None:
+            return self.get_connection()
+        try:
+            return self.write_pool.acquire()
+        except Exception as e:
+            print(f"❌ שגיאה בקבלת חיבור כתיבה ל-SQLite: {e}")
+            return None
+    
     def get_connection(self):
-        """יצירת חיבור למסד הנתונים - PostgreSQL או SQLite"""
-        if self.use_postgresql:  # אם עובדים עם PostgreSQL
-            try:
-                from urllib.parse import urlparse  # לפירוק URL
-                result = urlparse(self.database_url)  # פרק את ה-URL
-                
-                # התחבר ל-PostgreSQL עם הפרמטרים מה-URL
-                conn = psycopg2.connect(
-                    database=result.path[1:],  # שם מסד הנתונים (ללא /)
-                    user=result.username,  # שם משתמש
-                    password=result.password,  # סיסמה
-                    host=result.hostname,  # כתובת שרת
-                    port=result.port  # פורט
-                )
-                return conn
-            except Exception as e:
+        """קבלת חיבור מהמאגר - PostgreSQL או SQLite (close() מחזיר אותו למאגר)"""
+        try:
+            return self.pool.acquire()
+        except Exception as e:
+            if self.use_postgresql:
                 print(f"❌ שגיאה בחיבור ל-PostgreSQL: {e}")
-                return None
-        else:  # אם עובדים עם SQLite
-            try:
-                conn = sqlite3.connect(self.db_path)  # התחבר לקובץ SQLite
-                conn.row_factory = sqlite3.Row  # החזר תוצאות כ-dictionary
-                return conn
-            except Exception as e:
+            else:
                 print(f"❌ שגיאה בחיבור ל-SQLite: {e}")
-                return None
+            return None
+    
+    def get_pool_stats(self):
+        """סטטיסטיקות מאגר החיבורים - לדפי ניהול ובדיקות עומס"""
+        stats = self.pool.get_stats()
+        if self.write_pool is not None:
+            stats['writer'] = self.write_pool.get_stats()
+        return stats
     
     def init_db(self):
-        """יצירת טבלאות במסד הנתונים - משתמשים וניירות ערך"""
-        conn = self.get_connection()  # קבל חיבור למסד
+        """הבאת הסכמה לגרסה העדכנית - בדיקת גרסה אחת, ו-DDL רק אם יש migrations שלא רצו"""
+        conn = self.get_write_connection()  # קבל חיבור למסד
         if not conn:  # אם אין חיבור
             return
         
         cursor = conn.cursor()  # יצר cursor לביצוע פקודות SQL
+        try:
+            current_version = self._get_schema_version(cursor)
+            if current_version >= SCHEMA_VERSION:  # המצב הנפוץ - אין מה לעשות
+                return
+            
+            for version, description in SCHEMA_MIGRATIONS:
+                if version <= current_version:
+                    continue
+                self._run_migration(conn, cursor, version, description)
+        except Exception as e:
+            conn.rollback()  # בטל migration שנכשל באמצע
+            print(f"❌ שגיאה בעדכון סכמת מסד הנתונים: {e}")
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # סגור חיבור
+    
+    def create_tables(self):
+        """אליאס למתודה init_db - יצירת טבלאות במסד הנתונים"""
+        return self.init_db()
+    
+    def _get_schema_version(self, cursor):
+        """גרסת הסכמה שהותקנה - 0 אם טבלת schema_version עוד לא קיימת"""
+        try:
+            cursor.execute("SELECT MAX(version) FROM schema_version")
+            row = cursor.fetchone()
+            return row[0] or 0
+        except Exception:
+            cursor.connection.rollback()  # ב-PostgreSQL שגיאה משאירה את הטרנזקציה שבורה
+            return 0
+    
+    def _run_migration(self, conn, cursor, version, description):
+        """הרצת migration אחד בטרנזקציה משלו - כולל רישום הגרסה
+        
+        נעילה לפני הבדיקה החוזרת: אם שני תהליכים עולים יחד, השני ימתין
+        ואז יראה שהגרסה כבר קיימת וידלג.
+        """
+        if self.use_postgresql:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_MIGRATION_LOCK_ID,))
+        else:
+            cursor.execute("BEGIN IMMEDIATE")  # ב-SQLite DDL לא פותח טרנזקציה לבד
         
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR(200),
+                applied_at BIGINT NOT NULL
+            )
+        """)
+        placeholder = '%s' if self.use_postgresql else '?'
+        cursor.execute(f"SELECT 1 FROM schema_version WHERE version = {placeholder}", (version,))
+        if cursor.fetchone():  # תהליך אחר כבר הריץ אותו
+            conn.commit()
+            return
+        
+        getattr(self, f"_migration_{version}")(cursor)
+        cursor.execute(
+            f"INSERT INTO schema_version (version, description, applied_at) VALUES ({placeholder}, {placeholder}, {placeholder})",
+            (version, description, int(time.time()))
+        )
+        conn.commit()  # שמור שינויים
+        print(f"✅ migration {version}: {description}")
+    
+    def _migration_1(self, cursor):
+        """טבלאות הבסיס - משתמשים וניירות ערך (IF NOT EXISTS - מסדים קיימים לא נפגעים)"""
         if self.use_postgresql:  # אם PostgreSQL
             # יצירת טבלת משתמשים עם PostgreSQL syntax
             cursor.execute("""
@@ -121,18 +571,129 @@ class PortfolioModel:
                     security_type TEXT
                 )
             """)
+    
+    def _migration_2(self, cursor):
+        """אינדקסים לחיפוש לפי סמל ושם - בלעדיהם כל עדכון מחיר סורק את כל הטבלה"""
+        # (לא ייחודיים - אותו סמל יכול להופיע בכמה שורות בתיק)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_securities_symbol ON securities (symbol)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_securities_name ON securities (name)")
+    
+    def _migration_3(self, cursor):
+        """טבלאות היסטוריית המחירים - סמל כמספר, זמן כשניות epoch; המפתח הראשי הוא האינדקס לטווחים"""
+        if self.use_postgresql:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS symbols (
+                    id SERIAL PRIMARY KEY,
+                    symbol VARCHAR(20) UNIQUE NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS price_history (
+                    symbol_id INTEGER NOT NULL,
+                    ts BIGINT NOT NULL,
+                    price DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY (symbol_id, ts)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS price_bars (
+                    symbol_id INTEGER NOT NULL,
+                    resolution INTEGER NOT NULL,
+                    bucket_ts BIGINT NOT NULL,
+                    open DOUBLE PRECISION NOT NULL,
+                    high DOUBLE PRECISION NOT NULL,
+                    low DOUBLE PRECISION NOT NULL,
+                    close DOUBLE PRECISION NOT NULL,
+                    samples INTEGER NOT NULL DEFAULT 1,
+                    PRIMARY KEY (symbol_id, resolution, bucket_ts)
+                )
+            """)
+        else:  # SQLite - WITHOUT ROWID שומר את השורות ממוינות לפי המפתח, בלי אינדקס נוסף
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS symbols (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    symbol TEXT UNIQUE NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS price_history (
+                    symbol_id INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    price REAL NOT NULL,
+                    PRIMARY KEY (symbol_id, ts)
+                ) WITHOUT ROWID
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS price_bars (
+                    symbol_id INTEGER NOT NULL,
+                    resolution INTEGER NOT NULL,
+                    bucket_ts INTEGER NOT NULL,
+                    open REAL NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    samples INTEGER NOT NULL DEFAULT 1,
+                    PRIMARY KEY (symbol_id, resolution, bucket_ts)
+                ) WITHOUT ROWID
+            """)
+    
+    def _migration_4(self, cursor):
+        """מונה גרסה לטבלת ניירות הערך - עולה בכל כתיבה, משמש לביטול cache מדויק"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_version (
+                name VARCHAR(50) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT INTO data_version (name, version) VALUES ('securities', 0) ON CONFLICT (name) DO NOTHING")
+    
+    def _migration_5(self, cursor):
+        """עמודת variance_num מספרית לצד variance הטקסטואלית (שלב expand)
         
-        conn.commit()  # שמור שינויים
-        cursor.close()  # סגור cursor
-        conn.close()  # סגור חיבור
+        העמודה מתווספת כ-NULL - בלי נעילה ארוכה ובלי העתקת הטבלה. הכתיבות ממלאות
+        את שתי העמודות, והשורות הקיימות מומרות כאן. הסרת variance הישנה תהיה
+        migration נפרד אחרי שכל הקוראים עברו לעמודה החדשה.
+        """
+        column_type = 'DOUBLE PRECISION' if self.use_postgresql else 'REAL'
+        cursor.execute(f"ALTER TABLE securities ADD COLUMN variance_num {column_type}")
+        
+        cursor.execute("SELECT id, variance FROM securities WHERE variance IS NOT NULL")
+        backfill = [(self._parse_variance(variance), security_id) for security_id, variance in cursor.fetchall()]
+        backfill = [row for row in backfill if row[0] is not None]  # ערכים כמו 'נמוך' נשארים NULL
+        placeholder = '%s' if self.use_postgresql else '?'
+        cursor.executemany(f"UPDATE securities SET variance_num = {placeholder} WHERE id = {placeholder}", backfill)
     
-    def create_tables(self):
-        """אליאס למתודה init_db - יצירת טבלאות במסד הנתונים"""
-        return self.init_db()
+    def _migration_6(self, cursor):
+        """עמודת price_updated_at (שניות epoch) - מתי המחיר עודכן לאחרונה, לעדכון ברקע לפי ותק"""
+        column_type = 'BIGINT' if self.use_postgresql else 'INTEGER'
+        cursor.execute(f"ALTER TABLE securities ADD COLUMN price_updated_at {column_type}")
+    
+    def _migration_7(self, cursor):
+        """עמודת currency - המחיר נשמר במטבע המקורי ומומר לשקלים בזמן קריאה
+        
+        כל המחירים הקיימים כבר הומרו לשקלים בזמן הכתיבה, ולכן ברירת המחדל היא ILS.
+        """
+        cursor.execute(f"ALTER TABLE securities ADD COLUMN currency VARCHAR(3) NOT NULL DEFAULT '{FX_BASE_CURRENCY}'")
+    
+    def _migration_8(self, cursor):
+        """ניקוי סמלים שהועתקו משם נייר הערך - שם אינו סמל מסחר ונשלח לשווא ל-API
+        
+        ניירות ערך שנוספו בלי בחירה מהרשימה קיבלו את השם בעמודת הסמל. הם מקבלים
+        NULL, כמו ניירות ערך חדשים בלי סמל, ולא נבחרים לעדכון מחירים.
+        """
+        cursor.execute("UPDATE securities SET symbol = NULL WHERE symbol = name")
+    
+    @staticmethod
+    def _parse_variance(variance):
+        """המרת סטיית תקן למספר - None אם הערך לא מספרי"""
+        try:
+            return float(variance) if variance is not None else None
+        except (TypeError, ValueError):
+            return None
     
     def create_default_users(self):
         """יצירת משתמשי ברירת מחדל - admin ו-user"""
-        conn = self.get_connection()  # קבל חיבור
+        conn = self.get_write_connection()  # קבל חיבור
         if not conn:
             return
         
@@ -224,9 +785,10 @@ class PortfolioModel:
         conn.close()  # סגור חיבור
         return user_dict  # החזר את נתוני המשתמש
     
-    def add_security(self, name, symbol, amount, price, industry, variance, security_type):
-        """הוספת נייר ערך למסד הנתונים"""
-        conn = self.get_connection()  # קבל חיבור למסד
+    def add_security(self, name, symbol, amount, price, industry, variance, security_type,
+                     currency=FX_BASE_CURRENCY):
+        """הוספת נייר ערך למסד הנתונים - price במטבע currency"""
+        conn = self.get_write_connection()  # קבל חיבור למסד
         if not conn:
             return False
         
@@ -234,16 +796,21 @@ class PortfolioModel:
         try:
             if self.use_postgresql:  # PostgreSQL syntax
                 cursor.execute("""
-                    INSERT INTO securities (name, symbol, amount, price, industry, variance, security_type)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (name, symbol, amount, price, industry, variance, security_type))
+                    INSERT INTO securities (name, symbol, amount, price, industry, variance, security_type,
+                                            variance_num, currency)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (name, symbol, amount, price, industry, variance, security_type,
+                      self._parse_variance(variance), currency))
             else:  # SQLite syntax
                 cursor.execute("""
-                    INSERT INTO securities (name, symbol, amount, price, industry, variance, security_type)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (name, symbol, amount, price, industry, variance, security_type))
+                    INSERT INTO securities (name, symbol, amount, price, industry, variance, security_type,
+                                            variance_num, currency)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (name, symbol, amount, price, industry, variance, security_type,
+                      self._parse_variance(variance), currency))
             
-            conn.commit()  # שמור שינויים
+            self._bump_data_version(cursor)
+            self._commit_data_change(conn)  # שמור שינויים והודעה לשאר התהליכים
             return True  # הצלחה
         except Exception as e:
             print(f"❌ שגיאה בהוספת נייר ערך: {e}")
@@ -253,30 +820,405 @@ class PortfolioModel:
             conn.close()  # סגור חיבור
     
     def get_all_securities(self):
-        """קבלת כל ניירות הערך מהתיק - ממוין לפי שם"""
+        """קבלת כל ניירות הערך מהתיק - ממוין לפי שם, כרשימת SecurityRow"""
         conn = self.get_connection()  # קבל חיבור למסד
         if not conn:
             return []  # רשימה ריקה אם אין חיבור
         
         cursor = conn.cursor()  # יצר cursor
-        cursor.execute("SELECT * FROM securities ORDER BY name")  # שאילתה ממוינת
-        securities = cursor.fetchall()  # קבל את כל התוצאות
-        
-        if securities:  # אם יש תוצאות
-            if self.use_postgresql:  # המר ל-dictionary list ב-PostgreSQL
-                securities_list = [dict(zip([desc[0] for desc in cursor.description], row)) for row in securities]
-            else:  # ב-SQLite זה כבר dictionary list
-                securities_list = [dict(row) for row in securities]
-        else:
-            securities_list = []  # רשימה ריקה אם אין תוצאות
+        try:
+            # עמודות מפורשות בסדר של SecurityRow - variance המספרית במקום הטקסט, מחיר בשקלים
+            cursor.execute(f"""
+                SELECT id, name, symbol, amount, {self._price_sql()}, industry, variance_num, security_type,
+                       currency, price, price_updated_at
+                FROM securities ORDER BY name
+            """)
+            return [SecurityRow(*row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # סגור חיבור
+    
+    def get_securities_array(self):
+        """כל ניירות הערך כמערך NumPy מובנה - לניתוחים על כל התיק בלי אובייקט לשורה
         
-        cursor.close()  # סגור cursor
-        conn.close()  # סגור חיבור
-        return securities_list  # החזר את הרשימה
+        שדות: id, symbol, industry, amount, price (בשקלים), variance (NaN אם חסר), value.
+        מחזיר None אם NumPy לא מותקן.
+        """
+        if not NUMPY_AVAILABLE:
+            print("❌ NumPy לא מותקן - לא ניתן לשלוף כמערך")
+            return None
+        
+        conn = self.get_connection()  # קבל חיבור למסד
+        if not conn:
+            return None
+        
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            cursor.execute(f"""
+                SELECT id, symbol, industry, COALESCE(amount, 0), COALESCE({self._price_sql()}, 0), variance_num
+                FROM securities ORDER BY id
+            """)
+            nan = float('nan')
+            dtype = np.dtype([
+                ('id', 'i8'), ('symbol', 'U16'), ('industry', 'U50'),
+                ('amount', 'f8'), ('price', 'f8'), ('variance', 'f8'), ('value', 'f8'),
+            ])
+            # השורות נכתבות ישר למערך - בלי רשימת ביניים
+            array = np.fromiter(
+                ((row[0], row[1] or '', row[2] or '', row[3], row[4],
+                  nan if row[5] is None else row[5], 0.0) for row in cursor),
+                dtype=dtype
+            )
+            array['value'] = array['price'] * array['amount']  # חישוב וקטורי
+            return array
+        except Exception as e:
+            print(f"❌ שגיאה בשליפת ניירות ערך כמערך: {e}")
+            return None
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    @staticmethod
+    def _bump_data_version(cursor):
+        """העלאת גרסת הנתונים - נקרא בתוך טרנזקציית הכתיבה, לפני ה-commit"""
+        cursor.execute("UPDATE data_version SET version = version + 1 WHERE name = 'securities'")
+    
+    def _commit_data_change(self, conn, changed=True):
+        """commit של כתיבה לניירות ערך - ואם משהו השתנה, אות לכל התהליכים שה-cache שלהם ישן"""
+        conn.commit()
+        if changed:
+            self.change_signal.publish()
+    
+    def get_data_version(self):
+        """גרסת הנתונים הנוכחית של ניירות הערך - None אם לא ניתן לקרוא"""
+        conn = self.get_connection()  # קבל חיבור מהמאגר
+        if not conn:
+            return None
+        
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            cursor.execute("SELECT version FROM data_version WHERE name = 'securities'")
+            row = cursor.fetchone()
+            return int(row[0]) if row else None
+        except Exception as e:
+            print(f"❌ שגיאה בקריאת גרסת הנתונים: {e}")
+            return None
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    def clear_securities(self):
+        """מחיקת כל ניירות הערך - מחזיר כמה שורות נמחקו, או None בשגיאה"""
+        conn = self.get_write_connection()  # קבל חיבור כתיבה
+        if not conn:
+            return None
+        
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            cursor.execute("DELETE FROM securities")
+            deleted = cursor.rowcount
+            self._bump_data_version(cursor)
+            self._commit_data_change(conn)  # שמור שינויים והודעה לשאר התהליכים
+            return deleted
+        except Exception as e:
+            print(f"❌ שגיאה בניקוי טבלת ניירות ערך: {e}")
+            return None
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    def _rows_to_dicts(self, cursor, rows):
+        """המרת שורות תוצאה לרשימת dictionaries - בשני סוגי המסדים"""
+        if self.use_postgresql:  # ב-PostgreSQL שורות הן tuples, ו-DECIMAL מגיע כ-Decimal
+            columns = [desc[0] for desc in cursor.description]
+            return [
+                {column: float(value) if isinstance(value, Decimal) else value
+                 for column, value in zip(columns, row)}
+                for row in rows
+            ]
+        return [dict(row) for row in rows]  # ב-SQLite יש sqlite3.Row
+    
+    def get_securities_page(self, page=1, per_page=20, sort='name', descending=False, after=None):
+        """עמוד אחד של ניירות ערך - LIMIT/OFFSET או דפדוף לפי סמן (keyset)
+        
+        sort הוא אחד מ-PAGE_SORT_OPTIONS. אם after (סמן מ-next_cursor של העמוד הקודם)
+        ניתן, העמוד מתחיל מיד אחרי השורה שלו בלי OFFSET - מהיר גם בעמודים עמוקים.
+        מחזיר dictionary עם items, total, total_value, total_pages ו-next_cursor.
+        """
+        sort_expression = PAGE_SORT_OPTIONS.get(sort)
+        if sort_expression is None:  # הביטוי נכנס ל-SQL - רק ערכים מוכרים
+            raise ValueError(f"אפשרות מיון לא נתמכת: {sort}")
+        price_sql = self._price_sql()
+        sort_expression = sort_expression.format(price=price_sql)
+        
+        page = max(1, int(page))
+        per_page = max(1, int(per_page))
+        result = {
+            'items': [], 'total': 0, 'total_value': 0, 'page': page,
+            'per_page': per_page, 'total_pages': 0, 'next_cursor': None
+        }
+        
+        conn = self.get_connection()  # קבל חיבור מהמאגר
+        if not conn:
+            return result
+        
+        placeholder = '%s' if self.use_postgresql else '?'
+        direction = 'DESC' if descending else 'ASC'
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            # ספירה וסכום בשאילתה אחת - שורה אחת חוזרת, לא כל הטבלה
+            cursor.execute(f"SELECT COUNT(*), COALESCE(SUM({price_sql} * amount), 0) FROM securities")
+            total, total_value = cursor.fetchone()
+            result['total'] = total
+            result['total_value'] = float(total_value)
+            result['total_pages'] = (total + per_page - 1) // per_page
+            
+            query = f"SELECT *, {price_sql} AS price_local, {sort_expression} AS sort_key FROM securities"
+            params = []
+            if after is not None:  # keyset - ממשיכים אחרי (ערך מיון, id) של השורה האחרונה
+                comparison = '<' if descending else '>'
+                query += f" WHERE ({sort_expression}, id) {comparison} ({placeholder}, {placeholder})"
+                params.extend(after)
+            query += f" ORDER BY {sort_expression} {direction}, id {direction} LIMIT {placeholder}"
+            params.append(per_page)
+            if after is None:  # דפדוף רגיל לפי מספר עמוד
+                query += f" OFFSET {placeholder}"
+                params.append((page - 1) * per_page)
+            
+            cursor.execute(query, params)
+            items = self._localize_prices(self._rows_to_dicts(cursor, cursor.fetchall()))
+            
+            sort_keys = [item.pop('sort_key') for item in items]
+            for item in items:
+                item['value'] = (item['price'] or 0) * (item['amount'] or 0)
+            
+            result['items'] = items
+            if len(items) == per_page:  # ייתכן שיש עמוד נוסף
+                last_sort_key = sort_keys[-1]
+                if not isinstance(last_sort_key, (str, int, float)):
+                    last_sort_key = float(last_sort_key)  # Decimal של PostgreSQL ל-JSON
+                result['next_cursor'] = (last_sort_key, items[-1]['id'])
+            return result
+        except Exception as e:
+            print(f"❌ שגיאה בטעינת עמוד ניירות ערך: {e}")
+            return result
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    @staticmethod
+    def _price_sql():
+        """ביטוי SQL למחיר בשקלים - המרה של כל השורות בשאילתה עצמה לפי טבלת השערים
+        
+        השערים נכנסים כמספרים (וקודי המטבע נבדקו ב-fxrates), כך ששינוי שער לא דורש
+        לכתוב מחדש אף שורה. מטבע לא מוכר נשאר בלי המרה.
+        """
+        cases = [f"WHEN '{currency}' THEN {float(rate)!r}"
+                 for currency, rate in sorted(fx_rates.get_rates().items()) if currency != FX_BASE_CURRENCY]
+        if not cases:
+            return "price"
+        return f"(price * CASE currency {' '.join(cases)} ELSE 1.0 END)"
+    
+    @staticmethod
+    def _localize_prices(items):
+        """בשורות שנשלפו עם price_local - price בשקלים, המחיר המקורי ב-native_price"""
+        for item in items:
+            item['native_price'] = item['price']
+            item['price'] = item.pop('price_local')
+        return items
+    
+    def _risk_level_sql(self):
+        """ביטוי CASE שממפה ענף לרמת סיכון לפי INDUSTRY_RISK_LEVELS - מחזיר (SQL, פרמטרים)"""
+        placeholder = '%s' if self.use_postgresql else '?'
+        cases = []
+        params = []
+        for industry, level in INDUSTRY_RISK_LEVELS.items():
+            cases.append(f"WHEN {placeholder} THEN {placeholder}")
+            params.extend([industry, level])
+        params.append(DEFAULT_RISK_LEVEL)
+        return f"CASE industry {' '.join(cases)} ELSE {placeholder} END", params
+    
+    def get_stale_securities(self, staleness_targets, default_target, limit, now=None, exclude_ids=(),
+                             exclude_symbols=()):
+        """ניירות ערך שהמחיר שלהם ישן מהיעד לסוג שלהם - הדחופים קודם
+        
+        staleness_targets ממפה security_type לשניות (default_target לשאר).
+        הדחיפות היא שווי ההחזקה כפול כמה פעמים עבר היעד - החזקה גדולה וישנה
+        קודמת; מחיר שעוד לא עודכן אף פעם נחשב ישן מאוד. מחזיר עד limit שורות,
+        רק עם סמל, ובלי השורות שב-exclude_ids (למשל סמל שאינו סמל מסחר) ובלי
+        הסמלים שב-exclude_symbols (בפורמט של normalize_ticker - למשל סמל בהמתנה
+        אחרי כישלון). הסינון במסד, כדי שסמלים מוחרגים לא יתפסו את המקומות ב-LIMIT.
+        """
+        now = int(now if now is not None else time.time())
+        placeholder = '%s' if self.use_postgresql else '?'
+        cases = []
+        target_params = []
+        for security_type, target in staleness_targets.items():
+            cases.append(f"WHEN {placeholder} THEN {placeholder}")
+            target_params.extend([security_type, target])
+        target_params.append(default_target)
+        target_sql = f"CASE security_type {' '.join(cases)} ELSE {placeholder} END"
+        age_sql = f"({placeholder} - COALESCE(price_updated_at, 0))"
+        value_sql = f"COALESCE({self._price_sql()}, 0) * COALESCE(amount, 0)"
+        exclude_ids = [int(security_id) for security_id in exclude_ids]
+        exclude_sql = f"AND id NOT IN ({', '.join([placeholder] * len(exclude_ids))})" if exclude_ids else ""
+        exclude_symbols = list(exclude_symbols)
+        if exclude_symbols:
+            exclude_sql += f" AND UPPER(TRIM(symbol)) NOT IN ({', '.join([placeholder] * len(exclude_symbols))})"
+        
+        conn = self.get_connection()  # קבל חיבור מהמאגר
+        if not conn:
+            return []
+        
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            cursor.execute(f"""
+                SELECT id, name, symbol, security_type, {self._price_sql()} AS price, currency,
+                       {value_sql} AS value, price_updated_at
+                FROM securities
+                WHERE {age_sql} >= {target_sql} AND symbol IS NOT NULL AND symbol <> '' {exclude_sql}
+                ORDER BY ({value_sql} + 1) * {age_sql} / {target_sql} DESC, id
+                LIMIT {placeholder}
+            """, [now] + target_params + exclude_ids + exclude_symbols + [now] + target_params + [limit])
+            return self._rows_to_dicts(cursor, cursor.fetchall())
+        except Exception as e:
+            print(f"❌ שגיאה בחיפוש מחירים ישנים: {e}")
+            return []
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    def get_portfolio_summary(self, top_n=5):
+        """סיכומי התיק מחושבים במסד - כל שאילתה מחזירה מעט שורות
+        
+        מחזיר dictionary עם count, total_value, industries (ענף -> שווי וכמות),
+        risk (שווי ואחוז לכל רמת סיכון) ו-top_holdings (top_n ההחזקות הגדולות).
+        """
+        summary = {
+            'count': 0,
+            'total_value': 0.0,
+            'industries': [],
+            'risk': {bucket: {'value': 0.0, 'percentage': 0.0}
+                     for bucket in ('high_risk', 'medium_risk', 'low_risk')},
+            'top_holdings': []
+        }
+        
+        conn = self.get_connection()  # חיבור אחד לכל הסיכומים
+        if not conn:
+            return summary
+        
+        placeholder = '%s' if self.use_postgresql else '?'
+        risk_sql, risk_params = self._risk_level_sql()
+        value_sql = f"{self._price_sql()} * amount"  # שווי בשקלים לפי השערים הנוכחיים
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            # סך הכל - שורה אחת
+            cursor.execute(f"SELECT COUNT(*), COALESCE(SUM({value_sql}), 0) FROM securities")
+            count, total_value = cursor.fetchone()
+            summary['count'] = count
+            summary['total_value'] = total_value = float(total_value)
+            
+            # פילוח לפי ענף - שורה לכל ענף
+            cursor.execute(f"""
+                SELECT COALESCE(industry, 'לא מוגדר') AS industry_name,
+                       COUNT(*), COALESCE(SUM({value_sql}), 0) AS industry_value
+                FROM securities
+                GROUP BY COALESCE(industry, 'לא מוגדר')
+                ORDER BY industry_value DESC
+            """)
+            for industry, industry_count, industry_value in cursor.fetchall():
+                industry_value = float(industry_value)
+                summary['industries'].append({
+                    'industry': industry,
+                    'count': industry_count,
+                    'value': industry_value,
+                    'percentage': (industry_value / total_value) * 100 if total_value > 0 else 0
+                })
+            
+            # פילוח לפי רמת סיכון - עד שלוש שורות
+            cursor.execute(f"""
+                SELECT CASE WHEN risk_level >= {placeholder} THEN 'high_risk'
+                            WHEN risk_level >= {placeholder} THEN 'medium_risk'
+                            ELSE 'low_risk' END AS bucket,
+                       COALESCE(SUM(holding_value), 0)
+                FROM (SELECT {risk_sql} AS risk_level, {value_sql} AS holding_value
+                      FROM securities) AS holdings
+                GROUP BY bucket
+            """, [HIGH_RISK_LEVEL, MEDIUM_RISK_LEVEL] + risk_params)
+            for bucket, bucket_value in cursor.fetchall():
+                bucket_value = float(bucket_value)
+                summary['risk'][bucket] = {
+                    'value': bucket_value,
+                    'percentage': (bucket_value / total_value) * 100 if total_value > 0 else 0
+                }
+            
+            # ההחזקות הגדולות - ORDER BY + LIMIT במקום מיון של כל הרשימה
+            if top_n:
+                summary['top_holdings'] = self._fetch_holdings(cursor, top_n, total_value)
+            return summary
+        except Exception as e:
+            print(f"❌ שגיאה בחישוב סיכומי התיק: {e}")
+            return summary
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    def get_top_holdings(self, limit=5):
+        """limit ההחזקות הגדולות לפי שווי - עם value, percentage ו-risk_level"""
+        conn = self.get_connection()  # קבל חיבור מהמאגר
+        if not conn:
+            return []
+        
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            cursor.execute(f"SELECT COALESCE(SUM({self._price_sql()} * amount), 0) FROM securities")
+            total_value = float(cursor.fetchone()[0])
+            return self._fetch_holdings(cursor, limit, total_value)
+        except Exception as e:
+            print(f"❌ שגיאה בטעינת ההחזקות הגדולות: {e}")
+            return []
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    def _fetch_holdings(self, cursor, limit, total_value):
+        """שאילתת ההחזקות הגדולות על cursor קיים - שווי ורמת סיכון מחושבים ב-SQL"""
+        placeholder = '%s' if self.use_postgresql else '?'
+        risk_sql, risk_params = self._risk_level_sql()
+        price_sql = self._price_sql()
+        cursor.execute(f"""
+            SELECT *, {price_sql} AS price_local, {price_sql} * amount AS value, {risk_sql} AS risk_level
+            FROM securities
+            ORDER BY {price_sql} * amount DESC, id
+            LIMIT {placeholder}
+        """, risk_params + [limit])
+        holdings = self._localize_prices(self._rows_to_dicts(cursor, cursor.fetchall()))
+        for holding in holdings:
+            holding['percentage'] = (float(holding['value'] or 0) / total_value) * 100 if total_value > 0 else 0
+        return holdings
+    
+    @staticmethod
+    def encode_cursor(page_cursor):
+        """קידוד סמן דפדוף למחרוזת שאפשר לשים ב-URL"""
+        if page_cursor is None:
+            return None
+        raw = json.dumps(list(page_cursor)).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(token):
+        """פענוח סמן דפדוף מה-URL - None אם חסר או לא תקין"""
+        if not token:
+            return None
+        try:
+            sort_key, row_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+            return (sort_key, int(row_id))
+        except Exception:
+            return None
     
     def remove_security(self, name):
         """הסרת נייר ערך מהתיק לפי שם"""
-        conn = self.get_connection()  # קבל חיבור למסד
+        conn = self.get_write_connection()  # קבל חיבור למסד
         if not conn:
             return False
         
@@ -287,8 +1229,11 @@ class PortfolioModel:
             else:  # SQLite syntax
                 cursor.execute("DELETE FROM securities WHERE name = ?", (name,))
             
-            conn.commit()  # שמור שינויים
-            return cursor.rowcount > 0  # החזר True אם נמחק משהו
+            removed = cursor.rowcount > 0
+            if removed:
+                self._bump_data_version(cursor)
+            self._commit_data_change(conn, removed)  # שמור שינויים והודעה לשאר התהליכים
+            return removed  # החזר True אם נמחק משהו
         except Exception as e:
             print(f"❌ שגיאה בהסרת נייר ערך: {e}")
             return False  # כישלון
@@ -296,20 +1241,26 @@ class PortfolioModel:
             cursor.close()  # סגור cursor
             conn.close()  # סגור חיבור
     
-    def update_security_price(self, name, new_price):
-        """עדכון מחיר נייר ערך קיים"""
-        conn = self.get_connection()  # קבל חיבור למסד
+    def update_security_price(self, name, new_price, currency=None):
+        """עדכון מחיר נייר ערך קיים - currency הוא מטבע המחיר (None - בלי שינוי)"""
+        conn = self.get_write_connection()  # קבל חיבור למסד
         if not conn:
             return False
         
         cursor = conn.cursor()  # יצר cursor
         try:
             if self.use_postgresql:  # PostgreSQL syntax
-                cursor.execute("UPDATE securities SET price = %s WHERE name = %s", (new_price, name))
+                cursor.execute("UPDATE securities SET price = %s, currency = COALESCE(%s, currency), "
+                               "price_updated_at = %s WHERE name = %s",
+                               (new_price, currency, int(time.time()), name))
             else:  # SQLite syntax
-                cursor.execute("UPDATE securities SET price = ? WHERE name = ?", (new_price, name))
+                cursor.execute("UPDATE securities SET price = ?, currency = COALESCE(?, currency), "
+                               "price_updated_at = ? WHERE name = ?",
+                               (new_price, currency, int(time.time()), name))
             
-            conn.commit()  # שמור שינויים
+            if cursor.rowcount > 0:
+                self._bump_data_version(cursor)
+            self._commit_data_change(conn, cursor.rowcount > 0)  # שמור שינויים והודעה לשאר התהליכים
             return True  # הצלחה
         except Exception as e:
             print(f"❌ שגיאה בעדכון מחיר: {e}")
@@ -320,7 +1271,7 @@ class PortfolioModel:
     
     def update_security_name(self, old_name, new_name):
         """עדכון שם נייר ערך - לשיפור שמות"""
-        conn = self.get_connection()  # קבל חיבור למסד
+        conn = self.get_write_connection()  # קבל חיבור למסד
         if not conn:
             return False
         
@@ -331,77 +1282,812 @@ class PortfolioModel:
             else:  # SQLite syntax
                 cursor.execute("UPDATE securities SET name = ? WHERE name = ?", (new_name, old_name))
             
-            conn.commit()  # שמור שינויים
-            return cursor.rowcount > 0  # החזר True אם עודכן משהו
+            updated = cursor.rowcount > 0
+            if updated:
+                self._bump_data_version(cursor)
+            self._commit_data_change(conn, updated)  # שמור שינויים והודעה לשאר התהליכים
+            return updated  # החזר True אם עודכן משהו
         except Exception as e:
             print(f"❌ שגיאה בעדכון שם נייר ערך: {e}")
             return False  # כישלון
         finally:
             cursor.close()  # סגור cursor
             conn.close()  # סגור חיבור
+    
+    def _get_symbol_id(self, cursor, symbol):
+        """מזהה מספרי לסמל - נוצר בפעם הראשונה ונשמר בזיכרון"""
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is not None:
+            return symbol_id
+        
+        placeholder = '%s' if self.use_postgresql else '?'
+        cursor.execute(f"INSERT INTO symbols (symbol) VALUES ({placeholder}) ON CONFLICT (symbol) DO NOTHING",
+                       (symbol,))
+        cursor.execute(f"SELECT id FROM symbols WHERE symbol = {placeholder}", (symbol,))
+        symbol_id = cursor.fetchone()[0]
+        self._symbol_ids[symbol] = symbol_id
+        return symbol_id
+    
+    def record_price(self, symbol, price, ts=None):
+        """שמירת מחיר בהיסטוריה - מתאים כ-listener של Broker"""
+        return self.record_prices([(symbol, price)], ts=ts)
+    
+    def record_prices(self, prices, ts=None):
+        """שמירת מחירים בהיסטוריה ועדכון נרות הדקה והיום - הכל בטרנזקציה אחת
+        
+        prices הם זוגות (סמל, מחיר); ts בשניות epoch (ברירת מחדל - עכשיו).
+        """
+        prices = [(symbol, float(price)) for symbol, price in prices if symbol and price is not None]
+        if not prices:
+            return False
+        ts = int(ts if ts is not None else time.time())
+        
+        conn = self.get_write_connection()  # קבל חיבור כתיבה
+        if not conn:
+            return False
+        
+        placeholder = '%s' if self.use_postgresql else '?'
+        values = ', '.join([placeholder] * 3)
+        bar_values = ', '.join([placeholder] * 7)
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            history_rows = []
+            bar_rows = []
+            for symbol, price in prices:
+                symbol_id = self._get_symbol_id(cursor, symbol)
+                history_rows.append((symbol_id, ts, price))
+                for resolution in PRICE_BAR_RESOLUTIONS.values():
+                    bucket_ts = ts - ts % resolution
+                    bar_rows.append((symbol_id, resolution, bucket_ts, price, price, price, price))
+            
+            cursor.executemany(f"""
+                INSERT INTO price_history (symbol_id, ts, price) VALUES ({values})
+                ON CONFLICT (symbol_id, ts) DO UPDATE SET price = excluded.price
+            """, history_rows)
+            
+            # צבירה לנרות תוך כדי כתיבה - אין צורך לסרוק את הגולמי אחר כך
+            cursor.executemany(f"""
+                INSERT INTO price_bars (symbol_id, resolution, bucket_ts, open, high, low, close)
+                VALUES ({bar_values})
+                ON CONFLICT (symbol_id, resolution, bucket_ts) DO UPDATE SET
+                    high = CASE WHEN excluded.high > price_bars.high THEN excluded.high ELSE price_bars.high END,
+                    low = CASE WHEN excluded.low < price_bars.low THEN excluded.low ELSE price_bars.low END,
+                    close = excluded.close,
+                    samples = price_bars.samples + 1
+            """, bar_rows)
+            
+            conn.commit()  # שמור שינויים
+        except Exception as e:
+            print(f"❌ שגיאה בשמירת היסטוריית מחירים: {e}")
+            self._symbol_ids.clear()  # ייתכן שמזהה נשמר מטרנזקציה שבוטלה
+            return False
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+        
+        # ניקוי אוטומטי לפי מדיניות השמירה - לכל היותר פעם ב-PRICE_RETENTION_CHECK_INTERVAL
+        if time.time() - self._last_retention_run > PRICE_RETENTION_CHECK_INTERVAL:
+            self.apply_price_retention()
+        return True
+    
+    def apply_price_retention(self, now=None):
+        """מחיקת היסטוריה ישנה לפי PRICE_RETENTION - מחזיר כמה שורות נמחקו"""
+        now = int(now if now is not None else time.time())
+        self._last_retention_run = time.time()
+        
+        conn = self.get_write_connection()  # קבל חיבור כתיבה
+        if not conn:
+            return 0
+        
+        placeholder = '%s' if self.use_postgresql else '?'
+        cursor = conn.cursor()  # יצר cursor
+        deleted = 0
+        try:
+            if PRICE_RETENTION['raw'] is not None:
+                cursor.execute(f"DELETE FROM price_history WHERE ts < {placeholder}",
+                               (now - PRICE_RETENTION['raw'],))
+                deleted += max(cursor.rowcount, 0)
+            for name, resolution in PRICE_BAR_RESOLUTIONS.items():
+                if PRICE_RETENTION.get(name) is None:
+                    continue
+                cursor.execute(f"DELETE FROM price_bars WHERE resolution = {placeholder} AND bucket_ts < {placeholder}",
+                               (resolution, now - PRICE_RETENTION[name]))
+                deleted += max(cursor.rowcount, 0)
+            conn.commit()  # שמור שינויים
+            return deleted
+        except Exception as e:
+            print(f"❌ שגיאה בניקוי היסטוריית מחירים: {e}")
+            return 0
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    def get_price_history(self, symbol, start=None, end=None, resolution='raw'):
+        """מחירים של סמל בטווח זמן (שניות epoch) - raw, 1m או 1d
+        
+        raw מחזיר רשימת (ts, price); רזולוציה מצטברת מחזירה dictionaries של נרות.
+        השאילתה רצה על המפתח הראשי (symbol_id, ts) - מהירה גם במיליוני נקודות.
+        """
+        if resolution != 'raw' and resolution not in PRICE_BAR_RESOLUTIONS:
+            raise ValueError(f"רזולוציה לא נתמכת: {resolution}")
+        start = int(start) if start is not None else 0
+        end = int(end) if end is not None else int(time.time()) + 1
+        
+        conn = self.get_connection()  # קבל חיבור מהמאגר
+        if not conn:
+            return []
+        
+        placeholder = '%s' if self.use_postgresql else '?'
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            if resolution == 'raw':
+                cursor.execute(f"""
+                    SELECT h.ts, h.price FROM price_history h
+                    JOIN symbols s ON s.id = h.symbol_id
+                    WHERE s.symbol = {placeholder} AND h.ts >= {placeholder} AND h.ts < {placeholder}
+                    ORDER BY h.ts
+                """, (symbol, start, end))
+                return [(row[0], row[1]) for row in cursor.fetchall()]
+            
+            cursor.execute(f"""
+                SELECT b.bucket_ts, b.open, b.high, b.low, b.close, b.samples FROM price_bars b
+                JOIN symbols s ON s.id = b.symbol_id
+                WHERE s.symbol = {placeholder} AND b.resolution = {placeholder}
+                  AND b.bucket_ts >= {placeholder} AND b.bucket_ts < {placeholder}
+                ORDER BY b.bucket_ts
+            """, (symbol, PRICE_BAR_RESOLUTIONS[resolution], start, end))
+            return [
+                {'ts': row[0], 'open': row[1], 'high': row[2], 'low': row[3], 'close': row[4], 'samples': row[5]}
+                for row in cursor.fetchall()
+            ]
+        except Exception as e:
+            print(f"❌ שגיאה בטעינת היסטוריית מחירים: {e}")
+            return []
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    @staticmethod
+    def _security_row(security):
+        """המרת נייר ערך (dictionary או tuple) לשורה לפי סדר SECURITY_COLUMNS"""
+        if isinstance(security, dict):
+            return tuple(security[column] for column in SECURITY_COLUMNS)
+        row = tuple(security)
+        if len(row) != len(SECURITY_COLUMNS):
+            raise ValueError(f"צפויים {len(SECURITY_COLUMNS)} שדות, התקבלו {len(row)}")
+        return row
+    
+    def add_securities_many(self, securities):
+        """הוספת הרבה ניירות ערך בטרנזקציה אחת - מחזיר True/False לכל שורה לפי הסדר"""
+        outcomes = []  # תוצאה לכל שורה שהתקבלה
+        rows = []  # שורות תקינות לשליחה
+        variance_index = SECURITY_COLUMNS.index('variance')
+        for security in securities:
+            try:
+                row = self._security_row(security)
+                rows.append(row + (self._parse_variance(row[variance_index]),))  # גם variance_num
+                outcomes.append(True)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"❌ נייר ערך לא תקין, מדלג: {e}")
+                outcomes.append(False)
+        
+        if not rows:  # אין מה לשלוח
+            return outcomes
+        
+        conn = self.get_write_connection()  # קבל חיבור מהמאגר
+        if not conn:
+            return [False] * len(outcomes)
+        
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            if self.use_postgresql:  # PostgreSQL - כל השורות בפקודת INSERT אחת
+                psycopg2.extras.execute_values(cursor, f"""
+                    INSERT INTO securities ({', '.join(SECURITY_COLUMNS)}, variance_num) VALUES %s
+                """, rows, page_size=len(rows))
+            else:  # SQLite - executemany על אותה טרנזקציה
+                cursor.executemany(f"""
+                    INSERT INTO securities ({', '.join(SECURITY_COLUMNS)}, variance_num)
+                    VALUES ({', '.join('?' * (len(SECURITY_COLUMNS) + 1))})
+                """, rows)
+            
+            self._bump_data_version(cursor)
+            self._commit_data_change(conn)  # commit אחד לכל הקבוצה והודעה לשאר התהליכים
+            return outcomes
+        except Exception as e:
+            print(f"❌ שגיאה בהוספת ניירות ערך: {e}")
+            return [False] * len(outcomes)  # הטרנזקציה בוטלה - אף שורה לא נוספה
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    def update_prices_many(self, updates, key='symbol', currency=None):
+        """עדכון מחירים מרוכז - updates הם זוגות (מפתח, מחיר), key הוא id / symbol / name
+        
+        currency הוא מטבע כל המחירים בקבוצה (None - המטבע של כל שורה לא משתנה).
+        הכל בטרנזקציה אחת עם commit אחד. מחזיר True/False לכל זוג לפי הסדר -
+        True אם נמצאה לפחות שורה אחת עם המפתח.
+        """
+        if key not in ('id', 'symbol', 'name'):  # שם העמודה נכנס ל-SQL - רק ערכים מוכרים
+            raise ValueError(f"מפתח עדכון לא נתמך: {key}")
+        
+        updates = list(updates)
+        if not updates:
+            return []
+        
+        updated_at = int(time.time())  # זמן העדכון לכל השורות
+        
+        # מפתח שמופיע פעמיים - המחיר האחרון קובע
+        latest_prices = {}
+        for key_value, new_price in updates:
+            latest_prices[key_value] = new_price
+        
+        conn = self.get_write_connection()  # קבל חיבור מהמאגר
+        if not conn:
+            return [False] * len(updates)
+        
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            if self.use_postgresql:  # PostgreSQL - UPDATE אחד מול טבלת VALUES
+                matched = psycopg2.extras.execute_values(cursor, f"""
+                    UPDATE securities AS s SET price = v.price, price_updated_at = v.updated_at,
+                                               currency = COALESCE(v.currency::VARCHAR, s.currency)
+                    FROM (VALUES %s) AS v(key, price, updated_at, currency)
+                    WHERE s.{key} = v.key
+                    RETURNING v.key
+                """, [(key_value, new_price, updated_at, currency) for key_value, new_price in latest_prices.items()],
+                    page_size=len(latest_prices), fetch=True)
+                updated_keys = {row[0] for row in matched}
+            else:  # SQLite - בתוך התהליך, אין round trip; rowcount לכל שורה
+                updated_keys = set()
+                for key_value, new_price in latest_prices.items():
+                    cursor.execute(f"UPDATE securities SET price = ?, price_updated_at = ?, "
+                                   f"currency = COALESCE(?, currency) WHERE {key} = ?",
+                                   (new_price, updated_at, currency, key_value))
+                    if cursor.rowcount > 0:
+                        updated_keys.add(key_value)
+            
+            if updated_keys:
+                self._bump_data_version(cursor)
+            self._commit_data_change(conn, bool(updated_keys))  # commit אחד לכל הקבוצה והודעה לשאר התהליכים
+            return [key_value in updated_keys for key_value, _ in updates]
+        except Exception as e:
+            print(f"❌ שגיאה בעדכון מחירים מרוכז: {e}")
+            return [False] * len(updates)  # הטרנזקציה בוטלה
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    def _execute_write(self, query, params, error_message, bump_version=True):
+        """הרצת פקודת כתיבה אחת עם commit - מחזיר True אם שורה כלשהי הושפעה
+        
+        bump_version=False לכתיבות שלא משנות נתונים שמוצגים (לא מבטל את ה-cache).
+        """
+        conn = self.get_write_connection()  # קבל חיבור מהמאגר
+        if not conn:
+            return False
+        
+        if self.use_postgresql:  # PostgreSQL משתמש ב-%s במקום ?
+            query = query.replace('?', '%s')
+        
+        cursor = conn.cursor()  # יצר cursor
+        try:
+            cursor.execute(query, params)
+            affected = cursor.rowcount > 0
+            if affected and bump_version:
+                self._bump_data_version(cursor)
+            self._commit_data_change(conn, affected and bump_version)  # שמור שינויים והודעה לשאר התהליכים
+            return affected  # החזר True אם הושפעה שורה
+        except Exception as e:
+            print(f"❌ {error_message}: {e}")
+            return False  # כישלון
+        finally:
+            cursor.close()  # סגור cursor
+            conn.close()  # החזר חיבור למאגר
+    
+    def update_security_price_by_id(self, security_id, new_price, currency=None):
+        """עדכון מחיר לפי מזהה - חיפוש במפתח הראשי (currency None - המטבע לא משתנה)"""
+        return self._execute_write(
+            "UPDATE securities SET price = ?, currency = COALESCE(?, currency), price_updated_at = ? WHERE id = ?",
+            (new_price, currency, int(time.time()), security_id), "שגיאה בעדכון מחיר")
+    
+    def update_security_price_by_symbol(self, symbol, new_price, currency=None):
+        """עדכון מחיר לפי סמל - כל השורות עם אותו סמל, דרך האינדקס"""
+        return self._execute_write(
+            "UPDATE securities SET price = ?, currency = COALESCE(?, currency), price_updated_at = ? WHERE symbol = ?",
+            (new_price, currency, int(time.time()), symbol), "שגיאה בעדכון מחיר")
+    
+    def mark_prices_stale(self, symbol=None):
+        """סימון מחיר כישן - העדכון ברקע ייקח אותו ראשון (None - כל התיק)"""
+        if symbol is None:
+            return self._execute_write(
+                "UPDATE securities SET price_updated_at = NULL", (),
+                "שגיאה בסימון מחירים לעדכון", bump_version=False)
+        return self._execute_write(
+            "UPDATE securities SET price_updated_at = NULL WHERE symbol = ?", (symbol,),
+            "שגיאה בסימון מחיר לעדכון", bump_version=False)
+    
+    def update_security_name_by_id(self, security_id, new_name):
+        """עדכון שם נייר ערך לפי מזהה"""
+        return self._execute_write(
+            "UPDATE securities SET name = ? WHERE id = ?",
+            (new_name, security_id), "שגיאה בעדכון שם נייר ערך")
+    
+    def remove_security_by_id(self, security_id):
+        """הסרת נייר ערך לפי מזהה"""
+        return self._execute_write(
+            "DELETE FROM securities WHERE id = ?",
+            (security_id,), "שגיאה בהסרת נייר ערך")
+    
+    def remove_security_by_symbol(self, symbol):
+        """הסרת כל השורות של סמל מסוים"""
+        return self._execute_write(
+            "DELETE FROM securities WHERE symbol = ?",
+            (symbol,), "שגיאה בהסרת נייר ערך")
+
+
+class QuoteCache:
+    """cache מחירים לפי סמל - תוקף (TTL) לכל רשומה ופינוי LRU כשמגיעים לגודל המקסימלי
+    
+    בטוח לשימוש מכמה תהליכונים. סופר פגיעות (hits), החטאות (misses) ופינויים.
+    רשומה שפג תוקפה נשארת עד שהיא מפונה - כמחיר אחרון ידוע כשהספק לא זמין.
+    """
+    
+    def __init__(self, ttl=QUOTE_CACHE_TTL, max_size=QUOTE_CACHE_MAX_SIZE):
+        self.ttl = ttl  # תוקף ברירת מחדל בשניות
+        self.max_size = max_size  # מקסימום סמלים
+        self._entries = OrderedDict()  # סמל -> (מחיר, זמן תפוגה, זמן שמירה); הסוף הוא האחרון בשימוש
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0  # מחירים שפג תוקפם שהוגשו כשהספק לא זמין
+    
+    def get(self, symbol, allow_expired=False):
+        """מחיר טרי מה-cache, או None אם אין / פג תוקף
+        
+        allow_expired=True מחזיר גם מחיר שפג תוקפו - המחיר האחרון הידוע.
+        """
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is None:
+                self.misses += 1
+                return None
+            price, expires_at, _ = entry
+            if time.monotonic() >= expires_at:  # פג תוקף
+                if not allow_expired:
+                    self.misses += 1
+                    return None
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            self._entries.move_to_end(symbol)  # עדכון סדר LRU
+            return price
+    
+    def put(self, symbol, price, ttl=None):
+        """שמירת מחיר - ttl לסמל הזה בלבד (None - ברירת המחדל)"""
+        now = time.monotonic()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[symbol] = (price, expires_at, now)
+            self._entries.move_to_end(symbol)
+            while len(self._entries) > self.max_size:  # פינוי הסמל שלא נגענו בו הכי הרבה זמן
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def age(self, symbol):
+        """כמה שניות עברו מאז שהמחיר של הסמל נשמר - None אם אין"""
+        with self._lock:
+            entry = self._entries.get(symbol)
+        return None if entry is None else time.monotonic() - entry[2]
+    
+    def invalidate(self, symbol=None):
+        """מחיקת סמל אחד מה-cache, או של הכל אם symbol הוא None"""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(symbol, None)
+    
+    def get_stats(self):
+        """סטטיסטיקות לתצוגה ב-/db-status"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'stale_hits': self.stale_hits,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class CircuitBreaker:
+    """מפסק לספק חיצוני - אחרי failure_threshold שגיאות רצופות נפתח ודוחה בקשות מיד
+    
+    אחרי reset_timeout שניות עוברת בקשת ניסיון אחת (half_open): הצלחה סוגרת את
+    המפסק, כישלון פותח אותו שוב. כך ספק שנפל לא מחזיק תהליכונים עד ה-timeout.
+    """
+    
+    def __init__(self, name, failure_threshold=QUOTE_BREAKER_FAILURES, reset_timeout=QUOTE_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'  # closed / open / half_open
+        self.failures = 0  # שגיאות רצופות
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self.opens = 0  # כמה פעמים נפתח
+        self.rejected = 0  # בקשות שנדחו בלי לפנות לספק
+    
+    def allow(self):
+        """האם לשלוח בקשה עכשיו - במצב half_open רק בקשת ניסיון אחת"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'  # הבקשה הזו היא בקשת הניסיון
+                return True
+            self.rejected += 1
+            return False
+    
+    def is_open(self):
+        """האם הבקשות נדחות כרגע - בלי לשנות מצב"""
+        with self._lock:
+            if self.state == 'open':
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self.state == 'half_open'
+    
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+    
+    def release_probe(self):
+        """בקשת הניסיון לא הגיעה לספק (למשל נגמר הזמן של הקורא) - הבקשה הבאה תקבל אותה"""
+        with self._lock:
+            if self.state == 'half_open':
+                self.state = 'open'  # _opened_at כבר ישן מ-reset_timeout
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                if self.state != 'open':
+                    print(f"⚡ המפסק של {self.name} נפתח אחרי {self.failures} שגיאות רצופות")
+                    self.opens += 1
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+    
+    def get_stats(self):
+        """סטטיסטיקות לתצוגה ב-/db-status"""
+        with self._lock:
+            retry_in = self.reset_timeout - (time.monotonic() - self._opened_at) if self.state == 'open' else 0
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'opens': self.opens,
+                'rejected': self.rejected,
+                'retry_in': round(max(0.0, retry_in), 1),
+            }
+
+
+class SingleFlight:
+    """איחוד בקשות זהות שרצות במקביל - קריאה אחת בפועל לכל מפתח, וכל הממתינים מקבלים את התוצאה
+    
+    בטוח לשימוש מכמה תהליכונים. סופר קריאות שבוצעו (leaders) וקריאות שהצטרפו
+    לקריאה קיימת (coalesced) - כל אחת מהן היא בקשת API שנחסכה.
+    """
+    
+    def __init__(self):
+        self._calls = {}  # מפתח -> [Event, תוצאה, שגיאה, ממתינים]
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+    
+    def do(self, key, function, deadline=None):
+        """הרצת function() עבור key - אם כבר רצה קריאה לאותו key, ממתינים לה ומחזירים את התוצאה שלה
+        
+        שגיאה בקריאה עוברת גם לכל מי שהמתין לה. ממתין עם deadline (time.monotonic)
+        לא מחכה אחריו לקריאה של מי שהתחיל עם זמן ארוך יותר - זורק DeadlineExceeded.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = [threading.Event(), None, None, 0]
+                self.leaders += 1
+                leader = True
+            else:
+                call[3] += 1
+                self.coalesced += 1
+                leader = False
+        
+        if not leader:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not call[0].wait(timeout):
+                raise DeadlineExceeded(f"עבר הזמן שהוקצב בהמתנה לבקשה הקיימת עבור {key}")
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        
+        try:
+            call[1] = function()
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]  # קריאה הבאה לאותו key תצא מחדש
+            call[0].set()
+        return call[1]
+    
+    def get_stats(self):
+        """סטטיסטיקות לתצוגה ב-/db-status"""
+        with self._lock:
+            calls = self.leaders + self.coalesced
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'coalesced_rate': round(self.coalesced / calls, 3) if calls else 0.0,
+            }
 
 
 class Broker:
-    """שירות קבלת מחירי מניות מ-API של Alpha Vantage"""
+    """שירות מחירי מניות - cache ו-listeners מעל ספק מחירים (quoteproviders)
+    
+    המחירים חוזרים במטבע המסחר של כל סמל (currency(symbol) - דולר בארה"ב, שקל
+    בתל אביב) ונשמרים כך במסד - ההמרה לשקלים נעשית בזמן הקריאה לפי fxrates.
+    
+    ברירת המחדל היא Alpha Vantage; QUOTE_PROVIDER בוחר ספק אחר, ו-set_provider
+    מחליף ספק בזמן ריצה (למשל ReplayProvider בבדיקות עומס).
+    """
     
     # מפתחות API - מספר מפתחות לגיבוי
     API_KEYS = [
         "451FPPPSEOOZIDV4",  # מפתח ראשי
         "XX4SBD1SXLFLUSV2"   # מפתח גיבוי
     ]
-    current_key_index = 0  # אינדקס המפתח הנוכחי
-    BASE_URL = "https://www.alphavantage.co/query"  # כתובת בסיס של ה-API
+    alpha_vantage = AlphaVantageProvider(API_KEYS)  # הספק הקיים - תמיד קיים בשביל דף המפתחות
+    key_pool = alpha_vantage.key_pool  # מכסה לכל מפתח ותור בקשות
+    BASE_URL = alpha_vantage.base_url  # כתובת בסיס של ה-API
+    current_key_index = 0  # אינדקס המפתח האחרון שנבחר (לתצוגה בדף המפתחות)
+    provider = alpha_vantage  # ספק למחיר בודד
+    batch_provider = alpha_vantage  # ספק לבקשות מרוכזות
+    price_listeners = []  # פונקציות (symbol, price) שנקראות אחרי כל מחיר שהתקבל
+    quote_cache = QuoteCache()  # מחירים אחרונים - בקשה חוזרת בתוך חלון הטריות לא יוצאת ל-API
+    in_flight = SingleFlight()  # בקשות במקביל לאותו סמל חולקות בקשת API אחת
+    breakers = {}  # שם ספק -> CircuitBreaker
+    closed_market_hits = 0  # מחירים שהוגשו מה-cache רק בזכות התוקף המוארך כשהבורסה סגורה
+    _stats_lock = threading.Lock()
+    
+    @classmethod
+    def set_provider(cls, provider, batch_provider=None):
+        """החלפת ספק המחירים - batch_provider לבקשות מרוכזות (ברירת מחדל - אותו ספק)"""
+        cls.provider = provider
+        cls.batch_provider = batch_provider or provider
+        cls.quote_cache.invalidate()  # מחירים מספק אחר לא תקפים יותר
+        cls.breakers.clear()
+    
+    @classmethod
+    def breaker(cls, provider=None):
+        """המפסק של ספק (ברירת מחדל - ספק המחיר הבודד)"""
+        provider = provider or cls.provider
+        breaker = cls.breakers.get(provider.name)
+        if breaker is None:
+            breaker = cls.breakers.setdefault(provider.name, CircuitBreaker(provider.name))
+        return breaker
+    
+    @classmethod
+    def is_available(cls):
+        """האם ספק המחירים מקבל בקשות - False כשהמפסק שלו פתוח"""
+        return not cls.breaker().is_open()
     
     @classmethod
     def get_current_api_key(cls):
         """קבלת המפתח הנוכחי"""
-        return cls.API_KEYS[cls.current_key_index]
+        return cls.API_KEYS[cls.alpha_vantage.current_key_index]
     
     @classmethod
     def rotate_api_key(cls):
         """מעבר למפתח הבא - אם המפתח הנוכחי חסום"""
-        cls.current_key_index = (cls.current_key_index + 1) % len(cls.API_KEYS)
+        cls.alpha_vantage.current_key_index = (cls.alpha_vantage.current_key_index + 1) % len(cls.API_KEYS)
+        cls.current_key_index = cls.alpha_vantage.current_key_index
         return cls.get_current_api_key()
     
+    @classmethod
+    def add_price_listener(cls, listener):
+        """רישום פונקציה שתקבל כל מחיר שהתקבל מה-API - למשל שמירה בהיסטוריה"""
+        if listener not in cls.price_listeners:
+            cls.price_listeners.append(listener)
+    
+    @classmethod
+    def _notify_price(cls, symbol, price):
+        """הפצת מחיר חדש לכל ה-listeners - שגיאה באחד לא עוצרת את השאר"""
+        for listener in list(cls.price_listeners):
+            try:
+                listener(symbol, price)
+            except Exception as e:
+                print(f"⚠️ שגיאה ב-listener של מחירים עבור {symbol}: {e}")
+    
+    @classmethod
+    def currency(cls, symbol):
+        """המטבע של המחירים שמוחזרים לסמל - לפי הבורסה שלו"""
+        return quote_currency(symbol)
+    
+    @classmethod
+    def _cached_price(cls, symbol):
+        """מחיר טרי מה-cache - ונספר כבקשה שנחסכה אם רק התוקף של בורסה סגורה החזיק אותו
+        
+        מחיר שצעיר מ-QUOTE_CACHE_TTL היה מוגש גם בלי שעות המסחר - לא נספר.
+        """
+        price = cls.quote_cache.get(symbol)
+        if price is None or is_market_open(symbol):
+            return price
+        if (cls.quote_cache.age(symbol) or 0) >= cls.quote_cache.ttl:
+            with cls._stats_lock:
+                cls.closed_market_hits += 1
+        return price
+    
+    @classmethod
+    def _store_price(cls, symbol, price):
+        """שמירה ב-cache והפצה ל-listeners - מחזיר את המחיר במטבע המסחר של הסמל
+        
+        מחיר בתל אביב מגיע מהספק באגורות ומומר כאן לשקלים - ב-cache כבר במטבע.
+        כשהבורסה סגורה המחיר הוא מחיר הסגירה, והוא נשמר ב-cache עד הפתיחה הבאה.
+        """
+        price = scale_quote(symbol, price)
+        closed_for = seconds_until_open(symbol)
+        cls.quote_cache.put(symbol, price, ttl=max(cls.quote_cache.ttl, closed_for) if closed_for else None)
+        cls._notify_price(symbol, price)  # למשל שמירה בהיסטוריית המחירים
+        return price
+    
+    @staticmethod
+    def update_price(symbol, bypass_cache=False, deadline=None, stale_ok=True):
+        """קבלת מחיר עדכני של מניה במטבע הספק - מה-cache אם טרי, אחרת מהספק
+        
+        bypass_cache=True מדלג על ה-cache ופונה תמיד לספק (התוצאה עדיין נשמרת בו).
+        בקשה לסמל שכבר נשלף ברגע זה ממתינה לבקשה הקיימת ולא שולחת עוד אחת.
+        deadline (time.monotonic) מגביל את זמן הבקשה לזמן שנשאר לקורא, גם בהמתנה
+        לבקשה קיימת. כשהספק נכשל, המפסק שלו פתוח או שה-deadline עבר בלי מחיר -
+        stale_ok=True מחזיר את המחיר האחרון הידוע.
+        """
+        if not bypass_cache:
+            cached_price = Broker._cached_price(symbol)
+            if cached_price is not None:
+                return cached_price
+        
+        timed_out = deadline is not None and deadline <= time.monotonic()
+        if not timed_out and Broker.breaker().allow():
+            try:
+                price, failed = Broker.in_flight.do(symbol, partial(Broker._fetch_price, symbol, deadline),
+                                                    deadline=deadline)
+            except DeadlineExceeded as e:  # הבקשה הקיימת לא הסתיימה בזמן של הקורא
+                print(f"⏱️ עבר הזמן שהוקצב למחיר עבור {symbol}: {e}")
+                price, failed = None, False
+            # בלי מחיר כי ה-deadline עבר (אצל המוביל או בהמתנה) - ממשיכים למחיר האחרון הידוע
+            if not failed and (price is not None or not deadline_passed(deadline)):
+                return price
+        
+        if not stale_ok:
+            return None
+        last_price = Broker.quote_cache.get(symbol, allow_expired=True)
+        if last_price is not None:
+            print(f"⚠️ ספק המחירים לא זמין - מחיר אחרון ידוע עבור {symbol}: {last_price}")
+        return last_price
+    
     @staticmethod
-    def update_price(symbol):
-        """קבלת מחיר עדכני של מניה מה-API"""
+    def _fetch_price(symbol, deadline=None):
+        """בקשה אחת לספק, שמירה ב-cache והפצה - מחזיר (מחיר או None, האם נכשל)"""
+        breaker = Broker.breaker()
+        if deadline is not None and deadline <= time.monotonic():
+            breaker.release_probe()
+            return None, False  # נגמר הזמן של הקורא - לא תקלה בספק, והמפסק לא נספר
         try:
-            current_key = Broker.get_current_api_key()  # קבל מפתח נוכחי
-            print(f"🔍 מנסה לקבל מחיר עבור {symbol} עם מפתח {Broker.current_key_index + 1}")
-            
-            # פרמטרים לבקשת API
-            params = {
-                'function': 'GLOBAL_QUOTE',  # סוג הבקשה - ציטוט גלובלי
-                'symbol': symbol,  # סמל המניה
-                'apikey': current_key  # מפתח ה-API
-            }
-            
-            # שליחת בקשה ל-API עם timeout
-            response = requests.get(Broker.BASE_URL, params=params, timeout=10)
-            data = response.json()  # המרה ל-JSON
-            
-            print(f"📊 תגובת API עבור {symbol}: {data}")
-            
-            # בדיקת תוצאת API
-            if 'Global Quote' in data and '05. price' in data['Global Quote']:
-                current_price = data['Global Quote']['05. price']  # קבל מחיר נוכחי
-                ils_price = float(current_price) * USD_TO_ILS_RATE  # המר לשקלים
-                print(f"💰 קיבלתי מחיר עבור {symbol}: ${current_price} = ₪{ils_price:.2f}")
-                return ils_price  # החזר מחיר בשקלים
-            elif 'Error Message' in data:  # אם יש שגיאה
-                print(f"❌ שגיאת API עבור {symbol}: {data['Error Message']}")
-                return None
-            elif 'Note' in data:  # אם יש הגבלת קצב
-                print(f"⚠️ הגבלת API עבור {symbol}: {data['Note']}")
-                # נסה לסובב למפתח הבא
-                Broker.rotate_api_key()
-                print(f"🔄 עברתי למפתח {Broker.current_key_index + 1}")
-                return None
-            else:  # אם אין מידע
-                print(f"❓ לא נמצא מידע על {symbol}")
-                return None
-                
+            price = Broker.provider.get_quote(symbol, deadline)
+        except DeadlineExceeded as e:
+            breaker.release_probe()
+            print(f"⏱️ עבר הזמן שהוקצב למחיר עבור {symbol}: {e}")
+            return None, False
         except Exception as e:
+            breaker.record_failure()
             print(f"❌ שגיאה בקבלת מחיר עבור {symbol}: {e}")
+            return None, True
+        finally:
+            Broker.current_key_index = Broker.alpha_vantage.current_key_index
+        breaker.record_success()
+        if price is None:
+            return None, False
+        
+        price = Broker._store_price(symbol, price)
+        print(f"💰 קיבלתי מחיר עבור {symbol}: {price} {Broker.currency(symbol)}")
+        return price, False
+    
+    @staticmethod
+    def _chunks(symbols, size):
+        """חלוקת רשימת סמלים לקבוצות בגודל size"""
+        for start in range(0, len(symbols), size):
+            yield symbols[start:start + size]
+    
+    @staticmethod
+    def update_prices(symbols, bypass_cache=False, max_workers=1, deadline=None):
+        """מחירים עדכניים להרבה סמלים - {symbol: מחיר במטבע הספק או None}
+        
+        סדר הפעולות: cache, בקשות מרוכזות בקבוצות בגודל batch_size של הספק,
+        ורק הסמלים שנכשלו נשלפים אחד אחד עם update_price (במקביל אם max_workers > 1).
+        אחרי deadline (time.monotonic) לא נשלחות בקשות נוספות, וסמל שלא התקבל
+        מחזיר None - בלי מחיר אחרון ידוע, כדי שלא ייכתב למסד כמחיר חדש.
+        """
+        symbols = list(dict.fromkeys(symbol for symbol in symbols if symbol))  # בלי כפילויות, לפי הסדר
+        prices = {}
+        missing = []
+        for symbol in symbols:
+            cached_price = None if bypass_cache else Broker._cached_price(symbol)
+            if cached_price is not None:
+                prices[symbol] = cached_price
+            else:
+                missing.append(symbol)
+        
+        if missing:
+            batch_provider = Broker.batch_provider
+            batch_breaker = Broker.breaker(batch_provider)
+            if batch_provider.batch_size > 1:
+                for chunk in Broker._chunks(missing, batch_provider.batch_size):
+                    if deadline is not None and deadline <= time.monotonic():
+                        break  # נגמר הזמן - לא לוקחים את בקשת הניסיון של המפסק
+                    if not batch_breaker.allow():
+                        break  # הספק לא זמין - לא ממתינים לו
+                    try:
+                        batch_prices = batch_provider.get_quotes(chunk, deadline)
+                    except DeadlineExceeded as e:
+                        batch_breaker.release_probe()
+                        print(f"⏱️ עבר הזמן שהוקצב לבקשה מרוכזת ({len(chunk)} סמלים): {e}")
+                        break
+                    except Exception as e:
+                        batch_breaker.record_failure()
+                        print(f"❌ שגיאה בבקשת מחירים מרוכזת ({len(chunk)} סמלים): {e}")
+                        continue
+                    batch_breaker.record_success()
+                    for symbol, price in batch_prices.items():
+                        if symbol in chunk and price is not None:
+                            prices[symbol] = Broker._store_price(symbol, price)
+            
+            # גיבוי - בקשה בודדת רק לסמלים שלא התקבלו בבקשות המרוכזות
+            failed = [symbol for symbol in missing if symbol not in prices]
+            if failed and deadline is not None and deadline <= time.monotonic():
+                print(f"⏱️ עבר הזמן שהוקצב - {len(failed)} סמלים לא עודכנו")
+                failed = []
+            if failed:
+                print(f"🔁 {len(failed)} סמלים לא התקבלו בבקשה מרוכזת - מנסה אחד אחד")
+                fetch_single = partial(Broker.update_price, bypass_cache=True, deadline=deadline, stale_ok=False)
+                if max_workers > 1 and len(failed) > 1:
+                    with ThreadPoolExecutor(max_workers=min(max_workers, len(failed))) as executor:
+                        single_prices = list(executor.map(fetch_single, failed))
+                else:
+                    single_prices = [fetch_single(symbol) for symbol in failed]
+                prices.update(zip(failed, single_prices))
+        
+        return {symbol: prices.get(symbol) for symbol in symbols}
+    
+    @staticmethod
+    def request_budget():
+        """כמה סמלים אפשר לבקש עכשיו בלי להמתין - None אם אין מגבלה
+        
+        כשהבקשות המרוכזות עוברות לספק בלי מגבלה, הן לא צורכות מכסה לכל סמל.
+        """
+        if Broker.batch_provider is not Broker.provider and Broker.batch_provider.request_budget() is None:
             return None
+        return Broker.provider.request_budget()
+
+
+# בחירת הספק לפי QUOTE_PROVIDER; עם Alpha Vantage ו-yfinance מותקן - yfinance לבקשות המרוכזות
+if QUOTE_PROVIDER != 'alphavantage':
+    try:
+        Broker.set_provider(create_provider(QUOTE_PROVIDER, Broker.API_KEYS))
+        print(f"📡 ספק מחירים: {Broker.provider.name}")
+    except Exception as e:
+        print(f"❌ לא ניתן ליצור ספק מחירים '{QUOTE_PROVIDER}': {e} - משתמש ב-Alpha Vantage")
+elif YFINANCE_AVAILABLE:
+    Broker.batch_provider = YFinanceProvider()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+fxrates.py - שערי מטבע חיים עם cache
+
+המחירים נשמרים במסד במטבע המקורי שלהם (עמודת currency), וההמרה לשקלים
+נעשית בזמן הקריאה לפי טבלת השערים כאן. הטבלה נשלפת בבקשה אחת לכל
+המטבעות, פעם ב-FX_RATES_TTL שניות - שינוי שער הוא עדכון אחד של ה-cache
+ולא עדכון מחדש של כל ההחזקות. השליפה רצה בתהליכון רקע: קריאה מהמסד לא
+ממתינה לרשת, ועד שהטבלה מגיעה משתמשים בשערים האחרונים הידועים.
+"""
+
+import math  # בדיקת שערים סופיים
+import os  # לעבודה עם משתני סביבה
+import re  # לבדיקת קודי מטבע
+import threading  # נעילה לרענון הטבלה
+import time  # לתוקף ה-cache
+
+import httpsession  # חיבור HTTP משותף עם keep-alive
+
+# הגדרות שערי המטבע - ניתן לשנות דרך משתני סביבה
+FX_BASE_CURRENCY = 'ILS'  # המטבע שבו מוצגים כל הסכומים
+FX_RATES_URL = os.environ.get('FX_RATES_URL', 'https://open.er-api.com/v6/latest/ILS')  # כל השערים בבקשה אחת
+FX_RATES_TTL = float(os.environ.get('FX_RATES_TTL', 3600))  # שניות עד רענון הטבלה
+FX_RETRY_INTERVAL = 60  # שניות עד ניסיון חוזר אחרי כישלון - בינתיים נשארים השערים האחרונים
+FX_CURRENCIES = tuple(
+    code.strip().upper() for code in os.environ.get('FX_CURRENCIES', 'USD,EUR,GBP').split(',') if code.strip()
+)
+FX_FALLBACK_RATES = {'USD': 3.5}  # שקלים ליחידה - עד שהטבלה הראשונה מתקבלת
+
+CURRENCY_CODE = re.compile(r'^[A-Z]{3}$')  # קוד ISO - נכנס כטקסט לביטויי SQL
+
+
+class FxRates:
+    """טבלת שערים (שקלים ליחידת מטבע) עם תוקף - רענון אחד לכל המטבעות"""
+
+    def __init__(self, url=FX_RATES_URL, ttl=FX_RATES_TTL, currencies=FX_CURRENCIES,
+                 fallback_rates=FX_FALLBACK_RATES, fetch_rates=None):
+        """fetch_rates היא פונקציה בלי פרמטרים שמחזירה {מטבע: שקלים ליחידה}
+
+        בלי fetch_rates הטבלה נשלפת מ-url - תשובה בפורמט {"rates": {"USD": 0.27, ...}}
+        שבה כל שער הוא כמה יחידות מטבע שווה שקל אחד.
+        """
+        self.url = url
+        self.ttl = ttl
+        self.currencies = tuple(currencies)
+        self.fetch_rates = fetch_rates or self._fetch_rates
+        self._rates = {FX_BASE_CURRENCY: 1.0}
+        self._rates.update(self._valid_rates(fallback_rates))
+        self._expires_at = 0.0  # הטבלה הראשונה נשלפת בקריאה הראשונה
+        self._refresh_lock = threading.Lock()  # רענון אחד בכל פעם
+        self.version = 0  # עולה בכל שינוי של שער
+        self.updated_at = None  # מתי התקבלה הטבלה האחרונה
+        self.refreshes = 0
+        self.failures = 0
+
+    def _fetch_rates(self):
+        """שליפת כל השערים בבקשה אחת והיפוך לשקלים ליחידה"""
+        response = httpsession.get(self.url, timeout=10)
+        response.raise_for_status()
+        per_shekel = response.json()['rates']
+        return {
+            currency: 1.0 / float(per_shekel[currency])
+            for currency in self.currencies
+            if per_shekel.get(currency)
+        }
+
+    def refresh(self):
+        """שליפת הטבלה מחדש - מחזיר True אם הצליח; בכישלון נשארים השערים הקודמים"""
+        try:
+            rates = self.fetch_rates()
+        except Exception as e:
+            self.failures += 1
+            self._expires_at = time.time() + FX_RETRY_INTERVAL
+            print(f"❌ שגיאה בקבלת שערי מטבע: {e}")
+            return False
+
+        self.set_rates(rates)
+        self.refreshes += 1
+        self.updated_at = time.time()
+        self._expires_at = self.updated_at + self.ttl
+        return True
+
+    @staticmethod
+    def _valid_rates(rates):
+        """רק שערים שאפשר להכניס לביטוי SQL - קוד ISO ומספר סופי וחיובי; השאר מדולגים"""
+        valid = {}
+        for currency, rate in rates.items():
+            currency = str(currency).upper()
+            try:
+                rate = float(rate)
+            except (TypeError, ValueError):
+                continue
+            if CURRENCY_CODE.match(currency) and math.isfinite(rate) and rate > 0:  # inf / nan ישברו כל קריאה
+                valid[currency] = rate
+        return valid
+
+    def set_rates(self, rates):
+        """עדכון שערים (שקלים ליחידה) - הגרסה עולה רק אם משהו השתנה; שער לא תקין נשאר הקודם"""
+        new_rates = dict(self._rates)
+        new_rates.update(self._valid_rates(rates))
+        new_rates[FX_BASE_CURRENCY] = 1.0
+        if new_rates != self._rates:
+            self._rates = new_rates  # החלפה אחת - קוראים רואים טבלה שלמה, ישנה או חדשה
+            self.version += 1
+
+    def get_rates(self):
+        """הטבלה הנוכחית, בלי להמתין לרשת - אם פג תוקפה, רענון מתחיל ברקע
+
+        רק תהליכון רקע אחד שולף; עד שהוא מסיים כולם ממשיכים עם הטבלה הקודמת
+        (או FX_FALLBACK_RATES לפני הטבלה הראשונה).
+        """
+        if time.time() >= self._expires_at and self._refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, name='fx-rates', daemon=True).start()
+        return self._rates
+
+    def _refresh_in_background(self):
+        """גוף תהליכון הרענון - משחרר את הנעילה בסיום"""
+        try:
+            if time.time() >= self._expires_at:
+                self.refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def get_version(self):
+        """גרסת הטבלה הנוכחית (ומתחיל רענון ברקע אם צריך) - ל-cache שתלוי בשערים"""
+        self.get_rates()
+        return self.version
+
+    def rate(self, currency):
+        """שקלים ליחידת מטבע - None אם המטבע לא מוכר"""
+        return self.get_rates().get((currency or FX_BASE_CURRENCY).upper())
+
+    def convert(self, amount, currency):
+        """המרת סכום לשקלים - None אם הסכום חסר או המטבע לא מוכר"""
+        rate = self.rate(currency)
+        if amount is None or rate is None:
+            return None
+        return float(amount) * rate
+
+    def get_stats(self):
+        """מידע לתצוגה - השערים, גרסה ומתי עודכנו"""
+        return {
+            'base': FX_BASE_CURRENCY,
+            'rates': dict(self._rates),
+            'version': self.version,
+            'updated_at': self.updated_at,
+            'ttl': self.ttl,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+        }
+
+
+fx_rates = FxRates()  # הטבלה המשותפת לכל התהליך
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+httpsession.py - חיבור HTTP משותף לכל הבקשות החיצוניות
+
+כאן מוגדר requests.Session אחד לכל התהליך - חיבורי keep-alive נשמרים במאגר
+ומשמשים שוב, כך שבקשה חוזרת לאותו שרת לא משלמת שוב על DNS ו-TLS.
+משמש את Broker (Alpha Vantage) ואת בדיקת הזמינות של Ollama.
+"""
+
+import os  # לעבודה עם משתני סביבה
+import threading  # נעילה ליצירת ה-session
+
+import requests  # לבקשות HTTP
+from requests.adapters import HTTPAdapter  # מאגר חיבורים לכל שרת
+from urllib3.util.retry import Retry  # ניסיונות חוזרים עם backoff
+
+# הגדרות החיבור - ניתן לשנות דרך משתני סביבה
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))  # חיבורים פתוחים לכל שרת
+HTTP_CONNECT_RETRIES = int(os.environ.get('HTTP_CONNECT_RETRIES', 2))  # ניסיונות חוזרים בשגיאת התחברות
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.3))  # המתנה בין ניסיונות: 0.3, 0.6, 1.2...
+
+_session = None  # ה-session המשותף - נוצר בשימוש הראשון
+_session_lock = threading.Lock()
+
+
+def create_session(pool_size=HTTP_POOL_SIZE, connect_retries=HTTP_CONNECT_RETRIES,
+                   backoff_factor=HTTP_BACKOFF_FACTOR):
+    """יצירת session עם מאגר חיבורים וניסיונות חוזרים
+
+    ניסיון חוזר רק כשההתחברות נכשלה - הבקשה עוד לא הגיעה לשרת, ולכן בטוח
+    לשלוח אותה שוב. שגיאת קריאה או קוד שגיאה מהשרת לא נשלחים שוב.
+    """
+    retry = Retry(
+        total=connect_retries,
+        connect=connect_retries,
+        read=0,
+        status=0,
+        backoff_factor=backoff_factor,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """ה-session המשותף - מאגר החיבורים של urllib3 בטוח לשימוש מכמה תהליכונים"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def get(url, **kwargs):
+    """בקשת GET דרך ה-session המשותף - אותם פרמטרים כמו requests.get"""
+    return get_session().get(url, **kwargs)
+
+
+def close_session():
+    """סגירת כל החיבורים הפתוחים - ה-session הבא ייווצר מחדש"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
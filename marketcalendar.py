@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+marketcalendar.py - שעות מסחר וחגים של הבורסות
+
+כאן מוגדר ExchangeCalendar - מתי הבורסה פתוחה (לפי אזור הזמן שלה), מתי
+נסגר המסחר האחרון ומתי ייפתח הבא. Broker ו-PriceRefresher משתמשים בו כדי
+לא לבקש מחירים כשהבורסה סגורה: מחיר הסגירה נשאר ב-cache ובמסד עד הפתיחה.
+- US - NYSE/NASDAQ, חגים מחושבים לפי הכללים של NYSE, מחירים בדולרים
+- TASE - הבורסה בתל אביב (סמלים עם סיומת .TA), מסחר בימים שני עד שישי,
+  מחירים בשקלים - הספקים מחזירים אותם באגורות
+"""
+
+import os  # לעבודה עם משתני סביבה
+from datetime import date, datetime, time as dtime, timedelta  # תאריכים ושעות
+
+import pytz  # אזורי זמן
+
+MARKET_HOURS_ENABLED = os.environ.get('MARKET_HOURS_ENABLED', '1').lower() in ('1', 'true', 'yes', 'on')
+
+# ימי חג בבורסה בתל אביב - רשימה חלקית לפי לוח הבורסה, ניתן להשלים דרך TASE_HOLIDAYS (YYYY-MM-DD,...)
+TASE_HOLIDAYS = {
+    date(2026, 4, 2),  # פסח
+    date(2026, 4, 8),  # שביעי של פסח
+    date(2026, 4, 22),  # יום העצמאות
+    date(2026, 5, 22),  # שבועות
+    date(2026, 9, 21),  # יום כיפור
+}
+TASE_HOLIDAYS.update(
+    date.fromisoformat(day.strip()) for day in os.environ.get('TASE_HOLIDAYS', '').split(',') if day.strip()
+)
+
+SESSION_SEARCH_DAYS = 14  # כמה ימים לחפש אחורה / קדימה מסחר קודם או הבא
+
+
+def _nth_weekday(year, month, weekday, n):
+    """היום ה-n בחודש שהוא weekday (0 = שני); n=-1 - האחרון בחודש"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    last = next_month - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    """יום ראשון של הפסחא (לוח גרגוריאני) - לחישוב Good Friday"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day):
+    """חג שנופל בסוף שבוע - שבת עוברת לשישי, ראשון לשני"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def us_holidays(year):
+    """ימי החג של NYSE בשנה"""
+    new_year = date(year, 1, 1)
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),  # Presidents' Day
+        _easter(year) - timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed(date(year, 6, 19)),  # Juneteenth
+        _observed(date(year, 7, 4)),  # Independence Day
+        _nth_weekday(year, 9, 0, 1),  # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        _observed(date(year, 12, 25)),  # Christmas
+    }
+    if new_year.weekday() != 5:  # ראש השנה בשבת לא עובר לשישי של השנה הקודמת
+        holidays.add(_observed(new_year))
+    return holidays
+
+
+class ExchangeCalendar:
+    """ימי ושעות המסחר של בורסה אחת - כל הזמנים מחושבים באזור הזמן שלה"""
+
+    def __init__(self, code, timezone, sessions, holidays, currency='USD', quote_scale=1.0):
+        """sessions ממפה יום בשבוע (0 = שני) ל-(פתיחה, סגירה); holidays היא פונקציה שנה -> set של תאריכים
+
+        currency הוא מטבע המסחר, ו-quote_scale ממיר מחיר מהספק ליחידות המטבע (0.01 - אגורות לשקלים).
+        """
+        self.code = code
+        self.currency = currency
+        self.quote_scale = quote_scale
+        self.timezone = pytz.timezone(timezone)
+        self.sessions = sessions
+        self.holidays = holidays
+        self._holiday_cache = {}  # שנה -> ימי חג
+
+    def _local(self, when):
+        """הזמן באזור הזמן של הבורסה - when הוא datetime עם אזור זמן (ברירת מחדל - עכשיו)"""
+        when = when or datetime.now(pytz.utc)
+        return when.astimezone(self.timezone)
+
+    def is_trading_day(self, day):
+        """האם יש מסחר בתאריך"""
+        if day.weekday() not in self.sessions:
+            return False
+        if day.year not in self._holiday_cache:
+            self._holiday_cache[day.year] = self.holidays(day.year)
+        return day not in self._holiday_cache[day.year]
+
+    def _session(self, day):
+        """(פתיחה, סגירה) כ-datetime מקומי, או None אם אין מסחר"""
+        if not self.is_trading_day(day):
+            return None
+        open_time, close_time = self.sessions[day.weekday()]
+        return (self.timezone.localize(datetime.combine(day, open_time)),
+                self.timezone.localize(datetime.combine(day, close_time)))
+
+    def is_open(self, when=None):
+        """האם הבורסה פתוחה עכשיו (או ב-when)"""
+        local = self._local(when)
+        session = self._session(local.date())
+        return session is not None and session[0] <= local < session[1]
+
+    def last_close(self, when=None):
+        """סיום המסחר האחרון שכבר הסתיים - None אם אין בטווח החיפוש"""
+        local = self._local(when)
+        for days_back in range(SESSION_SEARCH_DAYS):
+            session = self._session(local.date() - timedelta(days=days_back))
+            if session is not None and session[1] <= local:
+                return session[1]
+        return None
+
+    def next_open(self, when=None):
+        """פתיחת המסחר הבא - when עצמו אם הבורסה פתוחה; None אם אין בטווח החיפוש"""
+        local = self._local(when)
+        for days_ahead in range(SESSION_SEARCH_DAYS):
+            session = self._session(local.date() + timedelta(days=days_ahead))
+            if session is not None and local < session[1]:
+                return max(session[0], local)
+        return None
+
+    def seconds_until_open(self, when=None):
+        """שניות עד פתיחת המסחר הבא - 0 אם פתוחה"""
+        local = self._local(when)
+        next_open = self.next_open(local)
+        return max(0.0, (next_open - local).total_seconds()) if next_open is not None else 0.0
+
+    def get_stats(self, when=None):
+        """מידע לתצוגה"""
+        local = self._local(when)
+        last_close = self.last_close(local)
+        next_open = self.next_open(local)
+        return {
+            'open': self.is_open(local),
+            'local_time': local.isoformat(),
+            'last_close': last_close.isoformat() if last_close else None,
+            'next_open': next_open.isoformat() if next_open else None,
+        }
+
+
+# ימים ושעות מסחר - 0 הוא שני
+US_SESSIONS = {weekday: (dtime(9, 30), dtime(16, 0)) for weekday in range(5)}
+TASE_SESSIONS = {weekday: (dtime(9, 59), dtime(17, 25)) for weekday in range(4)}
+TASE_SESSIONS[4] = (dtime(9, 59), dtime(13, 50))  # שישי - יום מסחר מקוצר
+
+EXCHANGES = {
+    'US': ExchangeCalendar('US', 'America/New_York', US_SESSIONS, us_holidays),
+    'TASE': ExchangeCalendar('TASE', 'Asia/Jerusalem', TASE_SESSIONS,
+                             lambda year: {day for day in TASE_HOLIDAYS if day.year == year},
+                             currency='ILS', quote_scale=0.01),
+}
+
+
+def exchange_for_symbol(symbol):
+    """הבורסה של סמל - סיומת .TA היא תל אביב, כל השאר ארה"ב"""
+    if symbol and str(symbol).upper().endswith('.TA'):
+        return EXCHANGES['TASE']
+    return EXCHANGES['US']
+
+
+def quote_currency(symbol):
+    """המטבע שבו נסחר הסמל - לפי הבורסה שלו"""
+    return exchange_for_symbol(symbol).currency
+
+
+def scale_quote(symbol, price):
+    """מחיר מהספק ביחידות המטבע של הסמל - למשל אגורות לשקלים בתל אביב"""
+    return price * exchange_for_symbol(symbol).quote_scale
+
+
+def is_market_open(symbol, when=None):
+    """האם הבורסה של הסמל פתוחה - תמיד True כש-MARKET_HOURS_ENABLED כבוי"""
+    return not MARKET_HOURS_ENABLED or exchange_for_symbol(symbol).is_open(when)
+
+
+def has_closing_price(symbol, updated_at, when=None):
+    """האם מחיר שעודכן ב-updated_at (שניות epoch) כבר כולל את הסגירה האחרונה
+
+    כך כשהבורסה סגורה, מחיר שנשלף אחרי הסגירה לא נשלף שוב עד הפתיחה.
+    """
+    if not MARKET_HOURS_ENABLED or updated_at is None:
+        return False
+    calendar = exchange_for_symbol(symbol)
+    if calendar.is_open(when):
+        return False
+    last_close = calendar.last_close(when)
+    return last_close is not None and updated_at >= last_close.timestamp()
+
+
+def seconds_until_open(symbol, when=None):
+    """שניות עד שהבורסה של הסמל תיפתח - 0 אם פתוחה או אם השעון כבוי"""
+    if not MARKET_HOURS_ENABLED:
+        return 0.0
+    return exchange_for_symbol(symbol).seconds_until_open(when)
@@ -9,13 +9,17 @@
 # ייבוא הספריות שאני צריך
 import ollama  # פה אני מביא כלי שמאפשר לי לדבר עם שירות Ollama
 import os  # כלי לעבודה עם קבצים וסביבה
-import requests  # כלי לבדיקת חיבור לשרת
+import requests  # חריגות HTTP בבדיקת חיבור לשרת
+import httpsession  # חיבור HTTP משותף - בדיקות זמינות חוזרות בלי חיבור חדש
 import re  # לעבודה עם ביטויים רגולריים - ניקוי טקסט
 
 
 class AI_Agent:  # סוכן בינה מלאכותית לייעוץ השקעות מקצועי
     """מחלקת הבינה המלאכותית לייעוץ השקעות - מתחברת לשירות Ollama"""
     
+    PROMPT_VERSION = 1  # להעלות בכל שינוי ב-prompt - ייעוצים שמורים מה-prompt הקודם לא יוגשו
+    DEFAULT_RISK_PROFILE = "בינוני"  # פרופיל הסיכון בייעוץ הכללי
+    
     def __init__(self):
         """Initialize AI agent and connect to Ollama service"""
         print("=== Starting AI_Agent initialization ===")
@@ -82,7 +86,7 @@ class AI_Agent:  # סוכן בינה מלאכותית לייעוץ השקעות
             print("Checking Ollama availability...")
             print(f"Trying to connect to Ollama at: {self.ollama_url}")
             # Try to connect to Ollama server with 3 second timeout
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=3)
+            response = httpsession.get(f"{self.ollama_url}/api/tags", timeout=3)
             print(f"Response from Ollama: {response.status_code}")
             if response.status_code == 200:  # If response is OK
                 print("Ollama is available and running!")
@@ -489,7 +493,7 @@ Keep response under 300 words, professional tone."""
         """פונקציה כללית לקבלת ייעוץ - משתמשת בפונקציה הפשוטה או מפורטת"""
         if portfolio_data:  # אם יש נתוני תיק
             # נתן ייעוץ מותאם אישית
-            return self.get_investment_advice(portfolio_data, "בינוני")
+            return self.get_investment_advice(portfolio_data, self.DEFAULT_RISK_PROFILE)
         else:  # אם אין נתוני תיק
             # נתן ייעוץ כללי
             return self.get_simple_advice()
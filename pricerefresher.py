@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+pricerefresher.py - עדכון מחירים מקבילי לכל התיק, גם ברקע
+
+כאן מוגדר PriceRefresher - מושך מחירים לכל הסמלים בתיק במקביל (עם הגבלת
+מספר בקשות בו זמנית), כותב את כולם בעדכון מרוכז אחד ומחזיר דוח לכל סמל.
+הכל מונע מעמודת symbol: כל סמל נשלף פעם אחת גם אם הוא מוחזק בכמה שורות,
+ושורה בלי סמל מסחר (רק שם תצוגה) לא שולחת בקשה לספק. כשהבורסה של הסמל
+סגורה ומחיר הסגירה כבר במסד, הסמל לא נשלף שוב עד פתיחת המסחר.
+במצב רקע הוא רץ בתהליכון ומעדכן רק מחירים שעבר זמן היעד שלהם לפי סוג
+נייר הערך - החזקות גדולות וישנות קודם, כך שבקשות לאתר רק קוראות מהמסד.
+
+הפעלה כתהליך נפרד (במקום תהליכון בכל worker של השרת):
+    python pricerefresher.py
+"""
+
+import os  # לעבודה עם משתני סביבה
+import sys  # לעבודה עם נתיב המערכת
+import threading  # תהליכון הרקע
+import time  # למדידת משך העדכון
+from concurrent.futures import ThreadPoolExecutor, as_completed  # בקשות API במקביל
+
+from dbmodel import Broker  # מחירי מניות
+from fxrates import fx_rates  # שערי מטבע
+from marketcalendar import EXCHANGES, MARKET_HOURS_ENABLED, has_closing_price, seconds_until_open  # שעות מסחר
+from quoteproviders import normalize_ticker  # רק סמלי מסחר נשלחים לספק
+
+# מקסימום בקשות API בו זמנית - ניתן לשנות דרך משתנה סביבה
+PRICE_REFRESH_WORKERS = int(os.environ.get('PRICE_REFRESH_WORKERS', 8))
+
+# עדכון ברקע - כל כמה זמן בודקים, וכמה סמלים לכל היותר בכל סבב
+PRICE_REFRESHER_ENABLED = os.environ.get('PRICE_REFRESHER_ENABLED', '').lower() in ('1', 'true', 'yes', 'on')
+PRICE_REFRESH_INTERVAL = float(os.environ.get('PRICE_REFRESH_INTERVAL', 30))  # שניות בין סבבים
+PRICE_REFRESH_MAX_SYMBOLS = int(os.environ.get('PRICE_REFRESH_MAX_SYMBOLS', 50))  # סמלים בסבב
+PRICE_REFRESH_DEADLINE = float(os.environ.get('PRICE_REFRESH_DEADLINE', 60))  # שניות לכל היותר לשליפת המחירים בסבב
+PRICE_REFRESH_CLOSED_INTERVAL = float(os.environ.get('PRICE_REFRESH_CLOSED_INTERVAL', 600))  # כשכל הבורסות סגורות
+
+# כמה זמן (בשניות) מחיר נחשב טרי לפי סוג נייר הערך
+STALENESS_TARGETS = {
+    'מניה': 5 * 60,  # מניות - כל כמה דקות
+    'אגח ממשלתית': 6 * 3600,  # אגרות חוב זזות לאט
+    'אגח קונצרנית': 6 * 3600,
+}
+DEFAULT_STALENESS_TARGET = 15 * 60  # סוגים אחרים
+
+FAILED_SYMBOL_BACKOFF = 60  # שניות עד ניסיון חוזר לסמל שנכשל (מוכפל בכל כישלון)
+FAILED_SYMBOL_MAX_BACKOFF = 3600  # מקסימום המתנה לסמל שנכשל
+
+
+class PriceRefresher:
+    """עדכון מחירי כל ניירות הערך במקביל - במקום בקשה אחר בקשה בתוך ה-HTTP request"""
+
+    def __init__(self, portfolio_model, max_workers=PRICE_REFRESH_WORKERS, fetch_price=None, currency=None):
+        """fetch_price היא פונקציה symbol -> מחיר או None, במטבע currency
+
+        בלי fetch_price המחירים נשלפים ב-Broker.update_prices - בקשות מרוכזות
+        לקבוצות סמלים, ובקשות בודדות במקביל רק לסמלים שנכשלו. בלי currency
+        כל מחיר נשמר במטבע המסחר של הסמל (Broker.currency).
+        """
+        self.portfolio_model = portfolio_model  # מסד הנתונים
+        self.max_workers = max(1, max_workers)  # הגבלת מקביליות
+        self.fetch_price = fetch_price
+        self.currency = currency
+        self._failed_symbols = {}  # סמל -> (זמן הניסיון הבא, המתנה נוכחית)
+        self._no_ticker_ids = set()  # שורות בלי סמל מסחר - לא מוחזרות שוב בסבבי הרקע
+        self._market_closed_ids = {}  # id -> זמן הפתיחה הבאה (monotonic) - יש כבר מחיר סגירה
+        self.calls_avoided = 0  # בקשות שלא נשלחו כי הבורסה סגורה ומחיר הסגירה כבר במסד
+        self._thread = None  # תהליכון הרקע
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()  # להקדמת הסבב הבא
+        self.last_report = None  # דוח הסבב האחרון ברקע
+
+    @staticmethod
+    def _quote_symbol(security):
+        """הסמל שלפיו מבקשים מחיר - עמודת symbol בלבד; None אם אין סמל מסחר"""
+        return normalize_ticker(security['symbol'])
+
+    def _symbol_index(self, securities):
+        """אינדקס סמל -> שורות, נבנה פעם אחת לכל סבב - מחזיר (אינדקס, שורות בלי סמל מסחר)"""
+        index = {}
+        no_ticker = []
+        for security in securities:
+            symbol = self._quote_symbol(security)
+            if symbol is None:
+                no_ticker.append(security)
+            else:
+                index.setdefault(symbol, []).append(security)
+        return index, no_ticker
+
+    def fetch_prices(self, symbols, deadline=None):
+        """מחיר לכל סמל במקביל - מחזיר {symbol: (מחיר או None, שגיאה או None)}
+
+        deadline (time.monotonic) - אחריו לא נשלחות בקשות נוספות, והסמלים שנשארו בלי מחיר.
+        """
+        results = {}
+        symbols = list(dict.fromkeys(symbols))  # כל סמל נשלף פעם אחת, לפי הסדר
+        if not symbols:
+            return results
+
+        if self.fetch_price is None:  # בקשות מרוכזות דרך Broker
+            prices = Broker.update_prices(symbols, max_workers=self.max_workers, deadline=deadline)
+            return {symbol: (prices.get(symbol), None) for symbol in symbols}
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(symbols))) as executor:
+            futures = {executor.submit(self.fetch_price, symbol): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    results[symbol] = (future.result(), None)
+                except Exception as e:  # שגיאה בסמל אחד לא עוצרת את השאר
+                    results[symbol] = (None, str(e))
+        return results
+
+    def refresh_all(self):
+        """עדכון כל התיק - מחזיר דוח: סיכום וגם שורה לכל נייר ערך
+
+        status לכל שורה: updated / no_price / error / no_symbol (אין סמל מסחר -
+        לא נשלחה בקשה) / market_closed (הבורסה סגורה ומחיר הסגירה כבר במסד -
+        לא נשלחה בקשה) / not_updated (המחיר התקבל אבל השורה לא עודכנה במסד,
+        למשל כי נמחקה בינתיים).
+        """
+        return self._refresh(self.portfolio_model.get_all_securities())
+
+    def _refresh_budget(self):
+        """כמה סמלים לעדכן בסבב - לפי המכסה הפנויה אצל ספק המחירים (אם יש לו מכסה)"""
+        budget = None if self.fetch_price is not None else Broker.request_budget()
+        if budget is None:
+            return PRICE_REFRESH_MAX_SYMBOLS
+        return min(PRICE_REFRESH_MAX_SYMBOLS, budget)
+
+    def refresh_due(self, limit=None):
+        """סבב אחד: עדכון ניירות הערך שהמחיר שלהם ישן, הדחופים קודם ועד limit סמלים
+
+        סמל שנכשל מקבל המתנה הולכת וגדלה, כדי שלא יתקע בראש התור ויחסום את השאר.
+        הסמלים בהמתנה מוחרגים כבר בשאילתה - גם כשרבים מהם נכשלים, הסבב מקבל
+        עד limit סמלים תקינים.
+        """
+        limit = self._refresh_budget() if limit is None else limit
+        if limit <= 0:
+            return self._refresh([])
+        if self.fetch_price is None and not Broker.is_available():
+            return self._refresh([])  # המפסק פתוח - המחירים האחרונים נשארים במסד עד שהספק חוזר
+
+        now = time.monotonic()
+        self._market_closed_ids = {security_id: opens_at for security_id, opens_at
+                                   in self._market_closed_ids.items() if opens_at > now}
+        backed_off = [symbol for symbol, (retry_at, _) in self._failed_symbols.items() if retry_at > now]
+        candidates = self.portfolio_model.get_stale_securities(
+            STALENESS_TARGETS, DEFAULT_STALENESS_TARGET, limit * 4,  # מרווח לשורות עם אותו סמל
+            exclude_ids=self._no_ticker_ids | self._market_closed_ids.keys(),
+            exclude_symbols=backed_off
+        )
+        symbols = []
+        securities = []
+        for security in candidates:
+            symbol = self._quote_symbol(security)
+            if symbol is None:
+                self._no_ticker_ids.add(security['id'])
+                continue
+            if symbol not in symbols:
+                if len(symbols) >= limit:
+                    continue
+                symbols.append(symbol)
+            securities.append(security)
+
+        report = self._refresh(securities)
+        for result in report['results']:  # מחיר הסגירה במסד - לא חוזרים לשורה עד פתיחת המסחר
+            if result['status'] == 'market_closed':
+                self._market_closed_ids[result['id']] = now + seconds_until_open(result['symbol'])
+        fetched = {result['symbol']: result['native_price'] is not None
+                   for result in report['results'] if result['status'] not in ('no_symbol', 'market_closed')}
+        for symbol, got_price in fetched.items():  # עדכון המתנה לסמלים שנכשלו
+            if got_price:
+                self._failed_symbols.pop(symbol, None)
+            else:
+                previous_delay = self._failed_symbols.get(symbol, (0, 0))[1]
+                delay = min(FAILED_SYMBOL_MAX_BACKOFF, previous_delay * 2 or FAILED_SYMBOL_BACKOFF)
+                self._failed_symbols[symbol] = (now + delay, delay)
+        return report
+
+    def _refresh(self, securities):
+        """שליפת מחירים לניירות הערך, עדכון מרוכז לפי id (אחד לכל מטבע) ובניית הדוח
+
+        בקשה אחת לכל סמל ייחודי, והמחיר שלו נכתב לכל השורות שמחזיקות אותו.
+        המחירים נשמרים במטבע המקורי; בדוח old_price ו-new_price בשקלים להשוואה.
+        """
+        started = time.monotonic()
+        index, no_ticker = self._symbol_index(securities)
+        currencies = {symbol: self.currency or Broker.currency(symbol) for symbol in index}
+        closed = {symbol for symbol, rows in index.items()  # כל השורות כבר עם מחיר הסגירה
+                  if all(has_closing_price(symbol, security['price_updated_at']) for security in rows)}
+        for symbol in closed:
+            del index[symbol]
+        self.calls_avoided += len(closed)
+        quotes = self.fetch_prices(index, deadline=started + PRICE_REFRESH_DEADLINE)
+
+        # עדכון מרוכז לפי id לכל מטבע - מחיר אחד לכל השורות עם אותו סמל
+        updates_by_currency = {}
+        for symbol, rows in index.items():
+            if quotes[symbol][0] is not None:
+                updates_by_currency.setdefault(currencies[symbol], []).extend(
+                    (security['id'], quotes[symbol][0]) for security in rows
+                )
+        outcomes = {}
+        for currency, updates in updates_by_currency.items():
+            outcomes.update(zip((security_id for security_id, _ in updates),
+                                self.portfolio_model.update_prices_many(updates, key='id', currency=currency)))
+
+        results = []
+        for security in securities:
+            symbol = self._quote_symbol(security)
+            price, error = quotes[symbol] if symbol in index else (None, None)
+            currency = currencies.get(symbol)
+            if symbol is None:
+                status = 'no_symbol'
+            elif symbol in closed:
+                status = 'market_closed'
+            elif error is not None:
+                status = 'error'
+            elif price is None:
+                status = 'no_price'
+            elif outcomes.get(security['id']):
+                status = 'updated'
+            else:
+                status = 'not_updated'
+            results.append({
+                'id': security['id'],
+                'name': security['name'],
+                'symbol': symbol or security['symbol'],
+                'old_price': security['price'],
+                'new_price': fx_rates.convert(price, currency),
+                'native_price': price,
+                'currency': currency,
+                'status': status,
+                'error': error,
+            })
+
+        updated = sum(1 for result in results if result['status'] == 'updated')
+        market_closed = sum(1 for result in results if result['status'] == 'market_closed')
+        return {
+            'total': len(results),
+            'updated': updated,
+            'failed': len(results) - updated - len(no_ticker) - market_closed,
+            'skipped': len(no_ticker),
+            'market_closed': market_closed,
+            'calls_avoided': len(closed),
+            'symbols': len(index),
+            'duration': round(time.monotonic() - started, 3),
+            'results': results,
+        }
+
+    @staticmethod
+    def _round_interval(interval):
+        """המתנה עד הסבב הבא - ארוכה יותר כשכל הבורסות סגורות"""
+        if MARKET_HOURS_ENABLED and not any(calendar.is_open() for calendar in EXCHANGES.values()):
+            return max(interval, PRICE_REFRESH_CLOSED_INTERVAL)
+        return interval
+
+    def run_forever(self, interval=PRICE_REFRESH_INTERVAL):
+        """לולאת הרקע - סבב כל interval שניות עד stop() (או פחות תכוף כשהבורסות סגורות)"""
+        print(f"🔄 עדכון מחירים ברקע פעיל - סבב כל {interval:g} שניות")
+        while not self._stop_event.is_set():
+            try:
+                fx_rates.get_rates()  # מתחיל רענון ברקע של טבלת השערים כשפג תוקפה
+                report = self.refresh_due()
+                self.last_report = {key: value for key, value in report.items() if key != 'results'}
+                self.last_report['finished_at'] = time.time()
+                if report['total']:
+                    print(f"🔄 עדכון ברקע: {report['updated']}/{report['total']} ניירות ערך "
+                          f"({report['duration']:.1f} שניות)")
+            except Exception as e:  # שגיאה בסבב אחד לא עוצרת את הלולאה
+                print(f"❌ שגיאה בעדכון מחירים ברקע: {e}")
+            self._wake_event.wait(self._round_interval(interval))
+            self._wake_event.clear()
+
+    def start(self, interval=PRICE_REFRESH_INTERVAL):
+        """הפעלת העדכון ברקע בתהליכון daemon - פעם אחת בלבד"""
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run_forever, args=(interval,),
+                                        name='price-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """עצירת תהליכון הרקע"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        """הקדמת הסבב הבא - למשל אחרי הוספת נייר ערך"""
+        self._wake_event.set()
+
+    def is_running(self):
+        """האם תהליכון הרקע פעיל"""
+        return self._thread is not None and self._thread.is_alive()
+
+
+def main():
+    """עדכון מחירים כתהליך נפרד - אותו מסד נתונים כמו השרת"""
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from dbmodel import PortfolioModel  # מסד הנתונים
+
+    portfolio_model = PortfolioModel()
+    Broker.add_price_listener(portfolio_model.record_price)  # גם כאן כל מחיר נשמר בהיסטוריה
+    refresher = PriceRefresher(portfolio_model)
+    try:
+        refresher.run_forever()
+    except KeyboardInterrupt:
+        print("👋 עדכון המחירים ברקע נעצר")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,598 @@
+# -*- coding: utf-8 -*-
+"""
+quoteproviders.py - ספקי מחירי מניות מאחורי Broker
+
+כל ספק מממש את אותו ממשק (QuoteProvider): מחיר לסמל אחד ומחירים לקבוצת
+סמלים, כפי שהבורסה מפרסמת אותם (בתל אביב - באגורות). Broker מוסיף מעל זה
+cache ו-listeners ואת המטבע של כל סמל (marketcalendar), וההמרה לשקלים
+נעשית בזמן הקריאה מהמסד (fxrates).
+- AlphaVantageProvider - ה-API הקיים, עם מכסה לכל מפתח (ApiKeyPool)
+- YFinanceProvider - הורדה מרוכזת של הרבה סמלים מ-Yahoo Finance
+- ReplayProvider - מחירים מוקלטים מקובץ מקומי, עם השהיה ושגיאות מבוקרות,
+  לבדיקות עומס בלי רשת ובלי לבזבז מכסה
+"""
+
+import json  # לקובץ המחירים המוקלטים
+import os  # לעבודה עם משתני סביבה
+import random  # להזרקת שגיאות דטרמיניסטית
+import re  # לבדיקת סמלי מסחר
+import threading  # לנעילות במאגר המפתחות ובספק ההקלטות
+import time  # לדלי האסימונים ולהשהיה מדומה
+from collections import deque  # זמני תגובה אחרונים
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait  # בקשות מגודרות (hedged)
+
+import httpsession  # חיבור HTTP משותף עם keep-alive
+
+# בדיקת yfinance - אופציונלי, להורדת מחירים של הרבה סמלים בבקשה אחת
+try:
+    import yfinance as yf  # מחירים מ-Yahoo Finance
+    YFINANCE_AVAILABLE = True  # yfinance זמין
+except ImportError:
+    YFINANCE_AVAILABLE = False  # yfinance לא זמין
+
+# מכסות Alpha Vantage לכל מפתח - ניתן לשנות דרך משתני סביבה
+ALPHA_VANTAGE_PER_MINUTE = int(os.environ.get('ALPHA_VANTAGE_PER_MINUTE', 5))  # בקשות לדקה
+ALPHA_VANTAGE_PER_DAY = int(os.environ.get('ALPHA_VANTAGE_PER_DAY', 25))  # בקשות ליום
+ALPHA_VANTAGE_QUEUE_TIMEOUT = float(os.environ.get('ALPHA_VANTAGE_QUEUE_TIMEOUT', 30))  # שניות המתנה למפתח פנוי
+API_KEY_THROTTLE_COOLDOWN = 60  # שניות הפסקה למפתח שקיבל הודעת הגבלה מהספק
+
+# כמה סמלים בבקשה מרוכזת אחת לכל ספק
+YFINANCE_BATCH_SIZE = int(os.environ.get('YFINANCE_BATCH_SIZE', 100))  # סמלים בהורדה אחת של yfinance
+ALPHA_VANTAGE_BULK_SIZE = 100  # מקסימום סמלים ב-REALTIME_BULK_QUOTES
+ALPHA_VANTAGE_PREMIUM = os.environ.get('ALPHA_VANTAGE_PREMIUM', '').lower() in ('1', 'true', 'yes', 'on')  # בקשות מרוכזות
+
+# זמנים לכל בקשה - ניתן לשנות דרך משתני סביבה
+QUOTE_REQUEST_TIMEOUT = float(os.environ.get('QUOTE_REQUEST_TIMEOUT', 10))  # שניות לבקשה אחת לכל היותר
+QUOTE_HEDGE_ENABLED = os.environ.get('QUOTE_HEDGE_ENABLED', '').lower() in ('1', 'true', 'yes', 'on')
+QUOTE_HEDGE_MIN_DELAY = float(os.environ.get('QUOTE_HEDGE_MIN_DELAY', 0.2))  # שניות לפני בקשה מגודרת
+QUOTE_HEDGE_MIN_SAMPLES = 20  # זמני תגובה לפני שמחשבים p95
+QUOTE_LATENCY_SAMPLES = 200  # כמה זמני תגובה אחרונים נשמרים
+
+# סמל מסחר שאפשר לבקש עליו מחיר - AAPL, BRK.B, TEVA.TA, ^GSPC (לא שם תצוגה כמו "Apple Inc" או "אפל")
+TICKER_PATTERN = re.compile(r'^\^?[A-Z0-9][A-Z0-9.\-=]{0,14}$')
+
+# בחירת הספק - alphavantage / yfinance / replay
+QUOTE_PROVIDER = os.environ.get('QUOTE_PROVIDER', 'alphavantage').lower()
+QUOTE_REPLAY_FILE = os.environ.get('QUOTE_REPLAY_FILE', 'quotes_replay.json')  # לספק replay
+QUOTE_REPLAY_LATENCY_MS = float(os.environ.get('QUOTE_REPLAY_LATENCY_MS', 0))  # השהיה מדומה לבקשה
+QUOTE_REPLAY_ERROR_RATE = float(os.environ.get('QUOTE_REPLAY_ERROR_RATE', 0))  # חלק הבקשות שנכשלות (0-1)
+
+
+class QuoteProviderError(Exception):
+    """שגיאה בקבלת מחיר מספק - שגיאת רשת, חריגה מהזמן או שגיאה מוזרקת בספק ההקלטות"""
+    pass
+
+
+class DeadlineExceeded(QuoteProviderError):
+    """נגמר הזמן שהקורא הקצה (deadline) - לא תקלה בספק: לא נספר במפסק ולא במפתח"""
+    pass
+
+
+def normalize_ticker(symbol):
+    """הסמל בפורמט שהספקים מקבלים - None אם זה לא סמל מסחר (למשל שם תצוגה)"""
+    if not symbol:
+        return None
+    symbol = str(symbol).strip().upper()
+    return symbol if TICKER_PATTERN.match(symbol) else None
+
+
+def time_left(deadline, limit=QUOTE_REQUEST_TIMEOUT):
+    """כמה שניות מותר לבקשה - limit, או פחות אם נשאר פחות עד deadline (time.monotonic)
+
+    זורק DeadlineExceeded אם ה-deadline כבר עבר.
+    """
+    if deadline is None:
+        return limit
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("עבר הזמן שהוקצב לבקשה")
+    return min(limit, remaining)
+
+
+def deadline_passed(deadline):
+    """האם ה-deadline (time.monotonic) עבר - שגיאת timeout אחריו היא של הקורא ולא של הספק"""
+    return deadline is not None and time.monotonic() >= deadline
+
+
+class TokenBucket:
+    """דלי אסימונים - rate אסימונים לשנייה, עד capacity. לא בטוח לתהליכונים לבד (ApiKeyPool נועל)"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate  # אסימונים שמתווספים בשנייה
+        self.capacity = capacity  # מקסימום אסימונים (גודל פרץ)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def available(self):
+        """כמה אסימונים יש עכשיו"""
+        self._refill()
+        return self.tokens
+    
+    def wait_time(self):
+        """שניות עד שיהיה אסימון שלם"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self):
+        """לקיחת אסימון - False אם אין"""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ApiKeyPool:
+    """מאגר מפתחות API עם מכסה לכל מפתח - בקשה מקבלת מפתח שיש לו תקציב, או ממתינה בתור
+    
+    לכל מפתח דלי אסימונים לדקה ומונה יומי (מתאפס בחצות UTC), כך שלא שולחים
+    בקשה שהספק ידחה. מפתח שבכל זאת קיבל הודעת הגבלה מושבת ל-API_KEY_THROTTLE_COOLDOWN שניות.
+    """
+    
+    def __init__(self, keys, per_minute=ALPHA_VANTAGE_PER_MINUTE, per_day=ALPHA_VANTAGE_PER_DAY):
+        self._condition = threading.Condition()  # נעילה + המתנה למפתח פנוי
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self._keys = []
+        for index, key in enumerate(keys):
+            self._keys.append({
+                'index': index,
+                'key': key,
+                'bucket': TokenBucket(per_minute / 60.0, per_minute),
+                'day': None,  # היום (UTC) שאליו שייך used_today
+                'used_today': 0,
+                'requests': 0,
+                'successes': 0,
+                'throttled': 0,
+                'errors': 0,
+                'cooldown_until': 0.0,
+                'last_used': None,
+            })
+    
+    def _day_budget(self, state):
+        """כמה בקשות נשארו היום למפתח"""
+        today = time.strftime('%Y-%m-%d', time.gmtime())
+        if state['day'] != today:  # יום חדש - המונה מתאפס
+            state['day'] = today
+            state['used_today'] = 0
+        return self.per_day - state['used_today']
+    
+    def _seconds_until_midnight(self):
+        return 86400 - time.time() % 86400
+    
+    def acquire(self, timeout=ALPHA_VANTAGE_QUEUE_TIMEOUT, exclude=None):
+        """קבלת מפתח עם תקציב - ממתין עד timeout שניות; מחזיר (index, key) או None
+
+        exclude הוא אינדקס מפתח שלא ייבחר - למשל המפתח של הבקשה שאותה מגדרים.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                best = None
+                shortest_wait = None
+                for state in self._keys:
+                    if state['index'] == exclude:
+                        continue
+                    if self._day_budget(state) <= 0:
+                        wait = self._seconds_until_midnight()
+                    elif state['cooldown_until'] > now:
+                        wait = state['cooldown_until'] - now
+                    else:
+                        wait = state['bucket'].wait_time()
+                    if wait == 0 and (best is None or state['bucket'].available() > best['bucket'].available()):
+                        best = state  # המפתח עם הכי הרבה תקציב לדקה
+                    elif wait > 0 and (shortest_wait is None or wait < shortest_wait):
+                        shortest_wait = wait
+                
+                if best is not None:
+                    best['bucket'].take()
+                    best['used_today'] += 1
+                    best['requests'] += 1
+                    best['last_used'] = time.time()
+                    return best['index'], best['key']
+                
+                remaining = deadline - now
+                if remaining <= 0 or shortest_wait is None:
+                    return None  # אין מפתח פנוי בזמן ההמתנה
+                self._condition.wait(min(remaining, shortest_wait))
+    
+    def report(self, index, outcome):
+        """דיווח על תוצאת בקשה - success / throttled / error"""
+        with self._condition:
+            state = self._keys[index]
+            if outcome == 'success':
+                state['successes'] += 1
+            elif outcome == 'throttled':  # הספק הגביל למרות התקציב - הפסקה למפתח
+                state['throttled'] += 1
+                state['cooldown_until'] = time.monotonic() + API_KEY_THROTTLE_COOLDOWN
+            else:
+                state['errors'] += 1
+            self._condition.notify_all()
+    
+    def available_requests(self):
+        """כמה בקשות אפשר לשלוח עכשיו בלי להמתין - סכום על כל המפתחות הפעילים"""
+        with self._condition:
+            now = time.monotonic()
+            total = 0
+            for state in self._keys:
+                if state['cooldown_until'] > now:
+                    continue
+                total += max(0, min(int(state['bucket'].available()), self._day_budget(state)))
+            return total
+    
+    def get_stats(self):
+        """שימוש ובריאות לכל מפתח - לתצוגה ב-/api-keys-status"""
+        with self._condition:
+            now = time.monotonic()
+            stats = []
+            for state in self._keys:
+                day_remaining = self._day_budget(state)
+                cooldown = max(0.0, state['cooldown_until'] - now)
+                if day_remaining <= 0:
+                    health = 'exhausted'  # המכסה היומית נגמרה
+                elif cooldown > 0:
+                    health = 'cooldown'  # מושבת זמנית אחרי הגבלה
+                else:
+                    health = 'healthy'
+                stats.append({
+                    'index': state['index'],
+                    'health': health,
+                    'minute_tokens': round(state['bucket'].available(), 2),
+                    'per_minute': self.per_minute,
+                    'used_today': state['used_today'],
+                    'per_day': self.per_day,
+                    'requests': state['requests'],
+                    'successes': state['successes'],
+                    'throttled': state['throttled'],
+                    'errors': state['errors'],
+                    'cooldown_seconds': round(cooldown, 1),
+                    'last_used': state['last_used'],
+                })
+            return stats
+
+
+class QuoteProvider:
+    """ממשק ספק מחירים - מחירים ביחידות של הבורסה, None לסמל שאין לו מחיר"""
+    
+    name = 'base'  # שם הספק לתצוגה
+    batch_size = 1  # כמה סמלים בבקשה מרוכזת אחת
+    
+    def get_quote(self, symbol, deadline=None):
+        """מחיר לסמל אחד - deadline (time.monotonic) מגביל את זמן הבקשה"""
+        raise NotImplementedError
+    
+    def get_quotes(self, symbols, deadline=None):
+        """מחירים לקבוצת סמלים (עד batch_size) - {symbol: מחיר}; ברירת מחדל - אחד אחד"""
+        prices = {}
+        for symbol in symbols:
+            price = self.get_quote(symbol, deadline)
+            if price is not None:
+                prices[symbol] = price
+        return prices
+    
+    def request_budget(self):
+        """כמה בקשות אפשר לשלוח עכשיו - None אם אין מגבלה"""
+        return None
+    
+    def get_stats(self):
+        """מידע לתצוגה"""
+        return {'name': self.name, 'batch_size': self.batch_size}
+
+
+class AlphaVantageProvider(QuoteProvider):
+    """Alpha Vantage - GLOBAL_QUOTE לסמל אחד ו-REALTIME_BULK_QUOTES לקבוצה (פרימיום בלבד)"""
+    
+    name = 'alphavantage'
+    
+    def __init__(self, api_keys, base_url="https://www.alphavantage.co/query", hedge=QUOTE_HEDGE_ENABLED,
+                 premium=ALPHA_VANTAGE_PREMIUM):
+        """premium - המפתחות מורשים ל-REALTIME_BULK_QUOTES; בלי זה כל סמל בבקשה משלו"""
+        self.api_keys = list(api_keys)
+        self.batch_size = ALPHA_VANTAGE_BULK_SIZE if premium else 1
+        self.base_url = base_url  # כתובת בסיס של ה-API
+        self.key_pool = ApiKeyPool(self.api_keys)  # מכסה לכל מפתח ותור בקשות
+        self.current_key_index = 0  # אינדקס המפתח האחרון שנבחר (לתצוגה)
+        self.hedge = hedge  # בקשה מגודרת במפתח אחר כשהתשובה מתעכבת
+        self._latencies = deque(maxlen=QUOTE_LATENCY_SAMPLES)  # זמני תגובה אחרונים
+        self._latency_lock = threading.Lock()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=2 * max(1, len(self.api_keys)),
+                                                  thread_name_prefix='quote-hedge') if hedge else None
+        self.hedged_requests = 0  # בקשות מגודרות שנשלחו
+    
+    def get_quote(self, symbol, deadline=None):
+        """מחיר מ-GLOBAL_QUOTE - עם מפתח שיש לו תקציב; אם הספק מגביל, ניסיון במפתח אחר
+        
+        שגיאת רשת זורקת QuoteProviderError וחריגה מה-deadline - DeadlineExceeded;
+        סמל בלי נתונים או מכסה שנוצלה מחזירים None.
+        """
+        for attempt in range(len(self.api_keys)):  # ניסיון נוסף לכל מפתח אם הספק מגביל
+            acquired = self.key_pool.acquire(timeout=time_left(deadline, ALPHA_VANTAGE_QUEUE_TIMEOUT))
+            if acquired is None:
+                print(f"⚠️ אין מפתח API פנוי עבור {symbol} - המכסה נוצלה")
+                return None
+            key_index, current_key = acquired
+            self.current_key_index = key_index
+            
+            outcome, price = self._query_hedged(symbol, key_index, current_key, deadline)
+            if outcome == 'throttled':
+                continue  # נסה שוב עם מפתח אחר
+            if outcome == 'deadline':
+                raise DeadlineExceeded(price)
+            if outcome == 'error':
+                raise QuoteProviderError(price)
+            return price
+        
+        print(f"⚠️ כל המפתחות מוגבלים כרגע - לא התקבל מחיר עבור {symbol}")
+        return None
+    
+    def _query(self, symbol, key_index, current_key, deadline):
+        """בקשת GLOBAL_QUOTE אחת במפתח נתון - מחזיר (outcome, מחיר או הודעת שגיאה)
+        
+        outcome הוא success / empty / throttled / error, והוא גם מדווח למאגר המפתחות.
+        deadline - כשנגמר הזמן של הקורא; לא מדווח, כי המפתח והספק תקינים.
+        """
+        try:
+            print(f"🔍 מנסה לקבל מחיר עבור {symbol} עם מפתח {key_index + 1}")
+            
+            # פרמטרים לבקשת API
+            params = {
+                'function': 'GLOBAL_QUOTE',  # סוג הבקשה - ציטוט גלובלי
+                'symbol': symbol,  # סמל המניה
+                'apikey': current_key  # מפתח ה-API
+            }
+            
+            # שליחת בקשה ל-API - לא יותר מהזמן שנשאר עד ה-deadline
+            started = time.monotonic()
+            response = httpsession.get(self.base_url, params=params, timeout=time_left(deadline))
+            data = response.json()  # המרה ל-JSON
+            self._record_latency(time.monotonic() - started)
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded) or deadline_passed(deadline):
+                print(f"⏱️ עבר הזמן שהוקצב לבקשת מחיר עבור {symbol}")
+                return 'deadline', str(e)
+            self.key_pool.report(key_index, 'error')
+            print(f"❌ שגיאה בקבלת מחיר עבור {symbol}: {e}")
+            return 'error', str(e)
+        
+        print(f"📊 תגובת API עבור {symbol}: {data}")
+        
+        # בדיקת תוצאת API
+        if 'Global Quote' in data and '05. price' in data['Global Quote']:
+            self.key_pool.report(key_index, 'success')
+            return 'success', float(data['Global Quote']['05. price'])  # מחיר בדולרים
+        elif 'Error Message' in data:  # אם יש שגיאה בסמל - לא תקלה בשירות
+            self.key_pool.report(key_index, 'error')
+            print(f"❌ שגיאת API עבור {symbol}: {data['Error Message']}")
+            return 'empty', None
+        elif 'Note' in data or 'Information' in data:  # אם יש הגבלת קצב
+            self.key_pool.report(key_index, 'throttled')
+            print(f"⚠️ הגבלת API עבור {symbol} במפתח {key_index + 1}: {data.get('Note') or data.get('Information')}")
+            return 'throttled', None
+        else:  # אם אין מידע
+            self.key_pool.report(key_index, 'success')  # המפתח תקין, פשוט אין נתונים
+            print(f"❓ לא נמצא מידע על {symbol}")
+            return 'empty', None
+    
+    def _record_latency(self, seconds):
+        with self._latency_lock:
+            self._latencies.append(seconds)
+    
+    def hedge_delay(self):
+        """כמה לחכות לפני בקשה מגודרת - p95 של זמני התגובה האחרונים; None אם אין מספיק נתונים"""
+        with self._latency_lock:
+            if len(self._latencies) < QUOTE_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return max(QUOTE_HEDGE_MIN_DELAY, ordered[int(len(ordered) * 0.95) - 1])
+    
+    def _query_hedged(self, symbol, key_index, current_key, deadline):
+        """_query, ואם התשובה מתעכבת מעבר ל-p95 - בקשה שנייה במפתח אחר; הראשונה שמצליחה קובעת
+        
+        הבקשה השנייה נשלחת רק אם יש מפתח אחר עם תקציב כרגע, בלי להמתין בתור.
+        """
+        delay = self.hedge_delay() if self.hedge and len(self.api_keys) > 1 else None
+        if delay is None:
+            return self._query(symbol, key_index, current_key, deadline)
+        
+        first = self._hedge_executor.submit(self._query, symbol, key_index, current_key, deadline)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        
+        alternate = self.key_pool.acquire(timeout=0, exclude=key_index)
+        if alternate is None:  # אין מפתח פנוי - ממשיכים לחכות לבקשה הראשונה
+            return first.result()
+        self.hedged_requests += 1
+        print(f"🔀 בקשה מגודרת עבור {symbol} במפתח {alternate[0] + 1} אחרי {delay:.2f} שניות")
+        pending = {first, self._hedge_executor.submit(self._query, symbol, alternate[0], alternate[1], deadline)}
+        
+        result = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome, price = future.result()
+                if outcome in ('success', 'empty'):
+                    return outcome, price  # הבקשה השנייה ממשיכה ברקע ומדווחת למאגר בעצמה
+                result = result or (outcome, price)
+        return result
+    
+    def get_quotes(self, symbols, deadline=None):
+        """מחירים לקבוצה ב-REALTIME_BULK_QUOTES
+        
+        זמין רק במפתחות פרימיום; הודעת Information שהבקשה דורשת מפתח פרימיום
+        מכבה את הבקשות המרוכזות, כדי שלא יבזבזו עוד מכסה, ומחזירה {}.
+        תשובה בלי נתונים (רק סמלים לא מוכרים בקבוצה, שוק שקט) היא רק "אין מחירים
+        לקבוצה הזו" - מחזירה {} והבקשות המרוכזות נשארות.
+        """
+        acquired = self.key_pool.acquire(timeout=time_left(deadline, ALPHA_VANTAGE_QUEUE_TIMEOUT))
+        if acquired is None:
+            return {}
+        key_index, current_key = acquired
+        try:
+            response = httpsession.get(self.base_url, params={
+                'function': 'REALTIME_BULK_QUOTES',
+                'symbol': ','.join(symbols),
+                'apikey': current_key
+            }, timeout=time_left(deadline))
+            data = response.json()
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded) or deadline_passed(deadline):
+                raise DeadlineExceeded(f"עבר הזמן שהוקצב לבקשת מחירים מרוכזת: {e}") from e
+            self.key_pool.report(key_index, 'error')
+            raise QuoteProviderError(f"שגיאה בבקשת מחירים מרוכזת: {e}") from e
+        
+        if 'Note' in data:  # הגבלת קצב
+            self.key_pool.report(key_index, 'throttled')
+            return {}
+        if 'Information' in data:  # מפתח לא פרימיום, או מכסה יומית
+            self.key_pool.report(key_index, 'throttled')
+            message = str(data['Information']).lower()
+            if 'premium endpoint' in message:  # "This is a premium endpoint..." - לא ישתנה בתהליך הזה
+                self.batch_size = 1
+                print(f"⚠️ REALTIME_BULK_QUOTES לא זמין למפתח - עוברים לבקשה לכל סמל: {data['Information']}")
+            return {}
+        self.key_pool.report(key_index, 'success')
+        
+        prices = {}
+        for quote in data.get('data') or []:  # בלי נתונים - אין מחירים לקבוצה הזו
+            try:
+                prices[quote['symbol']] = float(quote['close'])
+            except (KeyError, TypeError, ValueError):
+                continue
+        return prices
+    
+    def request_budget(self):
+        return self.key_pool.available_requests()
+    
+    def get_stats(self):
+        stats = super().get_stats()
+        stats['keys'] = self.key_pool.get_stats()
+        stats['hedge'] = {'enabled': self.hedge, 'delay': self.hedge_delay(), 'requests': self.hedged_requests}
+        return stats
+
+
+class YFinanceProvider(QuoteProvider):
+    """Yahoo Finance דרך yfinance - הורדה אחת לקבוצת סמלים, בלי מפתחות ומכסה מוגדרת"""
+    
+    name = 'yfinance'
+    
+    def __init__(self, batch_size=YFINANCE_BATCH_SIZE):
+        if not YFINANCE_AVAILABLE:
+            raise QuoteProviderError("yfinance לא מותקן")
+        self.batch_size = batch_size
+    
+    def get_quote(self, symbol, deadline=None):
+        return self.get_quotes([symbol], deadline).get(symbol)
+    
+    def get_quotes(self, symbols, deadline=None):
+        """מחירי סגירה אחרונים לקבוצת סמלים בהורדה אחת"""
+        symbols = list(symbols)
+        data = yf.download(' '.join(symbols), period='5d', progress=False, threads=False, auto_adjust=False,
+                           timeout=time_left(deadline))
+        if data is None or data.empty:
+            return {}
+        closes = data['Close']
+        if getattr(closes, 'ndim', 1) == 1:  # סמל אחד - Series ולא טבלה
+            closes = closes.to_frame(symbols[0])
+        prices = {}
+        for symbol in symbols:
+            if symbol in closes:
+                series = closes[symbol].dropna()
+                if not series.empty:
+                    prices[symbol] = float(series.iloc[-1])
+        return prices
+
+
+class ReplayProvider(QuoteProvider):
+    """מחירים מוקלטים מקובץ JSON - לבדיקות עומס בלי רשת
+    
+    פורמט הקובץ: {"AAPL": [190.1, 190.4, ...], ...} בדולרים. כל בקשה לסמל מחזירה
+    את המחיר הבא ברשימה שלו (ובסוף חוזרת להתחלה). latency_ms היא השהיה לכל
+    בקשה (גם מרוכזת), error_rate הוא חלק הבקשות שנכשלות עם QuoteProviderError.
+    עם אותו seed - אותו רצף מחירים ושגיאות בכל ריצה.
+    """
+    
+    name = 'replay'
+    
+    def __init__(self, path=QUOTE_REPLAY_FILE, latency_ms=QUOTE_REPLAY_LATENCY_MS,
+                 error_rate=QUOTE_REPLAY_ERROR_RATE, batch_size=100, seed=0, quotes=None):
+        if quotes is None:
+            with open(path, encoding='utf-8') as replay_file:
+                quotes = json.load(replay_file)
+        self.quotes = {symbol: list(prices) for symbol, prices in quotes.items() if prices}
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.batch_size = batch_size
+        self._positions = {}  # סמל -> המיקום הבא ברשימה
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0  # בקשות שהתקבלו
+        self.errors = 0  # שגיאות שהוזרקו
+    
+    @staticmethod
+    def save(path, quotes):
+        """שמירת מחירים מוקלטים לקובץ - {symbol: [מחירים]}"""
+        with open(path, 'w', encoding='utf-8') as replay_file:
+            json.dump(quotes, replay_file)
+    
+    def _request(self, deadline=None):
+        """השהיה ושגיאה מוזרקת לכל בקשה - השהיה ארוכה מה-deadline נקטעת בשגיאה"""
+        timeout = time_left(deadline)
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+            if self.latency > timeout:
+                if deadline_passed(deadline):
+                    raise DeadlineExceeded("עבר הזמן שהוקצב לבקשה בספק ההקלטות")
+                raise QuoteProviderError("חריגה מהזמן בספק ההקלטות")
+        if failed:
+            raise QuoteProviderError("שגיאה מוזרקת בספק ההקלטות")
+    
+    def _next_price(self, symbol):
+        prices = self.quotes.get(symbol)
+        if not prices:
+            return None
+        with self._lock:
+            position = self._positions.get(symbol, 0)
+            self._positions[symbol] = (position + 1) % len(prices)
+        return float(prices[position])
+    
+    def get_quote(self, symbol, deadline=None):
+        self._request(deadline)
+        return self._next_price(symbol)
+    
+    def get_quotes(self, symbols, deadline=None):
+        self._request(deadline)  # בקשה אחת לכל הקבוצה
+        prices = {}
+        for symbol in symbols:
+            price = self._next_price(symbol)
+            if price is not None:
+                prices[symbol] = price
+        return prices
+    
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({'symbols': len(self.quotes), 'requests': self.requests, 'errors': self.errors,
+                      'latency_ms': self.latency * 1000, 'error_rate': self.error_rate})
+        return stats
+
+
+def create_provider(name, api_keys=()):
+    """יצירת ספק לפי שם - alphavantage / yfinance / replay"""
+    if name == 'alphavantage':
+        return AlphaVantageProvider(api_keys)
+    if name == 'yfinance':
+        return YFinanceProvider()
+    if name == 'replay':
+        return ReplayProvider()
+    raise ValueError(f"ספק מחירים לא מוכר: {name}")